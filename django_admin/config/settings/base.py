@@ -23,6 +23,10 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 DEBUG = os.getenv('DEBUG', False) == 'True'
 
+# Канал LISTEN/NOTIFY, в который триггеры content будят ETL (тот же, что NOTIFY_CHANNEL в .env_etl).
+# Триггеры создаются миграциями: после смены канала их нужно пересоздать (откатить и применить миграции).
+ETL_NOTIFY_CHANNEL = os.getenv('NOTIFY_CHANNEL', 'etl_changes')
+
 # ALLOWED_HOSTS = [os.getenv('DB_HOST', '127.0.0.1')]
 ALLOWED_HOSTS = ['*']
 
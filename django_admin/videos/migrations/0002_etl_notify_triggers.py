@@ -0,0 +1,49 @@
+# flake8: noqa
+# Триггеры, которые будят ETL (LISTEN/NOTIFY) при изменении данных.
+
+from django.conf import settings
+from django.db import migrations
+
+from django.db.migrations import RunSQL
+
+# Канал — из настроек (ETL_NOTIFY_CHANNEL), он должен совпадать с notify_channel ETL.
+CREATE_NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify({0}, TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def create_notify_function(channel: str) -> str:
+    return CREATE_NOTIFY_FUNCTION.format("'{0}'".format(channel.replace("'", "''")))
+
+DROP_NOTIFY_FUNCTION = 'DROP FUNCTION IF EXISTS content.notify_etl_changes();'
+
+TABLES = ('video', 'audio_track', 'video_track')
+
+
+def create_trigger(table: str) -> str:
+    return f"""
+        CREATE TRIGGER {table}_notify_etl
+            AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+            FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+    """
+
+
+def drop_trigger(table: str) -> str:
+    return f'DROP TRIGGER IF EXISTS {table}_notify_etl ON content.{table};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0001_initial'),
+    ]
+
+    operations = [
+        RunSQL(create_notify_function(settings.ETL_NOTIFY_CHANNEL), DROP_NOTIFY_FUNCTION),
+        *[RunSQL(create_trigger(table), drop_trigger(table)) for table in TABLES],
+    ]
@@ -0,0 +1,41 @@
+# flake8: noqa
+# Триггер для content.langs: индекс ES видео выбирается по коду его языка, поэтому ETL будят и изменения языков.
+# Функция уведомления пересоздаётся с каналом из настроек: 0002 могла быть применена с прежним каналом.
+
+from django.conf import settings
+from django.db import migrations
+
+from django.db.migrations import RunSQL
+
+CREATE_NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify({0}, TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+CREATE_LANGS_TRIGGER = """
+    CREATE TRIGGER langs_notify_etl
+        AFTER INSERT OR UPDATE OR DELETE ON content.langs
+        FOR EACH STATEMENT EXECUTE FUNCTION content.notify_etl_changes();
+"""
+
+DROP_LANGS_TRIGGER = 'DROP TRIGGER IF EXISTS langs_notify_etl ON content.langs;'
+
+
+def create_notify_function(channel: str) -> str:
+    return CREATE_NOTIFY_FUNCTION.format("'{0}'".format(channel.replace("'", "''")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0002_etl_notify_triggers'),
+    ]
+
+    operations = [
+        RunSQL(create_notify_function(settings.ETL_NOTIFY_CHANNEL), RunSQL.noop),
+        RunSQL(CREATE_LANGS_TRIGGER, DROP_LANGS_TRIGGER),
+    ]
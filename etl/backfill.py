@@ -0,0 +1,238 @@
+"""
+Модуль содержит загрузку всего каталога по разделам (backfill) в нескольких процессах.
+
+Ключи content.video (UUID) делятся на backfill_partitions равных диапазонов, а разделы загружают
+backfill_workers процессов: у каждого свой ETL и одно соединение с Postgres. У каждого раздела своя точка
+продолжения в базе состояния SQLite (тройка индекс, таблица, раздел), поэтому после падения
+загрузка продолжается с того же места, а уже загруженные разделы не повторяются.
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context
+from typing import List, NamedTuple
+from uuid import UUID
+
+from database_query import SELECT_NOW
+from documents import IndexRouter
+from etl_class import ETL
+from log import create_logger
+from models import config
+from state_storage import SqliteStorage, State, create_storage
+
+UUID_BITS = 128  # Postgres сравнивает uuid побайтно, т.е. как 128-битные числа.
+KEYSPACE = 2 ** UUID_BITS
+BACKFILL_PARTITION = 'backfill'  # Раздел состояния самой загрузки (время начала и признак завершения).
+
+
+class Partition(NamedTuple):
+
+    """Раздел ключей: id в диапазоне (after, last], name — номер раздела и количество разделов (например, 3/16)."""
+
+    name: str
+    after: str
+    last: str
+
+
+def split_keyspace(count: int) -> List[Partition]:
+
+    """
+    Функция делит ключи UUID на count равных диапазонов.
+    id видео — uuid4, т.е. распределены равномерно, поэтому и строк в разделах примерно поровну
+    (диапазоны created_at так не делятся: каталог растёт неравномерно).
+
+    Args:
+        count: количество разделов
+
+    Returns:
+        Вернёт разделы по возрастанию ключей.
+    """
+
+    keys = [KEYSPACE * number // count for number in range(count + 1)]
+    bounds = [str(UUID(int=max(key - 1, 0))) for key in keys]
+    return [
+        Partition(f'{number}/{count}', after, last)
+        for number, (after, last) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+
+def partition_state(name: str) -> State:
+
+    """
+    Функция возвращает состояние раздела загрузки.
+
+    Args:
+        name: название раздела
+
+    Returns:
+        Вернёт состояние (база state_database, тройка индекс, таблица, раздел).
+    """
+
+    return State(SqliteStorage(config.state_database, config.index_name, config.state_source, name))
+
+
+def backfill_partition(partition: Partition) -> int:
+
+    """
+    Функция загружает раздел (выполняется в процессе пула).
+    После каждой пачки, которую подтвердил ES, сохраняется id её последней строки.
+
+    Хэши содержимого — только в памяти процесса: загрузка отправляет документы целиком,
+    поэтому и пустой (восстанавливаемый) индекс заполнится полностью.
+
+    Args:
+        partition: раздел
+
+    Returns:
+        Вернёт количество загруженных документов.
+
+    Raises:
+        RuntimeError: ES отказался загрузить документы
+    """
+
+    state = partition_state(partition.name)
+    if state.get_state('done'):
+        return 0
+
+    host = config.elastic_search_parameters.elastic_host
+    port = config.elastic_search_parameters.elastic_port
+    load_parameters = config.load_parameters.copy(update={'hashes_database': ':memory:'})
+    postgres_parameters = config.postgres_parameters.dict()
+    etl = ETL(postgres_parameters, f'http://{host}:{port}', pool_size=1, load_parameters=load_parameters)
+    router = IndexRouter(config.index_name, tuple(config.languages), config.default_language)
+
+    after, loaded = state.get_state('id') or partition.after, 0
+    while True:
+        row_data = etl.extract_partition(after, partition.last, config.backfill_pack_size)
+        if not row_data:
+            break
+
+        documents, _ = etl.transform(row_data, router)
+        if etl.load(documents):
+            raise RuntimeError(f'Documents of partition {partition.name} have not been loaded.')
+        after = str(row_data[-1][0])
+        state.set_state('id', after)
+        loaded += len(documents)
+
+    state.set_states({'done': True})
+    logger.info('Partition %s has been loaded: %s documents.', partition.name, loaded)
+    return loaded
+
+
+def run_partitions(partitions: List[Partition]) -> List[str]:
+
+    """
+    Функция загружает разделы в пуле из backfill_workers процессов.
+
+    Args:
+        partitions: разделы
+
+    Returns:
+        Вернёт названия разделов, которые загрузить не удалось.
+    """
+
+    failed, loaded = [], 0
+    with ProcessPoolExecutor(config.backfill_workers, mp_context=get_context('spawn')) as executor:
+        futures = {executor.submit(backfill_partition, partition): partition for partition in partitions}
+        for future in as_completed(futures):
+            try:
+                loaded += future.result()
+            except Exception as error:
+                logger.error('Partition %s has failed: %s', futures[future].name, error)
+                failed.append(futures[future].name)
+
+    logger.info('Backfill has loaded %s documents, failed partitions: %s', loaded, len(failed))
+    return failed
+
+
+def prepare(partitions: List[Partition], backfill: State, restart: bool) -> None:
+
+    """
+    Функция запоминает время начала загрузки (время сервера Postgres) и сбрасывает точки разделов.
+    Так бывает при первом запуске или с --restart, иначе загрузка продолжается с сохранённых точек.
+
+    Args:
+        partitions: разделы
+        backfill: состояние самой загрузки
+        restart: начать загрузку заново
+    """
+
+    if not restart and backfill.get_state('started'):
+        return
+
+    etl = ETL(config.postgres_parameters.dict(), '', pool_size=1)
+    with etl.postgres_pool.connection() as con_postgres:
+        with con_postgres, con_postgres.cursor() as cur_postgres:
+            cur_postgres.execute(SELECT_NOW)
+            started = cur_postgres.fetchone()[0]
+    etl.postgres_pool.close()
+
+    backfill.set_states({'started': str(started), 'done': False})
+    for partition in partitions:
+        partition_state(partition.name).set_states({'id': partition.after, 'done': False})
+
+
+def hand_over(started: str) -> None:
+
+    """
+    Функция передаёт основному ETL точку продолжения: время начала загрузки.
+    Точка сдвигается только вперёд: если основной ETL уже ушёл дальше (например, работал во время загрузки),
+    его точка остаётся. Запись — с проверкой (compare-and-set): точку, сдвинутую после чтения, она не затрёт.
+
+    Args:
+        started: время начала загрузки (время сервера Postgres)
+    """
+
+    state = State(create_storage(config), compare_and_set=True)
+    checkpoint = state.get_state('time')
+    try:
+        newer = checkpoint is not None and datetime.fromisoformat(checkpoint) >= datetime.fromisoformat(started)
+    except ValueError:  # Время не разобрать (например, smallest_time до Python 3.11) — точка не новее.
+        newer = False
+
+    if newer:
+        logger.info('The ETL checkpoint %s is newer than the backfill start, it has been kept.', checkpoint)
+        return
+    try:
+        state.set_states({'time': started, 'id': config.smallest_id, 'sweep_time': started})
+    except RuntimeError:
+        logger.info('The ETL checkpoint has been moved during the hand-over, it has been kept.')
+        return
+    state.flush()
+    logger.info('The ETL process will continue from %s.', started)
+
+
+def main() -> None:
+
+    """
+    Функция загружает каталог по разделам.
+
+    Время начала загрузки запоминается до первого раздела. Когда загружены все разделы,
+    основной ETL продолжает с этого времени (если его точка не новее, см. hand_over):
+    всё, что изменилось во время загрузки, он догонит сам.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restart', action='store_true', help='начать загрузку заново (сбросить точки разделов)')
+    arguments = parser.parse_args()
+
+    partitions = split_keyspace(config.backfill_partitions)
+    backfill = partition_state(BACKFILL_PARTITION)
+
+    if backfill.get_state('done') and not arguments.restart:
+        logger.info('Backfill has already been done, use --restart to load the catalog again.')
+        return
+    prepare(partitions, backfill, arguments.restart)
+    if run_partitions(partitions):
+        sys.exit(1)
+
+    hand_over(backfill.get_state('started'))
+    backfill.set_states({'done': True})
+    logger.info('Backfill has been done.')
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,312 @@
-"""Модуль содержит функцию backoff."""
+"""
+Модуль содержит функцию backoff и общий для процесса автомат отключения (circuit breaker).
+
+Повторы идут с полным джиттером (full jitter): пауза — случайное время от нуля до экспоненциальной границы,
+поэтому реплики ETL, потерявшие ES или Postgres одновременно, не повторяют запросы в ногу.
+Повторяются только ошибки из retry_on (ошибки зависимости), остальные (например, ошибка в transform)
+пробрасываются сразу. Если у функции есть автомат, то после failure_threshold ошибок подряд зависимость
+считается недоступной: вызовы до reset_timeout не выполняются, а затем её проверяет одна пробная попытка.
+"""
+import asyncio
 import sys
+from contextlib import contextmanager
 from functools import wraps
-from time import sleep
-from typing import Union, Callable, Any
+from inspect import iscoroutinefunction
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Tuple, Type
 
 from log import create_logger
 
 
-def backoff(
-        start_sleep_time: Union[int, float] = 0.1,
-        factor: Union[int, float] = 2,
-        border_sleep_time: Union[int, float] = 10
+class CircuitOpenError(Exception):
+
+    """Ошибка: автомат разомкнут, зависимость недоступна — вызов не выполнялся."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            name: название автомата (зависимости)
+            retry_after: через сколько секунд автомат пропустит пробную попытку
+        """
+
+        super().__init__(f'Circuit {name} is open, retry after {retry_after:.1f} seconds.')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    """
+    Класс автомата отключения одной зависимости (общий для всех функций процесса, которые к ней обращаются).
+
+    Замкнут — вызовы выполняются. После failure_threshold ошибок подряд размыкается: вызовы сразу
+    получают CircuitOpenError. Через reset_timeout пропускает одну пробную попытку (полуоткрыт):
+    удачная замыкает его, неудачная снова размыкает.
+    """
+
+    _shared: Dict[str, 'CircuitBreaker'] = {}
+    _shared_lock = Lock()
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            name: название зависимости
+            failure_threshold: после скольких ошибок подряд разомкнуться
+            reset_timeout: через сколько секунд пропустить пробную попытку
+        """
+
+        self.name = name
+        self.failure_threshold, self.reset_timeout = failure_threshold, reset_timeout
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @classmethod
+    def shared(cls, name: str) -> 'CircuitBreaker':
+
+        """
+        Метод возвращает общий для процесса автомат зависимости (создаёт его при первом обращении).
+
+        Args:
+            name: название зависимости (например, 'postgres' или 'elastic')
+
+        Returns:
+            Вернёт автомат.
+        """
+
+        with cls._shared_lock:
+            return cls._shared.setdefault(name, cls(name))
+
+    @contextmanager
+    def attempt(self, retry_on: Tuple[Type[Exception], ...]) -> Iterator[None]:
+
+        """
+        Контекстный менеджер одной попытки: пропускает её через автомат и учитывает результат.
+        Ошибки из retry_on — ошибки зависимости, удача замыкает автомат. Любая другая ошибка
+        (например, ошибка в данных или отмена корутины) ничего не говорит о зависимости:
+        она только освобождает пробную попытку, чтобы автомат не остался полуоткрытым навсегда.
+
+        Args:
+            retry_on: какие ошибки считать ошибками зависимости
+
+        Yields:
+            Ничего: в блоке with выполняется вызов зависимости.
+
+        Raises:
+            retry_on: ошибка зависимости (уже учтённая в автомате)
+        """
+
+        probe = self.admit()
+        try:
+            yield
+        except retry_on:
+            self.failed()
+            raise
+        else:
+            self.succeeded()
+        finally:
+            if probe:
+                self.released()
+
+    def admit(self) -> bool:
+
+        """
+        Метод пропускает вызов или отклоняет его, пока автомат разомкнут.
+
+        Returns:
+            Вернёт True, если вызов — пробная попытка полуоткрытого автомата.
+
+        Raises:
+            CircuitOpenError: автомат разомкнут (или пробная попытка уже выполняется)
+        """
+
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            retry_after = self._opened_at + self.reset_timeout - monotonic()
+            if retry_after <= 0 and not self._probing:
+                self._probing = True
+                return True
+        raise CircuitOpenError(self.name, max(retry_after, 0))
+
+    def released(self) -> None:
+
+        """Метод освобождает пробную попытку, которая не проверила зависимость: следующий вызов снова станет пробой."""
+
+        with self._lock:
+            self._probing = False
+
+    def succeeded(self) -> None:
+
+        """Метод учитывает удачный вызов: автомат замыкается."""
+
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures, self._opened_at, self._probing = 0, None, False
+        if was_open:
+            logger.info('Circuit %s has been closed.', self.name)
+
+    def failed(self) -> None:
+
+        """Метод учитывает ошибку зависимости: после failure_threshold ошибок подряд (или неудачной пробы) размыкает."""
+
+        with self._lock:
+            self._failures += 1
+            if not self._probing and self._failures < self.failure_threshold:
+                return
+            self._opened_at, self._probing = monotonic(), False
+        logger.error('Circuit %s has been opened for %s seconds.', self.name, self.reset_timeout)
+
+
+class RetryPolicy(NamedTuple):
+
+    """Политика повторов: экспоненциальная граница паузы, повторяемые ошибки, бюджет и автомат."""
+
+    start_sleep_time: float = 0.1
+    factor: float = 2
+    border_sleep_time: float = 10
+    retry_on: Tuple[Type[Exception], ...] = (Exception,)
+    max_attempts: Optional[int] = None
+    max_time: Optional[float] = None
+    breaker: Optional[CircuitBreaker] = None
+
+    def jitter(self, attempt: int) -> float:
+
+        """
+        Метод возвращает паузу перед следующей попыткой (full jitter).
+
+        Args:
+            attempt: номер неудачной попытки (с единицы)
+
+        Returns:
+            Вернёт случайное время от нуля до min(start_sleep_time * factor ** (attempt - 1), border_sleep_time).
+        """
+
+        ceiling = min(self.start_sleep_time * self.factor ** (attempt - 1), self.border_sleep_time)
+        return uniform(0, ceiling)  # noqa: S311
+
+    def call(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+
+        """
+        Метод выполняет одну попытку (через автомат, если он есть).
+
+        Args:
+            func: функция
+            args: неименованные аргументы func
+            kwargs: именованные аргументы func
+
+        Returns:
+            Вернёт результат func.
+        """
+
+        if self.breaker is None:
+            return func(*args, **kwargs)
+        with self.breaker.attempt(self.retry_on):
+            return func(*args, **kwargs)
+
+    async def call_async(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+
+        """
+        Метод выполняет одну попытку async def функции (как call).
+
+        Args:
+            func: async def функция
+            args: неименованные аргументы func
+            kwargs: именованные аргументы func
+
+        Returns:
+            Вернёт результат func.
+        """
+
+        if self.breaker is None:
+            return await func(*args, **kwargs)
+        with self.breaker.attempt(self.retry_on):
+            return await func(*args, **kwargs)
+
+    def retry_delay(self, func: Callable, error: Exception, attempt: int, started: float) -> float:
+
+        """
+        Метод решает, повторять ли вызов после ошибки.
+        Отклонённая автоматом попытка тоже считается: бюджет ограничивает и ожидание зависимости.
+
+        Args:
+            func: функция
+            error: ошибка попытки
+            attempt: номер неудачной попытки (с единицы)
+            started: когда (monotonic) была первая попытка
+
+        Returns:
+            Вернёт паузу перед повтором.
+
+        Raises:
+            error: ошибка не из retry_on или бюджет попыток (времени) исчерпан
+        """
+
+        delay = None
+        if isinstance(error, CircuitOpenError):
+            delay = max(error.retry_after, self.jitter(attempt))
+        elif isinstance(error, self.retry_on):
+            delay = self.jitter(attempt)
+
+        out_of_attempts = self.max_attempts is not None and attempt >= self.max_attempts
+        out_of_time = delay is not None and self.max_time is not None and (
+            monotonic() - started + delay > self.max_time
+        )
+        if delay is None or out_of_attempts or out_of_time:
+            logger.error('%s has failed on attempt %s, giving up: %s', func.__name__, attempt, error)
+            raise error
+
+        name = func.__name__
+        logger.error('%s has failed on attempt %s: %s\nWill repeat in %.2f seconds.', name, attempt, error, delay)
+        return delay
+
+
+def backoff(  # noqa: WPS211
+        start_sleep_time: float = 0.1,
+        factor: float = 2,
+        border_sleep_time: float = 10,
+        retry_on: Tuple[Type[Exception], ...] = (Exception,),
+        max_attempts: Optional[int] = None,
+        max_time: Optional[float] = None,
+        breaker: Optional[str] = None
 ) -> Callable:
 
     """
     Функция для повторного выполнения функции через некоторое время, если возникла ошибка.
-    Использует наивный экспоненциальный рост времени повтора (factor)
-    до граничного времени ожидания (border_sleep_time).
+    Пауза — случайное время до экспоненциальной границы (factor), не больше border_sleep_time.
+    Работает и с обычными функциями, и с async def (пауза — asyncio.sleep).
 
     Args:
-        start_sleep_time: начальное время повтора
-        factor: во сколько раз нужно увеличить время ожидания
-        border_sleep_time: граничное время ожидания (максимальное значение)
+        start_sleep_time: граница паузы после первой ошибки
+        factor: во сколько раз граница растёт с каждой ошибкой
+        border_sleep_time: максимальная граница паузы
+        retry_on: какие ошибки повторять (остальные пробрасываются сразу)
+        max_attempts: сколько всего попыток (None — без ограничения)
+        max_time: сколько секунд повторять с первой попытки (None — без ограничения)
+        breaker: название общего автомата зависимости (None — без автомата)
 
     Returns:
-        Пробует выполнить функцию func и, если что-то пошло не так, «засыпает» на какое-то время.
+        Вернёт декоратор. Когда бюджет исчерпан, пробрасывается последняя ошибка.
     """
 
+    policy = RetryPolicy(
+        start_sleep_time,
+        factor,
+        border_sleep_time,
+        retry_on,
+        max_attempts,
+        max_time,
+        CircuitBreaker.shared(breaker) if breaker else None,
+    )
+
     def func_wrapper(func: Callable) -> Callable:
 
         """
@@ -40,41 +320,90 @@ def backoff(
             Возвращает функцию, которая и выполняет алгоритм.
         """
 
-        @wraps(func)
-        def inner(*args: tuple, **kwargs: dict) -> Any:
+        if iscoroutinefunction(func):
+            return async_retrying(func, policy)
+        return retrying(func, policy)
 
-            """
-            Возвращаемая декоратором функция.
-            При неудачном подключении к базе данных повторяет попытку через start_sleep_time.
+    return func_wrapper
 
-            Args:
-                *args: вся неименованная хрень, нужная для func
-                **kwargs: вся именованная хрень, нужная для func
 
-            Returns:
-                Выполняет func пока она работает,
-                если «что-то пошло не так» — повторяет попытку вызвать func через интервал start_sleep_time.
-                Соответственно,
-                чтобы меньше долбать базу без толку интервал увеличивается с каждым разом,
-                пока не достигнет предела (border_sleep_time).
-            """
+def retrying(func: Callable, policy: RetryPolicy) -> Callable:
 
-            nonlocal start_sleep_time  # Переменная точно не глобальная, но и не локальная вроде :)
+    """
+    Функция оборачивает обычную функцию повторами по политике.
 
-            while True:
-                try:
-                    logger.info('Try start function %s', func.__name__)
-                    return func(*args, **kwargs)
-                except Exception as error:
+    Args:
+        func: функция
+        policy: политика повторов
 
-                    logger.error('%s\nWill repeat in %s seconds.\n', error, start_sleep_time)
+    Returns:
+        Вернёт обёртку.
+    """
 
-                    sleep(start_sleep_time)
-                    start_sleep_time = min(start_sleep_time * factor, border_sleep_time)  # noqa: WPS442
+    @wraps(func)
+    def inner(*args: Any, **kwargs: Any) -> Any:
 
-        return inner
+        """
+        Возвращаемая декоратором функция.
+        Счётчик попыток и время начала свои у каждого вызова.
 
-    return func_wrapper
+        Args:
+            *args: неименованные аргументы func
+            **kwargs: именованные аргументы func
+
+        Returns:
+            Вернёт результат func (первой удачной попытки).
+        """
+
+        started, attempt = monotonic(), 0
+        while True:
+            attempt += 1
+            try:
+                return policy.call(func, *args, **kwargs)
+            except Exception as error:
+                delay = policy.retry_delay(func, error, attempt, started)
+            sleep(delay)
+
+    return inner
+
+
+def async_retrying(func: Callable, policy: RetryPolicy) -> Callable:
+
+    """
+    Функция оборачивает async def функцию повторами по той же политике (паузы не блокируют цикл событий).
+
+    Args:
+        func: async def функция
+        policy: политика повторов
+
+    Returns:
+        Вернёт async def обёртку.
+    """
+
+    @wraps(func)
+    async def inner(*args: Any, **kwargs: Any) -> Any:
+
+        """
+        Возвращаемая декоратором корутина.
+
+        Args:
+            *args: неименованные аргументы func
+            **kwargs: именованные аргументы func
+
+        Returns:
+            Вернёт результат func (первой удачной попытки).
+        """
+
+        started, attempt = monotonic(), 0
+        while True:
+            attempt += 1
+            try:
+                return await policy.call_async(func, *args, **kwargs)
+            except Exception as error:
+                delay = policy.retry_delay(func, error, attempt, started)
+            await asyncio.sleep(delay)
+
+    return inner
 
 
 logger = create_logger(__file__, stream_out=sys.stderr)
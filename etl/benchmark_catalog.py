@@ -0,0 +1,202 @@
+"""
+Модуль содержит генератор синтетического каталога для бенчмарков ETL.
+
+Генератор заполняет схему content (langs, audio_track, video_track, video — как в django_admin/videos/models.py)
+заданным количеством видео и умеет имитировать поток изменений (churn): правку описаний видео
+и замену треков. Запускать только на отдельной (бенчмарк) базе: --clean очищает таблицы content.
+Базу надо назвать явно (--dbname): база из конфигурации ETL не используется. Если в её названии
+нет «bench», скрипт откажется её менять без --yes-truncate.
+"""
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+from random import Random
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
+
+from etl_class import ETL
+from log import create_logger
+from models import config
+
+# Языки каталога: полное название, ISO 639-1 и ISO 639-2.
+LANGUAGES = (('Русский', 'ru', 'rus'), ('English', 'en', 'eng'))
+TITLE = 'Видео №{0}'
+H1 = 'Видео №{0}: {1}'
+DESCRIPTION = 'Подробный рассказ о том, как выбрать свёклу, сварить бульон и подать борщ к столу. '
+STARTED = datetime.fromisoformat('2022-01-01T00:00:00+00:00')
+MAX_REPEATS = 8  # Описание — от одного до MAX_REPEATS повторов DESCRIPTION.
+PAGE_SIZE = 1000  # Сколько строк вставлять одним INSERT.
+
+INSERT_LANGS = 'INSERT INTO content.langs (id, created_at, full_title, iso_639_1, iso_639_2) VALUES %s'
+INSERT_TRACKS = 'INSERT INTO content.{0}_track (id, created_at, updated_at, title, {0}_file) VALUES %s'
+INSERT_VIDEOS = """
+    INSERT INTO content.video (
+        id, created_at, updated_at, title, h1, description, lang, audio_track_id, video_track_id
+    ) VALUES %s
+"""
+# Поток изменений: share видео получает новое описание, share видео — новый видео трек (файл).
+CHURN_VIDEOS = """
+    UPDATE content.video SET description = description || '(обновлено) ', updated_at = now()
+    WHERE id IN (SELECT id FROM content.video ORDER BY random() LIMIT %(limit)s)
+"""
+CHURN_TRACKS = """
+    UPDATE content.video_track SET video_file = 'video/' || md5(random()::text) || '.mp4', updated_at = now()
+    WHERE id IN (SELECT video_track_id FROM content.video ORDER BY random() LIMIT %(limit)s)
+"""
+CLEAN = 'TRUNCATE content.video, content.audio_track, content.video_track, content.langs'
+COUNT_VIDEOS = 'SELECT count(*) FROM content.video'
+BENCHMARK_DBNAME = re.compile('bench', re.IGNORECASE)  # Так называются бенчмарк базы.
+
+
+def make_catalog(videos: int, seed: int = 0) -> Dict[str, List[Tuple[object, ...]]]:
+
+    """
+    Функция создаёт строки каталога: языки, по одному аудио и видео треку на видео и сами видео.
+    Описания разной длины, даты изменения идут по возрастанию.
+
+    Args:
+        videos: количество видео
+        seed: зерно генератора длин описаний (с одним зерном каталог одинаковый, кроме id)
+
+    Returns:
+        Вернёт строки по таблицам (langs, audio, video, videos).
+    """
+
+    random = Random(seed)
+    langs = [(new_id(), STARTED, *language) for language in LANGUAGES]
+    catalog: Dict[str, List[Tuple[object, ...]]] = {'langs': langs, 'audio': [], 'video': [], 'videos': []}
+    for number in range(videos):
+        changed = STARTED + timedelta(seconds=number)
+        title = TITLE.format(number)
+        audio = (new_id(), changed, changed, title, f'audio/{number}.aac')
+        video = (new_id(), changed, changed, title, f'video/{number}.mp4')
+        lang = langs[number % len(langs)]
+        description = DESCRIPTION * random.randint(1, MAX_REPEATS)  # noqa: S311
+        catalog['audio'].append(audio)
+        catalog['video'].append(video)
+        texts = (title, H1.format(number, lang[3]), description)
+        references = (lang[0], audio[0], video[0])
+        catalog['videos'].append((new_id(), changed, changed, *texts, *references))
+    return catalog
+
+
+def new_id() -> str:
+
+    """
+    Функция создаёт id строки (UUID строкой: так его без адаптера принимает psycopg2).
+
+    Returns:
+        Вернёт новый UUID.
+    """
+
+    return str(uuid4())
+
+
+def seed_catalog(con: connection, videos: int) -> None:
+
+    """
+    Функция заполняет схему content синтетическим каталогом.
+
+    Args:
+        con: соединение с Postgres
+        videos: количество видео
+    """
+
+    catalog = make_catalog(videos)
+    with con, con.cursor() as cur:
+        execute_values(cur, INSERT_LANGS, catalog['langs'])
+        execute_values(cur, INSERT_TRACKS.format('audio'), catalog['audio'], page_size=PAGE_SIZE)
+        execute_values(cur, INSERT_TRACKS.format('video'), catalog['video'], page_size=PAGE_SIZE)
+        execute_values(cur, INSERT_VIDEOS, catalog['videos'], page_size=PAGE_SIZE)
+    logger.info('Catalog has been seeded: %s videos.', videos)
+
+
+def churn(con: connection, share: float) -> int:
+
+    """
+    Функция имитирует поток изменений: у share видео меняется описание, у share видео — видео трек.
+    Строки выбираются случайно, поэтому часть видео получает оба изменения.
+
+    Args:
+        con: соединение с Postgres
+        share: доля видео (от 0 до 1)
+
+    Returns:
+        Вернёт количество видео, которое меняется (в каждой из двух правок).
+    """
+
+    with con, con.cursor() as cur:
+        cur.execute(COUNT_VIDEOS)
+        limit = round(cur.fetchone()[0] * share)
+        cur.execute(CHURN_VIDEOS, {'limit': limit})
+        cur.execute(CHURN_TRACKS, {'limit': limit})
+    logger.info('Catalog has been changed: %s descriptions and %s video tracks.', limit, limit)
+    return limit
+
+
+def clean(con: connection) -> None:
+
+    """
+    Функция очищает таблицы схемы content.
+
+    Args:
+        con: соединение с Postgres
+    """
+
+    with con, con.cursor() as cur:
+        cur.execute(CLEAN)
+    logger.info('Catalog has been cleaned.')
+
+
+def benchmark_database(parser: argparse.ArgumentParser) -> Tuple[argparse.Namespace, dict]:
+
+    """
+    Функция добавляет аргументы бенчмарк базы, разбирает командную строку и проверяет, что базу можно менять.
+    Хост, порт и пользователь берутся из config.postgres_parameters, а название базы — только из --dbname.
+
+    Args:
+        parser: парсер аргументов скрипта (с --videos и --churn)
+
+    Returns:
+        Вернёт аргументы и параметры подключения к бенчмарк базе.
+    """
+
+    parser.add_argument('--dbname', required=True, help='бенчмарк база (её таблицы content очищаются)')
+    parser.add_argument('--yes-truncate', action='store_true', help='менять базу, даже если в названии нет «bench»')
+    arguments = parser.parse_args()
+
+    writes = arguments.videos or arguments.churn or getattr(arguments, 'clean', False)
+    if writes and not arguments.yes_truncate and not BENCHMARK_DBNAME.search(arguments.dbname):
+        parser.error(f'{arguments.dbname} does not look like a benchmark database, pass --yes-truncate to use it.')
+    return arguments, config.postgres_parameters.copy(update={'dbname': arguments.dbname}).dict()
+
+
+def main() -> None:
+
+    """Функция заполняет бенчмарк базу (--dbname) каталогом или меняет уже заполненный."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--videos', type=int, default=0, help='сколько видео добавить')
+    parser.add_argument('--churn', type=float, default=0, help='какую долю видео изменить (от 0 до 1)')
+    parser.add_argument('--clean', action='store_true', help='сначала очистить таблицы content бенчмарк базы')
+    arguments, postgres_parameters = benchmark_database(parser)
+
+    etl = ETL(postgres_parameters, '', pool_size=1)
+    with etl.postgres_pool.connection() as con_postgres:
+        if arguments.clean:
+            clean(con_postgres)
+        if arguments.videos:
+            seed_catalog(con_postgres, arguments.videos)
+        if arguments.churn:
+            churn(con_postgres, arguments.churn)
+    etl.postgres_pool.close()
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Модуль содержит бенчмарк ETL: extract, transform и load на синтетическом каталоге.
+
+Каталог создаёт benchmark_catalog.py в отдельной бенчмарк базе (--dbname, её проверяет benchmark_database),
+вместо ElasticSearch работает локальный сервер с API _bulk (bulk_stand_in.py).
+Первый проход загружает весь каталог, второй — поток изменений (--churn).
+Результат — json со строками в секунду, процентилями времени стадий и пиковой памятью процесса:
+файлы разных коммитов можно сравнивать между собой.
+"""
+import argparse
+import json
+import resource
+import sys
+from time import perf_counter, strftime
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmark_catalog import benchmark_database, churn, clean, seed_catalog
+from bulk_stand_in import BulkStandIn
+from documents import IndexRouter
+from etl_class import ETL, pack_checkpoint
+from log import create_logger
+from models import config
+
+STAGES = ('extract', 'transform', 'load')
+PERCENTILES = (50, 90, 99)
+KIBIBYTE = 1024  # ru_maxrss в Linux — в килобайтах.
+MILLISECONDS = 1000
+
+Checkpoint = Tuple[str, str]
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+
+    """
+    Функция считает процентили (по ближайшему рангу), максимум и сумму времени стадии.
+
+    Args:
+        timings: время стадии на каждую пачку в секундах
+
+    Returns:
+        Вернёт p50_ms, p90_ms, p99_ms, max_ms и total_s.
+    """
+
+    ordered = sorted(timings) or [0]
+    summary = {}
+    for percentile in PERCENTILES:
+        rank = -(-len(ordered) * percentile // 100)  # Ранг — len * percentile / 100 с округлением вверх.
+        summary[f'p{percentile}_ms'] = ordered[max(rank - 1, 0)] * MILLISECONDS
+    summary.update(max_ms=ordered[-1] * MILLISECONDS, total_s=sum(timings))
+    return {name: round(sample, 3) for name, sample in summary.items()}
+
+
+def timed(timings: List[float], function: Callable, *args: Any) -> Any:
+
+    """
+    Функция вызывает стадию и добавляет её время в timings.
+
+    Args:
+        timings: время стадии по пачкам (в секундах)
+        function: стадия
+        args: аргументы стадии
+
+    Returns:
+        Вернёт результат стадии.
+    """
+
+    started = perf_counter()
+    stage_result = function(*args)
+    timings.append(perf_counter() - started)
+    return stage_result
+
+
+def run_pass(etl: ETL, router: IndexRouter, checkpoint: Checkpoint, pack_size: int) -> Tuple[dict, Checkpoint]:
+
+    """
+    Функция проходит (keyset) по всем строкам после checkpoint, как основной ETL, и замеряет каждую стадию.
+    Признаки изменений считаются относительно времени checkpoint.
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        router: индексы ES по языкам
+        checkpoint: пара (время, id), после которой начинается проход
+        pack_size: размер пачки
+
+    Returns:
+        Вернёт результат прохода и пару (время, id) последней строки.
+    """
+
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    rows, documents, changed_since = 0, 0, checkpoint[0]
+    started = perf_counter()
+    while True:
+        row_data = timed(timings['extract'], etl.extract_keyset, checkpoint, changed_since, pack_size)
+        if not row_data:
+            break
+
+        pack, _ = timed(timings['transform'], etl.transform, row_data, router)
+        timed(timings['load'], etl.load, pack)
+        rows, documents = rows + len(row_data), documents + len(pack)
+        checkpoint = pack_checkpoint(row_data)
+
+    seconds = perf_counter() - started
+    report = {
+        'rows': rows,
+        'documents': documents,
+        'packs': len(timings['load']),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1),
+        'stages': {stage: summarize(stage_timings) for stage, stage_timings in timings.items()},
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * KIBIBYTE,
+    }
+    return report, checkpoint
+
+
+def run_passes(etl: ETL, stand_in: BulkStandIn, arguments: argparse.Namespace) -> List[dict]:
+
+    """
+    Функция выполняет проходы бенчмарка: весь каталог, затем (если задан --churn) поток изменений.
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL (пишет в stand_in)
+        stand_in: локальный сервер с API _bulk
+        arguments: аргументы командной строки
+
+    Returns:
+        Вернёт результаты проходов (с названием и статистикой bulk запросов).
+    """
+
+    router = IndexRouter(config.index_name, tuple(config.languages), config.default_language)
+    if arguments.videos:
+        with etl.postgres_pool.connection() as con_seed:
+            clean(con_seed)
+            seed_catalog(con_seed, arguments.videos)
+
+    initial, checkpoint = run_pass(etl, router, (config.smallest_time, config.smallest_id), arguments.pack_size)
+    passes = [{'name': 'initial', **initial, 'bulk': stand_in.stats(reset=True)}]
+    if arguments.churn:
+        with etl.postgres_pool.connection() as con_churn:
+            churn(con_churn, arguments.churn)
+        changes, _ = run_pass(etl, router, checkpoint, arguments.pack_size)
+        passes.append({'name': 'churn', **changes, 'bulk': stand_in.stats(reset=True)})
+    return passes
+
+
+def benchmark(arguments: argparse.Namespace, postgres_parameters: dict) -> dict:
+
+    """
+    Функция запускает локальный сервер _bulk и ETL, который пишет в него, и выполняет проходы.
+
+    Args:
+        arguments: аргументы командной строки
+        postgres_parameters: параметры подключения к бенчмарк базе
+
+    Returns:
+        Вернёт результат бенчмарка (метка, параметры и проходы).
+    """
+
+    # Хэши содержимого — только в памяти: каждый запуск начинается с пустого «индекса».
+    update = {'hashes_database': ':memory:', 'load_mode': arguments.load_mode}
+    load_parameters = config.load_parameters.copy(update=update)
+    stand_in = BulkStandIn(delay=arguments.delay).start()
+    etl = ETL(postgres_parameters, stand_in.address, config.itersize, 1, load_parameters)
+
+    report = {
+        'label': arguments.label,
+        'started': strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'parameters': {
+            'dbname': arguments.dbname,
+            'videos': arguments.videos,
+            'churn': arguments.churn,
+            'pack_size': arguments.pack_size,
+            'load_mode': arguments.load_mode,
+            'delay': arguments.delay,
+        },
+        'passes': run_passes(etl, stand_in, arguments),
+    }
+    etl.postgres_pool.close()
+    stand_in.shutdown()
+    return report
+
+
+def parse_arguments() -> Tuple[argparse.Namespace, dict]:
+
+    """
+    Функция разбирает аргументы командной строки.
+
+    Returns:
+        Вернёт аргументы и параметры подключения к бенчмарк базе.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    videos = 'очистить таблицы content бенчмарк базы и создать каталог из стольких видео (0 — взять готовый)'
+    parser.add_argument('--videos', type=int, default=0, help=videos)
+    parser.add_argument('--churn', type=float, default=0, help='доля видео, изменяемых перед вторым проходом')
+    parser.add_argument('--pack-size', type=int, default=config.reindex_pack_size, help='размер пачки')
+    parser.add_argument('--load-mode', default=config.load_parameters.load_mode, help='bulk, streaming, parallel')
+    parser.add_argument('--delay', type=float, default=0, help='задержка ответа на bulk запрос (сек.)')
+    parser.add_argument('--label', default='', help='метка результата (например, коммит)')
+    parser.add_argument('--output', default='benchmark_etl.json', help='куда записать результат')
+    return benchmark_database(parser)
+
+
+def main() -> None:
+
+    """Функция запускает бенчмарк и пишет результат в json файл."""
+
+    arguments, postgres_parameters = parse_arguments()
+    report = benchmark(arguments, postgres_parameters)
+    with open(arguments.output, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+    logger.info('Benchmark report has been written: %s', arguments.output)
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Модуль содержит микробенчмарк стадии transform: прежняя pydantic модель против сборки из кортежей."""
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Callable, List, Tuple, Union
+from uuid import uuid4
+
+from elasticsearch.serializer import JSONSerializer
+
+from documents import IndexDocument, IndexRouter, update_action
+from etl_class import transform_pack
+from models import Document
+
+Row = Tuple[object, ...]
+TITLE = 'Как приготовить борщ: пошаговый рецепт'
+DESCRIPTION = 'Подробный рассказ о том, как выбрать свёклу, сварить бульон и подать борщ к столу. ' * 4
+STARTED = datetime.fromisoformat('2022-01-01T00:00:00+00:00')
+ROWS = 10000
+LINE = '{0:<25} {1:>15,.0f} {2:>16,.0f} {3:>8.1f}x'
+
+
+def make_rows(count: int) -> List[Row]:
+
+    """
+    Функция создаёт строки в формате выборки ETL (как их возвращает PG).
+
+    Args:
+        count: количество строк
+
+    Returns:
+        Вернёт список строк.
+    """
+
+    return [
+        (
+            uuid4(),
+            f'{TITLE} №{number}',
+            DESCRIPTION,
+            f'Борщ №{number}',
+            f'audio/{number}.aac',
+            f'video/{number}.mp4',
+            True,  # data_changed
+            False,  # track_changed
+            ('ru', 'en')[number % 2],  # lang
+            STARTED + timedelta(seconds=number),
+        )
+        for number in range(count)
+    ]
+
+
+def legacy_transform(data: List[Row], router: IndexRouter) -> Tuple[List[dict], str]:
+
+    """
+    Функция повторяет прежнюю стадию transform: общая pydantic модель и dict(by_alias=True) на каждую строку.
+
+    Args:
+        data: строки PG
+        router: индексы ES (прежний вариант писал всё в один индекс — псевдоним)
+
+    Returns:
+        Вернёт список документов и максимальную дату пачки.
+    """
+
+    doc = Document()
+    dates, pack = [], []
+    for id_video, title, description, h1, _audio, _video, data_changed, *_, max_date in data:
+        dates.append(f'{max_date}')
+        if data_changed:
+            doc.id = id_video
+            doc.index = router.alias
+            doc.source.id = id_video
+            doc.source.title = title
+            doc.source.description = description
+            doc.source.h1 = h1
+        pack.append(doc.dict(by_alias=True))
+    return pack, max(dates)
+
+
+def bulk_body(document: Union[dict, IndexDocument]) -> Union[dict, str]:
+
+    """
+    Функция возвращает тело bulk действия.
+    У прежнего варианта это _source, у нового — тело update для нового документа (со всеми полями).
+
+    Args:
+        document: документ
+
+    Returns:
+        Вернёт тело действия.
+    """
+
+    if isinstance(document, IndexDocument):
+        return update_action(document)[1]  # type: ignore
+    return document['_source']
+
+
+def serialize(pack: List[Union[dict, IndexDocument]]) -> int:
+
+    """
+    Функция сериализует тела документов так же, как клиент ES при загрузке (bulk).
+
+    Args:
+        pack: документы
+
+    Returns:
+        Вернёт размер тел в байтах.
+    """
+
+    serializer = JSONSerializer()
+    bodies = [serializer.dumps(bulk_body(document)) for document in pack]
+    return sum(len(body.encode()) for body in bodies)
+
+
+def measure(transform: Callable, data: List[Row], repeats: int, with_serialization: bool) -> float:
+
+    """
+    Функция измеряет пропускную способность transform (лучший результат из repeats запусков).
+
+    Args:
+        transform: функция transform
+        data: строки PG
+        repeats: количество запусков
+        with_serialization: учитывать ли сериализацию тел для bulk
+
+    Returns:
+        Вернёт строк в секунду.
+    """
+
+    timings = []
+    for _ in range(repeats):
+        started = perf_counter()
+        pack, _max_date = transform(data, IndexRouter('videos'))
+        if with_serialization:
+            serialize(pack)
+        timings.append(perf_counter() - started)
+    return len(data) / min(timings)
+
+
+def main() -> None:
+
+    """Функция запускает микробенчмарк и печатает строки в секунду для обоих вариантов."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=ROWS, help='строк в пачке')
+    parser.add_argument('--repeats', type=int, default=5, help='запусков, берётся лучший')
+    arguments = parser.parse_args()
+
+    data = make_rows(arguments.rows)
+    print('stage                      legacy rows/s       new rows/s   speedup')  # noqa: WPS421
+    for stage, with_serialization in (('transform', False), ('transform + serialization', True)):
+        legacy = measure(legacy_transform, data, arguments.repeats, with_serialization)
+        current = measure(transform_pack, data, arguments.repeats, with_serialization)
+        print(LINE.format(stage, legacy, current, current / legacy))  # noqa: WPS421
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Модуль содержит локальную замену ElasticSearch для бенчмарков: HTTP сервер с API _bulk.
+
+Сервер принимает bulk запросы (в том числе сжатые gzip), подтверждает каждое действие
+и считает запросы, действия и байты. Документы он не хранит и не индексирует,
+поэтому бенчмарк измеряет сам ETL, а не ElasticSearch.
+"""
+import argparse
+import gzip
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from types import MappingProxyType
+from typing import Dict, List
+
+from log import create_logger
+
+# Ответ на GET /: клиент elasticsearch-py проверяет по нему, что на той стороне ElasticSearch.
+VERSION = json.dumps({
+    'name': 'bulk-stand-in',
+    'version': {'number': '7.7.0', 'build_flavor': 'default'},
+    'tagline': 'You Know, for Search',
+}).encode()
+NOT_FOUND_BODY = json.dumps({'error': 'not found'}).encode()
+STATUSES = MappingProxyType({'index': 201, 'create': 201, 'update': 200, 'delete': 200})
+OK = 200
+NOT_FOUND = 404
+DEFAULT_PORT = 9200  # Порт ES по умолчанию: ETL с настройками по умолчанию сразу пишет в сервер.
+
+
+def bulk_items(lines: List[str]) -> List[dict]:
+
+    """
+    Функция разбирает тело bulk запроса (NDJSON) и строит ответ на каждое действие.
+    За строкой действия идёт строка с телом документа, у delete тела нет.
+
+    Args:
+        lines: непустые строки тела запроса
+
+    Returns:
+        Вернёт элементы items ответа _bulk.
+    """
+
+    items = []
+    position = 0
+    while position < len(lines):
+        operation, meta = next(iter(json.loads(lines[position]).items()))
+        position += 1 if operation == 'delete' else 2
+        result = {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': STATUSES[operation]}
+        items.append({operation: result})
+    return items
+
+
+class BulkStandIn(ThreadingHTTPServer):
+
+    """
+    Класс HTTP сервера с API _bulk.
+    Статистика (запросы, действия, байты тел) общая для всех потоков сервера, поэтому под блокировкой.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            port: порт (0 — любой свободный)
+            delay: сколько секунд ждать перед ответом на bulk запрос (имитация работы ES)
+        """
+
+        super().__init__(('localhost', port), BulkHandler)
+        self.delay = delay
+        self._lock = Lock()
+        self._stats = {'requests': 0, 'actions': 0, 'bytes': 0}
+
+    @property
+    def address(self) -> str:
+
+        """
+        Адрес сервера для клиента ElasticSearch.
+
+        Returns:
+            Вернёт адрес с localhost и портом сервера.
+        """
+
+        return 'http://localhost:{0}'.format(self.server_address[1])
+
+    def count(self, actions: int, size: int) -> None:
+
+        """
+        Метод учитывает один bulk запрос.
+
+        Args:
+            actions: количество действий в запросе
+            size: размер тела в байтах (как пришло по сети)
+        """
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['actions'] += actions
+            self._stats['bytes'] += size
+
+    def stats(self, reset: bool = False) -> Dict[str, int]:
+
+        """
+        Метод возвращает статистику сервера.
+
+        Args:
+            reset: обнулить статистику (например, между проходами бенчмарка)
+
+        Returns:
+            Вернёт количество запросов, действий и байт.
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            if reset:
+                self._stats = dict.fromkeys(self._stats, 0)
+        return stats
+
+    def start(self) -> 'BulkStandIn':
+
+        """
+        Метод запускает сервер в фоновом потоке.
+
+        Returns:
+            Вернёт этот же сервер.
+        """
+
+        Thread(target=self.serve_forever, name='bulk-stand-in', daemon=True).start()
+        logger.info('Bulk stand-in has been started: %s', self.address)
+        return self
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+
+    """Класс обработчика запросов: GET / (версия) и POST/PUT …/_bulk, на остальное — 404."""
+
+    server: BulkStandIn
+    protocol_version = 'HTTP/1.1'  # Соединения клиента переиспользуются, как с настоящим ES.
+
+    def do_GET(self) -> None:  # noqa: N802
+
+        """Метод отвечает на GET: версия на /, на остальное — 404."""
+
+        if self.path.split('?')[0] == '/':
+            self._reply(OK, VERSION)
+        else:
+            self._reply(NOT_FOUND, NOT_FOUND_BODY)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+
+        """Метод отвечает на HEAD: сервер доступен."""
+
+        self._reply(OK, b'')
+
+    def do_POST(self) -> None:  # noqa: N802
+
+        """Метод принимает bulk запрос."""
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.split('?')[0].endswith('/_bulk'):
+            self._reply(NOT_FOUND, NOT_FOUND_BODY)
+            return
+
+        size = len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        items = bulk_items([line for line in body.decode().split('\n') if line])
+        self.server.count(len(items), size)
+        if self.server.delay:
+            sleep(self.server.delay)
+        self._reply(OK, json.dumps({'took': 0, 'errors': False, 'items': items}).encode())
+
+    def do_PUT(self) -> None:  # noqa: N802
+
+        """Метод принимает bulk запрос (как и POST)."""
+
+        self.do_POST()
+
+    def log_message(self, *args: object) -> None:  # noqa: WPS110
+
+        """
+        Метод отключает запись каждого запроса в stderr (это мешало бы замерам).
+
+        Args:
+            args: формат и аргументы строки лога
+        """
+
+    def _reply(self, status: int, body: bytes) -> None:
+
+        """
+        Метод отправляет ответ в формате json.
+
+        Args:
+            status: код ответа
+            body: тело ответа
+        """
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+def main() -> None:
+
+    """Функция запускает сервер до остановки процесса (ETL можно направить на него через ELASTIC_PORT)."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт')
+    parser.add_argument('--delay', type=float, default=0, help='задержка ответа на bulk запрос (сек.)')
+    arguments = parser.parse_args()
+
+    server = BulkStandIn(arguments.port, arguments.delay)
+    logger.info('Bulk stand-in is listening: %s', server.address)
+    server.serve_forever()
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Модуль содержит хранилище хэшей содержимого документов, уже загруженных в ElasticSearch."""
+import json
+import sqlite3
+import sys
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+from documents import Action, IndexDocument, delete_action, update_action
+from log import create_logger
+
+HASHES_TABLE = """
+CREATE TABLE IF NOT EXISTS document_hashes (
+    index_name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (index_name, id)
+) WITHOUT ROWID
+"""
+# Документ ищется по id во всех индексах сразу (так видно, что он переехал в индекс другого языка).
+HASHES_ID_INDEX = 'CREATE INDEX IF NOT EXISTS document_hashes_id ON document_hashes (id)'
+# Идентификаторы пачки передаются одним параметром (json массив): так не упираемся в лимит параметров SQLite.
+SELECT_HASHES = """
+SELECT index_name, id, digest FROM document_hashes
+WHERE id IN (SELECT value FROM json_each(?))
+"""
+UPSERT_HASH = """
+INSERT INTO document_hashes (index_name, id, digest) VALUES (?, ?, ?)
+ON CONFLICT (index_name, id) DO UPDATE SET digest = excluded.digest
+"""
+DELETE_HASHES = 'DELETE FROM document_hashes WHERE index_name = ?'
+# UUID индекса, для которого записаны хэши: у пересозданного индекса (или нового под тем же псевдонимом) он другой.
+UUIDS_TABLE = """
+CREATE TABLE IF NOT EXISTS index_uuids (
+    index_name TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL
+) WITHOUT ROWID
+"""
+SELECT_UUID = 'SELECT uuid FROM index_uuids WHERE index_name = ?'
+UPSERT_UUID = """
+INSERT INTO index_uuids (index_name, uuid) VALUES (?, ?)
+ON CONFLICT (index_name) DO UPDATE SET uuid = excluded.uuid
+"""
+DELETE_MOVED = 'DELETE FROM document_hashes WHERE id = ? AND index_name != ?'
+
+
+class ContentHashes:
+
+    """
+    Класс хранит хэш содержимого каждого документа, который ES подтвердил (по индексу и id).
+
+    По хэшам стадия load отбрасывает документы, которые не изменились (например, пачку, повторённую
+    после перезапуска), а из изменившихся отправляет только изменившиеся поля (update с doc_as_upsert):
+    ES не переиндексирует документ без нужды, и сегменты индекса реже сливаются.
+    По ним же видно, в каком индексе документ лежит сейчас: если видео сменило язык,
+    документ удаляется из индекса прежнего языка.
+
+    Хэши лежат в базе SQLite (':memory:' — только на время работы процесса).
+    Хэши индекса записаны для его UUID в ES: если индекс пересоздан или потерян, UUID другой,
+    и track сбрасывает его хэши. Иначе неизменившиеся документы не попали бы в новый индекс,
+    а частичное обновление создало бы документ без неизменившихся полей.
+    """
+
+    def __init__(self, file_path: str = ':memory:') -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            file_path: путь до базы SQLite
+        """
+
+        self.file_path = file_path
+        self._lock = Lock()
+        self._database: Optional[sqlite3.Connection] = None
+
+    def changes(self, documents: List[IndexDocument]) -> List[Action]:
+
+        """
+        Метод собирает bulk действия для изменившихся документов.
+
+        Args:
+            documents: документы пачки
+
+        Returns:
+            Вернёт список действий (документы без изменений в него не попадают).
+        """
+
+        current = {document.document_id: document.index_name for document in documents}
+        previous: Dict[Tuple[str, str], str] = {}
+        moved = []
+        for index_name, document_id, digest in self._stored(list(current)):
+            previous[index_name, document_id] = digest
+            if current[document_id] != index_name:
+                moved.append(delete_action(index_name, document_id))
+
+        actions = [
+            update_action(document, previous.get((document.index_name, document.document_id)))
+            for document in documents
+        ]
+        changed = [action for action in actions if action is not None]
+        unchanged = len(documents) - len(changed)
+        logger.info(
+            'Documents have been compared: %s changed, %s unchanged, %s moved.', len(changed), unchanged, len(moved),
+        )
+        return changed + moved
+
+    def remember(self, documents: List[IndexDocument], failures: List[dict]) -> None:
+
+        """
+        Метод запоминает хэши документов, которые ES подтвердил (и забывает их прежние индексы).
+
+        Args:
+            documents: документы пачки
+            failures: ответы ES по документам, которые не загрузились (их хэши не меняются)
+        """
+
+        failed: Set[str] = {item.get('_id', '') for failure in failures for item in failure.values()}
+        rows = [
+            (document.index_name, document.document_id, document.digest)
+            for document in documents
+            if document.document_id not in failed
+        ]
+        with self._lock, self._connection() as database:
+            database.executemany(DELETE_MOVED, [(document_id, index_name) for index_name, document_id, _ in rows])
+            database.executemany(UPSERT_HASH, rows)
+
+    def track(self, uuids: Dict[str, str]) -> None:
+
+        """
+        Метод сверяет UUID индексов с теми, для которых записаны хэши, и сбрасывает хэши индексов, где он другой.
+
+        Args:
+            uuids: UUID индексов ES по названию (пустая строка — индекса нет)
+        """
+
+        with self._lock, self._connection() as database:
+            for index_name, uuid in uuids.items():
+                stored = database.execute(SELECT_UUID, (index_name,)).fetchone()
+                if stored is not None and stored[0] == uuid:
+                    continue
+                if stored is not None:
+                    logger.warning('Index %s has been recreated: its content hashes have been dropped.', index_name)
+                database.execute(DELETE_HASHES, (index_name,))
+                database.execute(UPSERT_UUID, (index_name, uuid))
+
+    def forget(self, index_name: str) -> None:
+
+        """
+        Метод сбрасывает хэши индекса (когда индекс пересоздан): его документы отправятся целиком.
+
+        Args:
+            index_name: индекс ES
+        """
+
+        with self._lock, self._connection() as database:
+            database.execute(DELETE_HASHES, (index_name,))
+
+    def _stored(self, identifiers: List[str]) -> List[Tuple[str, str, str]]:
+
+        """
+        Метод достаёт запомненные хэши документов (во всех индексах).
+
+        Args:
+            identifiers: id документов
+
+        Returns:
+            Вернёт тройки (индекс, id, хэш); документов без хэша в них нет.
+        """
+
+        with self._lock:
+            return self._connection().execute(SELECT_HASHES, (json.dumps(identifiers),)).fetchall()
+
+    def _connection(self) -> sqlite3.Connection:
+
+        """
+        Метод возвращает соединение с базой (при первом обращении — открывает его и создаёт таблицу).
+        Хэшами пользуется стадия load — из своего потока, поэтому соединение общее и под блокировкой.
+
+        Returns:
+            Вернёт соединение (контекстный менеджер: COMMIT при выходе, ROLLBACK при ошибке).
+        """
+
+        if self._database is None:
+            self._database = sqlite3.connect(self.file_path, check_same_thread=False)
+            self._database.execute('PRAGMA journal_mode=WAL')
+            self._database.execute('PRAGMA synchronous=NORMAL')
+            self._database.execute(HASHES_TABLE)
+            self._database.execute(HASHES_ID_INDEX)
+            self._database.execute(UUIDS_TABLE)
+        return self._database
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
@@ -1,10 +1,73 @@
 """
-Модуль содержит шаблонный запрос к базе данных, нужный для ETL в момент extract.
-Константу SELECT_FROM_PG мы будем использовать как форматную строку,
-именно по этой причине в строке у нас есть фигурные скобки.
+Модуль содержит шаблонные запросы к базе данных, нужные для ETL в момент extract.
+Запросы параметризованы (параметры передаёт драйвер psycopg2),
+а для повторяющихся запросов есть варианты PREPARE/EXECUTE:
+Postgres планирует такой запрос один раз на соединение, а не на каждую пачку.
 """
+from typing import Tuple
 
-SELECT_FROM_PG = """  
+
+def to_prepared(name: str, types: Tuple[str, ...], query: str, parameters: Tuple[str, ...]) -> str:
+
+    """
+    Функция строит запрос PREPARE из параметризованного запроса.
+    Именованные параметры psycopg2 (%(name)s) заменяются на позиционные параметры Postgres ($1, $2, ...).
+
+    Args:
+        name: имя подготовленного запроса
+        types: типы параметров Postgres (в том же порядке, что и parameters)
+        query: параметризованный запрос
+        parameters: имена параметров запроса
+
+    Returns:
+        Вернёт текст запроса PREPARE.
+    """
+
+    for number, parameter in enumerate(parameters, start=1):
+        query = query.replace(f'%({parameter})s', f'${number}')
+
+    joined_types = ', '.join(types)
+    return f'PREPARE {name} ({joined_types}) AS {query}'
+
+
+SELECT_FROM_PG = """
+    SELECT
+        v.id,
+        v.title,
+        v.description,
+        v.h1,
+        at.audio_file,
+        vt.video_file,
+        v.updated_at > %(time)s::timestamptz as data_changed,
+        at.updated_at > %(time)s::timestamptz OR vt.updated_at > %(time)s::timestamptz as track_changed,
+        l.iso_639_1 as lang,
+        GREATEST(v.updated_at, at.updated_at, vt.updated_at) as max_date
+
+    FROM content.video v
+    LEFT JOIN content.audio_track at on at.id = v.audio_track_id
+    LEFT JOIN content.video_track vt on vt.id = v.video_track_id
+    LEFT JOIN content.langs l on l.id = v.lang
+    WHERE
+        v.updated_at > %(time)s::timestamptz OR
+        at.updated_at > %(time)s::timestamptz OR
+        vt.updated_at > %(time)s::timestamptz
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+SELECT_FROM_PG_PARAMETERS = ('time', 'limit', 'offset')
+SELECT_FROM_PG_TYPES = ('timestamptz', 'integer', 'integer')
+PREPARE_SELECT_FROM_PG = to_prepared('etl_extract', SELECT_FROM_PG_TYPES, SELECT_FROM_PG, SELECT_FROM_PG_PARAMETERS)
+EXECUTE_SELECT_FROM_PG = 'EXECUTE etl_extract (%(time)s, %(limit)s, %(offset)s)'
+
+
+# Запрос для постраничного (keyset) извлечения данных.
+# Вместо OFFSET мы продолжаем выборку строго после последней обработанной пары (дата, id),
+# поэтому каждая следующая пачка не пересматривает предыдущие строки,
+# а граничные строки (с одинаковой датой) не извлекаются повторно.
+# Признаки изменений считаются относительно времени начала обхода (changed_since),
+# а не относительно пары (дата, id): иначе строка, впервые попавшая в обход, потеряла бы свои meta-data.
+
+SELECT_FROM_PG_KEYSET = """
     SELECT
         v.id,
         v.title,
@@ -12,16 +75,66 @@ SELECT_FROM_PG = """
         v.h1,
         at.audio_file,
         vt.video_file,
-        v.updated_at > '{}' as data_changed,
-        at.updated_at > '{}' OR vt.updated_at > '{}' as track_changed,
+        v.updated_at > %(changed_since)s::timestamptz as data_changed,
+        at.updated_at > %(changed_since)s::timestamptz OR
+        vt.updated_at > %(changed_since)s::timestamptz as track_changed,
+        l.iso_639_1 as lang,
         GREATEST(v.updated_at, at.updated_at, vt.updated_at) as max_date
 
     FROM content.video v
     LEFT JOIN content.audio_track at on at.id = v.audio_track_id
     LEFT JOIN content.video_track vt on vt.id = v.video_track_id
+    LEFT JOIN content.langs l on l.id = v.lang
     WHERE
-        v.updated_at > '{}' OR
-        at.updated_at > '{}' OR
-        vt.updated_at > '{}'
-    LIMIT {} OFFSET {}
+        (GREATEST(v.updated_at, at.updated_at, vt.updated_at), v.id) > (%(time)s::timestamptz, %(id)s::uuid)
+    ORDER BY max_date, v.id
+    LIMIT %(limit)s
 """
+
+SELECT_FROM_PG_KEYSET_PARAMETERS = ('time', 'id', 'changed_since', 'limit')
+SELECT_FROM_PG_KEYSET_TYPES = ('timestamptz', 'uuid', 'timestamptz', 'integer')
+PREPARE_SELECT_FROM_PG_KEYSET = to_prepared(
+    'etl_extract_keyset', SELECT_FROM_PG_KEYSET_TYPES, SELECT_FROM_PG_KEYSET, SELECT_FROM_PG_KEYSET_PARAMETERS,
+)
+EXECUTE_SELECT_FROM_PG_KEYSET = 'EXECUTE etl_extract_keyset (%(time)s, %(id)s, %(changed_since)s, %(limit)s)'
+
+
+# Запрос для загрузки по разделам (backfill): раздел — диапазон id видео (id, last],
+# внутри раздела строки идут по id (первичный ключ), поэтому разделы читаются независимо и без сортировки по дате.
+# Meta-data всех строк считаются изменёнными, треки — нет: загрузка заполняет индекс, а не перешивает видео.
+
+SELECT_FROM_PG_PARTITION = """
+    SELECT
+        v.id,
+        v.title,
+        v.description,
+        v.h1,
+        at.audio_file,
+        vt.video_file,
+        true as data_changed,
+        false as track_changed,
+        l.iso_639_1 as lang,
+        GREATEST(v.updated_at, at.updated_at, vt.updated_at) as max_date
+
+    FROM content.video v
+    LEFT JOIN content.audio_track at on at.id = v.audio_track_id
+    LEFT JOIN content.video_track vt on vt.id = v.video_track_id
+    LEFT JOIN content.langs l on l.id = v.lang
+    WHERE
+        v.id > %(id)s::uuid AND v.id <= %(last)s::uuid
+    ORDER BY v.id
+    LIMIT %(limit)s
+"""
+
+SELECT_FROM_PG_PARTITION_PARAMETERS = ('id', 'last', 'limit')
+SELECT_FROM_PG_PARTITION_TYPES = ('uuid', 'uuid', 'integer')
+PREPARE_SELECT_FROM_PG_PARTITION = to_prepared(
+    'etl_extract_partition',
+    SELECT_FROM_PG_PARTITION_TYPES,
+    SELECT_FROM_PG_PARTITION,
+    SELECT_FROM_PG_PARTITION_PARAMETERS,
+)
+EXECUTE_SELECT_FROM_PG_PARTITION = 'EXECUTE etl_extract_partition (%(id)s, %(last)s, %(limit)s)'
+
+# Время сервера Postgres: от него считаются даты изменений, поэтому и точки продолжения берутся от него.
+SELECT_NOW = 'SELECT now()'
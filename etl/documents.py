@@ -0,0 +1,184 @@
+"""Модуль содержит сборку документов ElasticSearch из строк PG, их индексы по языкам и bulk действия по ним."""
+import json
+from hashlib import blake2b
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Один кодировщик на процесс: без проверки циклических ссылок, без экранирования кириллицы и без пробелов.
+ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':'))
+FIELDS = ('id', 'title', 'description', 'h1')  # Поля документа (и столбцы строки PG) по порядку.
+DIGEST_SIZE = 8  # Размер хэша одного поля в байтах.
+DIGEST_WIDTH = DIGEST_SIZE * 2  # Он же в шестнадцатеричной записи.
+
+Action = Tuple[Dict[str, Dict[str, str]], Optional[str]]
+
+
+class IndexDocument(NamedTuple):
+
+    """
+    Документ ES, собранный из строки PG.
+
+    Поля уже закодированы в json (по порядку FIELDS), digest — хэши этих полей подряд:
+    по нему видно и изменился ли документ, и какие именно поля изменились.
+    """
+
+    index_name: str
+    document_id: str
+    fields: Tuple[str, ...]
+    digest: str
+
+
+class IndexRouter(NamedTuple):
+
+    """
+    Индексы ES по языкам.
+
+    У каждого языка свой индекс {alias}_{язык} со своим анализатором,
+    а все они под общим псевдонимом alias (поиск по всем языкам сразу).
+    При пересборке (см. reindex.py) документы пишутся в версии индексов {alias}_{язык}_{version},
+    а {alias}_{язык} становится псевдонимом текущей версии.
+
+    Видео на языке без своего индекса попадает в индекс языка по умолчанию.
+    """
+
+    alias: str
+    languages: Tuple[str, ...] = ('ru', 'en')
+    default_language: str = 'ru'
+    version: str = ''
+
+    def index(self, language: Optional[str]) -> str:
+
+        """
+        Метод возвращает индекс для языка.
+
+        Args:
+            language: код языка ISO 639-1
+
+        Returns:
+            Вернёт название индекса (с версией, если она задана).
+        """
+
+        if language not in self.languages:
+            language = self.default_language
+        name = f'{self.alias}_{language}'
+        return f'{name}_{self.version}' if self.version else name
+
+    def versioned(self, version: str) -> 'IndexRouter':
+
+        """
+        Метод возвращает те же индексы, но заданной версии.
+
+        Args:
+            version: версия индексов
+
+        Returns:
+            Вернёт индексы ES по языкам.
+        """
+
+        return self._replace(version=version)
+
+
+def build_document(index_name: str, row: Tuple[Any, ...]) -> IndexDocument:
+
+    """
+    Функция собирает документ ES для строки PG.
+
+    Каждое поле кодируется в json отдельно и сразу хэшируется: в режиме pipeline это делают
+    процессы transform, а стадии load остаётся сравнить хэши и склеить изменившиеся поля.
+    id приводится к строке заранее: UUID кодировщик обрабатывал бы медленным путём (через default).
+
+    Args:
+        index_name: индекс ES
+        row: строка PG (id, title, description, h1, ...)
+
+    Returns:
+        Вернёт документ.
+    """
+
+    document_id = f'{row[0]}'
+    fields = tuple(ENCODER.encode(field) for field in (document_id, *row[1:4]))
+    digest = ''.join(blake2b(field.encode(), digest_size=DIGEST_SIZE).hexdigest() for field in fields)
+    return IndexDocument(index_name, document_id, fields, digest)
+
+
+def build_documents(data: List[Tuple[Any, ...]], router: IndexRouter) -> List[IndexDocument]:
+
+    """
+    Функция собирает документы ES для пачки строк PG, каждый — в индекс языка видео.
+
+    Документ собирается, только если у строки изменились meta-data (data_changed).
+    Строки, где изменились только треки, в индекс не идут: перешивку делает пул перекодирования,
+    а документ в ES от неё не меняется.
+
+    Args:
+        data: «сырые» данные из PG
+        router: индексы ES по языкам
+
+    Returns:
+        Вернёт список документов.
+    """
+
+    return [build_document(router.index(row[8]), row) for row in data if row[6]]  # lang, data_changed
+
+
+def update_action(document: IndexDocument, previous: Optional[str] = None) -> Optional[Action]:
+
+    """
+    Функция собирает bulk действие ES (update с doc_as_upsert) только из изменившихся полей.
+
+    Тело действия собирается из уже закодированных полей и отправляется клиентом ES как есть.
+    Если прежнего хэша нет (документ новый или хэши сброшены), отправляются все поля:
+    doc_as_upsert создаст документ целиком.
+
+    Args:
+        document: документ
+        previous: хэш документа, который уже загружен в ES
+
+    Returns:
+        Вернёт пару (строка действия, тело) или None, если документ не изменился.
+    """
+
+    if previous == document.digest:
+        return None
+    if previous is not None and len(previous) != len(document.digest):
+        previous = None  # Хэш записан для другого набора полей — сравнивать нечего.
+
+    changed = []
+    for position, (name, field) in enumerate(zip(FIELDS, document.fields)):
+        window = slice(position * DIGEST_WIDTH, (position + 1) * DIGEST_WIDTH)
+        if previous is None or previous[window] != document.digest[window]:
+            changed.append(f'"{name}":{field}')
+
+    body = '{{"doc":{{{0}}},"doc_as_upsert":true}}'.format(','.join(changed))
+    return {'update': {'_index': document.index_name, '_id': document.document_id}}, body
+
+
+def delete_action(index_name: str, document_id: str) -> Action:
+
+    """
+    Функция собирает bulk действие ES (delete): документ переехал в индекс другого языка.
+
+    Args:
+        index_name: индекс, из которого документ нужно удалить
+        document_id: id документа
+
+    Returns:
+        Вернёт пару (строка действия, тело) — у delete тела нет.
+    """
+
+    return {'delete': {'_index': index_name, '_id': document_id}}, None
+
+
+def expanded(action: Action) -> Action:
+
+    """
+    Функция для expand_action_callback клиента ES: действия уже разобраны на строку действия и тело.
+    Стандартный разбор (expand_action) для update перенёс бы строковое тело в фильтр _source.
+
+    Args:
+        action: пара (строка действия, тело)
+
+    Returns:
+        Вернёт ту же пару.
+    """
+
+    return action
@@ -1,27 +1,53 @@
 """Модуль содержит класс, для работы ETL."""
 import sys
-from multiprocessing import Process
-from pathlib import Path
-from typing import List, Tuple, Dict, Union
+from time import sleep
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
-import psycopg2
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, TransportError, helpers
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2.pool import PoolError
 
 from backoff_function import backoff
-from database_query import SELECT_FROM_PG
+from database_query import (
+    EXECUTE_SELECT_FROM_PG,
+    EXECUTE_SELECT_FROM_PG_KEYSET,
+    EXECUTE_SELECT_FROM_PG_PARTITION,
+    PREPARE_SELECT_FROM_PG,
+    PREPARE_SELECT_FROM_PG_KEYSET,
+    PREPARE_SELECT_FROM_PG_PARTITION,
+    SELECT_FROM_PG_KEYSET,
+)
+from content_hashes import ContentHashes
+from documents import Action, IndexDocument, IndexRouter, build_documents, expanded
+from etl_metrics import record_bulk
 from log import create_logger
-from models import document_config
-from video_converter import MediaConverter
+from job_queue import RedisJobQueue
+from models import LoadSettings
+from postgres_pool import PostgresPool
+from transcoding import TranscodePool, transcode_jobs
 
+NOT_FOUND = 404
+TOO_MANY_REQUESTS = 429
+# Пауза перед повтором отказов 429 в режиме 'parallel' (удваивается с каждым повтором), как в streaming_bulk.
+INITIAL_BACKOFF = 2
+MAX_BACKOFF = 600
+# Ошибки зависимостей, которые повторяет backoff (остальные, например ошибки в запросе, пробрасываются сразу).
+POSTGRES_ERRORS = (OperationalError, InterfaceError, PoolError)
+ELASTIC_ERRORS = (TransportError,)
 
-class ETL:
+
+class ETL:  # noqa: WPS214, WPS230
 
     """Класс-интерфейс для работы ETL процесса."""
 
     def __init__(
         self,
         postgres_parameters: Dict[str, Union[str, int]],
-        elastic_search_address: str
+        elastic_search_address: str,
+        itersize: int = 1000,
+        pool_size: int = 4,
+        load_parameters: Optional[LoadSettings] = None,
+        transcoder: Union[TranscodePool, RedisJobQueue, None] = None
     ) -> None:
 
         """
@@ -30,17 +56,27 @@ class ETL:
         Args:
             postgres_parameters: параметры подключения к Postgres (host, port)
             elastic_search_address: адрес, для подключения к ElasticSearch (http://host:port)
+            itersize: сколько строк за раз забирать с серверного курсора Postgres
+            pool_size: максимальное количество соединений с Postgres в пуле
+            load_parameters: настройки клиента ElasticSearch и загрузки пачек
+            transcoder: куда отдавать задачи на перекодирование (пул процессов или очередь Redis)
         """
 
         self.postgres_parameters = postgres_parameters
         self.elastic_search_address = elastic_search_address
-
-    @backoff()
+        self.itersize = itersize
+        self.postgres_pool = PostgresPool(postgres_parameters, max_size=pool_size)
+        self.load_parameters = load_parameters if load_parameters else LoadSettings()
+        self._elastic: Optional[Elasticsearch] = None
+        self.hashes = ContentHashes(self.load_parameters.hashes_database)
+        self.transcoder = transcoder if transcoder else TranscodePool()
+
+    @backoff(retry_on=POSTGRES_ERRORS, breaker='postgres')
     def extract(self, time_from_storage: str, pack_size: int, begin: int) -> List[Tuple[str, ...]]:
 
         """
         Функция реализует «extract» задачу ETL.
-        Т.е. подключается к PG и выхватывает оттуда данные.
+        Т.е. берёт соединение из пула и выхватывает из PG данные подготовленным запросом.
 
         Args:
             time_from_storage: время последнего обновления
@@ -51,83 +87,346 @@ class ETL:
             Вернёт данные из БД, подходящие под условие запроса SELECT_FROM_PG.
         """
 
-        with psycopg2.connect(**self.postgres_parameters) as con_postgres:
-            cur_postgres = con_postgres.cursor()
-            select = SELECT_FROM_PG.format(*[time_from_storage for _ in range(6)], pack_size, begin)  # noqa: WPS331
-            cur_postgres.execute(select)
-            data = cur_postgres.fetchall()
-            return data  # noqa: WPS331
+        parameters = {'time': time_from_storage, 'limit': pack_size, 'offset': begin}
 
-    def transform(self, data: List[Tuple[str, ...]], index_name: str) -> Tuple[List[dict], str]:  # noqa: WPS210
+        with self.postgres_pool.connection() as con_postgres:
+            with con_postgres:
+                self.postgres_pool.prepare(con_postgres, 'etl_extract', PREPARE_SELECT_FROM_PG)
+            with con_postgres, con_postgres.cursor() as cur_postgres:
+                cur_postgres.execute(EXECUTE_SELECT_FROM_PG, parameters)
+                return cur_postgres.fetchall()
+
+    @backoff(retry_on=POSTGRES_ERRORS, breaker='postgres')
+    def extract_keyset(
+        self,
+        checkpoint: Tuple[str, str],
+        changed_since: str,
+        pack_size: int
+    ) -> List[Tuple[str, ...]]:
 
         """
-        Функция реализует «transform» задачу ETL.
-        Т.е. получает на вход данные из PG (data) и преобразует их в формат, подходящий ES.
+        Функция реализует «extract» задачу ETL в постраничном (keyset) режиме.
+        Выбирает строки строго после пары (дата, id) из checkpoint,
+        отсортированные по этой же паре, поэтому ни одна строка не будет извлечена повторно.
+
+        Если пачка больше itersize — строки читаются через именованный (серверный) курсор порциями по itersize,
+        т.е. клиент не получает весь результат одним куском, как при fetchall().
+        Иначе пачка целиком приходит за одну выборку, и мы используем подготовленный запрос:
+        серверный курсор тут ничего не даёт, а DECLARE нельзя построить поверх EXECUTE.
 
         Args:
-            data: «сырые» данные из PG
-            index_name: индекс ES в который будет происходить вставка документов
+            checkpoint: пара (время, id) последней обработанной строки
+            changed_since: время начала текущего обхода (относительно него считаются признаки изменений)
+            pack_size: размер пачки
 
         Returns:
-            Вернёт список трансформированных данных и максимальную дату пачки.
+            Вернёт данные из БД, подходящие под условие запроса SELECT_FROM_PG_KEYSET.
         """
 
-        all_dates_from_pack = []  # Все даты из пачки (потом будем искать максимальную из них).
-        transformed_pack = []  # Трансформированная пачка данных, в подходящем для ES формате.
+        time_from_storage, id_from_storage = checkpoint
+        parameters = {
+            'time': time_from_storage,
+            'id': id_from_storage,
+            'changed_since': changed_since,
+            'limit': pack_size,
+        }
 
-        for id_video, title, description, h1, audio_file, video_file, data_changed, track_changed, max_date in data:
-            doc = document_config  # Формат документа для индекса ES.
+        with self.postgres_pool.connection() as con_postgres:
 
-            all_dates_from_pack.append(f'{max_date}')
+            if pack_size > self.itersize:
+                with con_postgres, con_postgres.cursor(name='etl_extract_keyset') as named_cursor:
+                    named_cursor.itersize = self.itersize
+                    named_cursor.execute(SELECT_FROM_PG_KEYSET, parameters)
+                    return list(named_cursor)
 
-            if track_changed:  # Если изменился трек — нужна перешивка.
+            with con_postgres:
+                self.postgres_pool.prepare(con_postgres, 'etl_extract_keyset', PREPARE_SELECT_FROM_PG_KEYSET)
+            with con_postgres, con_postgres.cursor() as cur_postgres:
+                cur_postgres.execute(EXECUTE_SELECT_FROM_PG_KEYSET, parameters)
+                return cur_postgres.fetchall()
 
-                dir_media = 'media_source/'
-                mp_4 = f'{dir_media}{id_video}.mp4'  # noqa: WPS114
-                mpeg_dash_manifest = f'../streams/{id_video}/dash.mpd'
+    @backoff(retry_on=POSTGRES_ERRORS, breaker='postgres')
+    def extract_partition(self, after: str, last: str, pack_size: int) -> List[Tuple[str, ...]]:
 
-                mc = MediaConverter()
-                logger.info('Media converter started.')
+        """
+        Функция реализует «extract» задачу ETL для загрузки по разделам (см. backfill.py).
+        Выбирает строки раздела (after, last] по возрастанию id, пачкой не больше pack_size.
 
-                container = mc.make_container(f'{dir_media}{video_file}', f'{dir_media}{audio_file}', mp_4)
-                logger.info('Container has been created.')
+        Args:
+            after: id последней загруженной строки раздела (или нижняя граница раздела)
+            last: верхняя граница раздела (включительно)
+            pack_size: размер пачки
 
-                packaging = Process(target=mc.to_mpeg_dash, args=(Path(container), mpeg_dash_manifest))
-                packaging.start()
-                logger.info('Packaging process has been started.')
+        Returns:
+            Вернёт данные из БД, подходящие под условие запроса SELECT_FROM_PG_PARTITION.
+        """
+
+        parameters = {'id': after, 'last': last, 'limit': pack_size}
+
+        with self.postgres_pool.connection() as con_postgres:
+            with con_postgres:
+                self.postgres_pool.prepare(con_postgres, 'etl_extract_partition', PREPARE_SELECT_FROM_PG_PARTITION)
+            with con_postgres, con_postgres.cursor() as cur_postgres:
+                cur_postgres.execute(EXECUTE_SELECT_FROM_PG_PARTITION, parameters)
+                return cur_postgres.fetchall()
 
-            if data_changed:  # Если изменились meta-data — просто обновляем их.
-                doc.id = id_video
-                doc.index = index_name
+    def transform(self, data: List[Tuple[str, ...]], router: IndexRouter) -> Tuple[List[IndexDocument], str]:
+
+        """
+        Функция реализует «transform» задачу ETL.
+        Сама работа вынесена в transform_pack,
+        чтобы её можно было выполнять в отдельных процессах (см. pipeline.py).
 
-                doc.source.id = id_video
-                doc.source.title = title
-                doc.source.description = description
-                doc.source.h1 = h1
-                logger.info('Metadata has been collected.')
+        Args:
+            data: «сырые» данные из PG
+            router: индексы ES по языкам, в которые будет происходить вставка документов
 
-            transformed_pack.append(doc.dict(by_alias=True))
+        Returns:
+            Вернёт список трансформированных данных и максимальную дату пачки.
+        """
 
-        return transformed_pack, max(all_dates_from_pack)
+        return transform_pack(data, router)
 
-    @backoff()
-    def load(self, data: List[dict]) -> None:
+    def transcode(self, data: List[Tuple[str, ...]]) -> None:
+
+        """
+        Функция отдаёт строки с изменёнными треками на перекодирование.
+        Сама перешивка выполняется в фоне (в пуле процессов или воркерами очереди)
+        и не задерживает transform и load.
+
+        Args:
+            data: «сырые» данные из PG
+        """
+
+        jobs = transcode_jobs(data)
+        if jobs:
+            self.transcoder.submit(jobs)
+            logger.info('Packaging jobs have been queued: %s', len(jobs))
+
+    @property
+    def elastic(self) -> Elasticsearch:
+
+        """
+        Клиент ElasticSearch.
+        Создаётся один раз на всё время жизни процесса (с пулом соединений и сжатием HTTP),
+        поэтому мы не открываем новые сокеты на каждую пачку.
+
+        Returns:
+            Вернёт клиент ElasticSearch.
+        """
+
+        if self._elastic is None:
+            self._elastic = Elasticsearch(
+                self.elastic_search_address,
+                http_compress=self.load_parameters.http_compress,
+                maxsize=self.load_parameters.connections_per_node,
+            )
+            logger.info('Elastic connection has been created: %s', self.elastic_search_address)
+        return self._elastic
+
+    @backoff(retry_on=ELASTIC_ERRORS, breaker='elastic')
+    def load(self, data: List[IndexDocument]) -> List[dict]:
 
         """
         Функция реализует «load» задачу ETL.
         Т.е. подключается к ES и загружает в него данные data.
 
+        Документы, которые не изменились с прошлой загрузки (по хэшам содержимого), не отправляются,
+        а у изменившихся отправляются только изменившиеся поля (update с doc_as_upsert).
+        Хэши запоминаются только для документов, которые ES подтвердил,
+        и сбрасываются, если индекс пересоздан (у него другой UUID).
+
         Для более быстрой работы используем загрузку пачками (bulk).
+        В режимах 'streaming' и 'parallel' пачка режется на bulk запросы по размеру в байтах.
+        Ошибки по отдельным документам (например, ошибки маппинга) не прерывают загрузку, а возвращаются списком:
+        это не недоступность ES, и backoff их не повторяет.
+        Удаление документа, которого уже нет в индексе прежнего языка, ошибкой не считается.
 
         Args:
-            data: данные, которые нужно загрузить.
+            data: документы, которые нужно загрузить.
+
+        Returns:
+            Вернёт список документов, которые ES отказался загрузить.
+        """
+
+        self.hashes.track(self._index_uuids({document.index_name for document in data}))
+        actions = self.hashes.changes(data)
+        if not actions:
+            logger.info('Pack has not been sent: documents have not changed.')
+            return []
+
+        failures = [item for ok, item in self._bulk_results(actions) if not ok and not already_deleted(item)]
+        for failure in failures:
+            logger.error('Document has not been loaded: %s', failure)
+        self.hashes.remember(data, failures)
+        record_bulk(actions, failures)
+
+        logger.info('Pack has been sent. Failed documents: %s', len(failures))
+        return failures
+
+    def _index_uuids(self, names: Set[str]) -> Dict[str, str]:
+
         """
+        Метод узнаёт UUID индексов ES (индекс может быть и псевдонимом — тогда берётся UUID индекса под ним).
+
+        Args:
+            names: названия индексов пачки
+
+        Returns:
+            Вернёт UUID по названию (пустая строка — индекса ещё нет, его создаст bulk).
+        """
+
+        uuids = dict.fromkeys(names, '')
+        if not names:
+            return uuids
+        response = self.elastic.indices.get(
+            index=','.join(sorted(names)),
+            ignore_unavailable=True,
+            filter_path=['*.settings.index.uuid', '*.aliases'],
+        )
+        for index_name, index in response.items():
+            uuid = index['settings']['index']['uuid']
+            for name in names.intersection({index_name, *index.get('aliases', {})}):
+                uuids[name] = uuid
+        return uuids
+
+    def _bulk_results(self, data: List[Action]) -> Iterator[Tuple[bool, dict]]:
+
+        """
+        Метод отправляет данные через bulk, streaming_bulk или parallel_bulk.
+        Ошибки транспорта (ES недоступен) пробрасываются наверх — их обработает backoff.
+        Ошибки по документам во всех режимах возвращаются в итераторе (ok — False).
+
+        Args:
+            data: bulk действия, которые нужно загрузить.
+
+        Returns:
+            Вернёт итератор пар (успех, ответ ES по документу).
+        """
+
+        parameters = self.load_parameters
+        chunk_limits = {
+            'chunk_size': parameters.chunk_size,
+            'max_chunk_bytes': parameters.max_chunk_bytes,
+            'raise_on_error': False,
+            'expand_action_callback': expanded,
+        }
+
+        if parameters.load_mode == 'bulk':
+            _, errors = helpers.bulk(self.elastic, data, expand_action_callback=expanded, raise_on_error=False)
+            return iter([(False, error) for error in errors])
+
+        if parameters.load_mode == 'parallel':
+            return self._parallel_results(data, chunk_limits)
+
+        return helpers.streaming_bulk(self.elastic, data, max_retries=parameters.max_retries, **chunk_limits)
+
+    def _parallel_results(self, data: List[Action], chunk_limits: dict) -> Iterator[Tuple[bool, dict]]:
+
+        """
+        Метод отправляет данные через parallel_bulk.
+        В отличие от streaming_bulk, parallel_bulk не повторяет документы, отклонённые ES (429 Too Many Requests):
+        они отправляются повторно, не больше max_retries раз, с удваивающейся паузой.
+        Ответы parallel_bulk идут в порядке действий, поэтому отклонённые действия находятся по позиции.
+
+        Args:
+            data: bulk действия, которые нужно загрузить.
+            chunk_limits: ограничения bulk запросов
+
+        Yields:
+            Пары (успех, ответ ES по документу).
+        """
+
+        parameters = self.load_parameters
+        for attempt in range(parameters.max_retries + 1):
+            rejected = []
+            results = helpers.parallel_bulk(self.elastic, data, thread_count=parameters.thread_count, **chunk_limits)
+            for (ok, item), action in zip(results, data):
+                if ok or attempt == parameters.max_retries or not too_many_requests(item):
+                    yield ok, item
+                else:
+                    rejected.append(action)
+            if not rejected:
+                return
+            logger.info('Documents have been rejected with 429 and will be retried: %s', len(rejected))
+            sleep(min(INITIAL_BACKOFF * 2 ** attempt, MAX_BACKOFF))
+            data = rejected
+
+
+def transform_pack(data: List[Tuple[str, ...]], router: IndexRouter) -> Tuple[List[IndexDocument], str]:
+
+    """
+    Функция реализует «transform» задачу ETL.
+    Т.е. получает на вход данные из PG (data) и преобразует их в формат, подходящий ES.
+    Перекодирование видео сюда не входит — см. ETL.transcode.
+
+    Документы собираются прямо из кортежей строк (см. documents.py): поля сразу кодируются в json
+    и хэшируются, чтобы стадия load могла отправить только изменившиеся поля.
+    У каждой строки свой документ, и строка без изменений meta-data в ES не отправляется.
+    Документ попадает в индекс языка видео (см. IndexRouter).
+
+    Args:
+        data: «сырые» данные из PG
+        router: индексы ES по языкам, в которые будет происходить вставка документов
+
+    Returns:
+        Вернёт список трансформированных данных и максимальную дату пачки.
+    """
+
+    transformed_pack = build_documents(data, router)
+    logger.info('Metadata has been collected: %s of %s rows.', len(transformed_pack), len(data))
+
+    max_dates = [row[-1] for row in data]
+    return transformed_pack, max(f'{max_date}' for max_date in max_dates)
+
+
+def already_deleted(item: dict) -> bool:
+
+    """
+    Функция проверяет, что ES не нашёл документ, который нужно было удалить (из индекса прежнего языка).
+    Это не ошибка: документа там уже нет.
+
+    Args:
+        item: ответ ES по документу
+
+    Returns:
+        Вернёт True, если это удаление отсутствующего документа.
+    """
+
+    return item.get('delete', {}).get('status') == NOT_FOUND
+
+
+def too_many_requests(item: dict) -> bool:
+
+    """
+    Функция проверяет, что ES отклонил документ из-за перегрузки (429): его можно отправить ещё раз.
+
+    Args:
+        item: ответ ES по документу
+
+    Returns:
+        Вернёт True, если документ отклонён с кодом 429.
+    """
+
+    return next(iter(item.values()), {}).get('status') == TOO_MANY_REQUESTS
+
+
+def pack_checkpoint(data: List[Tuple[str, ...]]) -> Tuple[str, str]:
+
+    """
+    Функция вычисляет точку продолжения (checkpoint) для keyset режима.
+    Пачка отсортирована по паре (дата, id), поэтому точка — это пара последней строки.
+
+    Args:
+        data: «сырые» данные из PG
 
-        es = Elasticsearch(self.elastic_search_address)
-        logger.info('Elastic connection has been created: %s', self.elastic_search_address)
+    Returns:
+        Вернёт пару (время, id) последней строки пачки.
+    """
 
-        helpers.bulk(es, data)
-        logger.info('Pack has been sent.')
+    last_row = data[-1]
+    id_video, max_date = last_row[0], last_row[-1]
+    return f'{max_date}', f'{id_video}'
 
 
 logger = create_logger(__file__, stream_out=sys.stdout)
@@ -0,0 +1,139 @@
+"""Модуль содержит метрики ETL процесса: время стадий, строки, байты bulk, отказы ES и отставание от Postgres."""
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter, time
+from typing import Any, Callable, Iterator, List, Tuple
+
+from documents import Action
+from metrics import REGISTRY, Counter, Gauge, Histogram, format_sample
+
+STAGE_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class LagGauge(Gauge):
+
+    """
+    Класс датчика отставания.
+    Хранит время (unix), до которого все изменения Postgres уже загружены в ES (watermark),
+    а отдаёт разницу между текущим временем и ним — поэтому отставание растёт и между пачками.
+    """
+
+    def samples(self) -> List[str]:
+
+        """
+        Метод возвращает отставание на момент запроса метрик.
+
+        Returns:
+            Вернёт строки значений.
+        """
+
+        with self._lock:
+            watermarks = list(self._values.items())
+        now = time()
+        return [format_sample(self.name, labels, max(now - watermark, 0)) for labels, watermark in watermarks]
+
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram('etl_stage_seconds', 'Time spent on one pack by ETL stage.', STAGE_SECONDS_BUCKETS),
+)
+ROWS = REGISTRY.register(Counter('etl_rows_total', 'Rows extracted from Postgres.'))
+DOCUMENTS = REGISTRY.register(Counter('etl_documents_total', 'Documents built by the transform stage.'))
+BULK_ACTIONS = REGISTRY.register(Counter('etl_bulk_actions_total', 'Bulk actions sent to ElasticSearch by type.'))
+BULK_BYTES = REGISTRY.register(Counter('etl_bulk_bytes_total', 'Uncompressed bytes of bulk action bodies.'))
+BULK_REJECTIONS = REGISTRY.register(
+    Counter('etl_bulk_rejections_total', 'Documents rejected by ElasticSearch by status.'),
+)
+WATERMARK = REGISTRY.register(
+    Gauge('etl_watermark_timestamp_seconds', 'Time up to which Postgres changes are loaded into ElasticSearch.'),
+)
+LAG = REGISTRY.register(
+    LagGauge('etl_lag_seconds', 'Now minus the committed watermark: how far search is behind the admin.'),
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+
+    """
+    Контекстный менеджер, замеряющий время стадии (extract, transform или load) для одной пачки.
+
+    Args:
+        stage: название стадии
+
+    Yields:
+        Ничего: время блока with записывается в etl_stage_seconds.
+    """
+
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(perf_counter() - started, stage=stage)
+
+
+def timed(function: Callable, *args: Any) -> Tuple[Any, float]:
+
+    """
+    Функция выполняет function и замеряет её время.
+    Нужна там, где стадия выполняется в другом процессе (transform конвейера): метрики процесса пула
+    не видны, поэтому время возвращается вместе с результатом.
+
+    Args:
+        function: функция стадии
+        args: аргументы функции
+
+    Returns:
+        Вернёт результат функции и время её работы в секундах.
+    """
+
+    started = perf_counter()
+    stage_result = function(*args)
+    return stage_result, perf_counter() - started
+
+
+def record_bulk(actions: List[Action], failures: List[dict]) -> None:
+
+    """
+    Функция учитывает отправленные bulk действия: количество по типам, байты тел и отказы ES.
+
+    Args:
+        actions: bulk действия (строка действия и тело)
+        failures: ответы ES по документам, которые не загрузились
+    """
+
+    for action, body in actions:
+        BULK_ACTIONS.inc(action=next(iter(action)))
+        if body is not None:
+            BULK_BYTES.inc(len(body.encode()))
+    for failure in failures:
+        for item in failure.values():
+            BULK_REJECTIONS.inc(status=item.get('status', 'unknown'))
+
+
+def commit_watermark(checkpoint_time: str) -> None:
+
+    """
+    Функция сдвигает watermark на время последней загруженной строки (после того, как ES подтвердил пачку).
+
+    Args:
+        checkpoint_time: время из точки продолжения (updated_at строки)
+    """
+
+    try:
+        watermark = datetime.fromisoformat(checkpoint_time).timestamp()
+    except ValueError:  # Время не в формате ISO 8601 — watermark остаётся прежним.
+        return
+    WATERMARK.set(watermark)
+    LAG.set(watermark)
+
+
+def mark_caught_up() -> None:
+
+    """
+    Функция сдвигает watermark на текущее время: обход дошёл до конца, новых изменений в Postgres нет.
+    Пока ETL ждёт уведомления, отставание снова растёт — не больше, чем на poll_timeout.
+    """
+
+    watermark = time()
+    WATERMARK.set(watermark)
+    LAG.set(watermark)
@@ -1,57 +1,84 @@
 """Модуль содержит ETL процесс."""
+import signal
 import sys
-from time import sleep
+from threading import Event
+from typing import Any, Union
 
-from etl_class import ETL
+from documents import IndexRouter
+from etl_class import ETL, pack_checkpoint
+from etl_metrics import DOCUMENTS, ROWS, commit_watermark, mark_caught_up, stage_timer
+from job_queue import RedisJobQueue, create_job_queue
 from log import create_logger
+from metrics_server import start_metrics_server
 from models import config
-from state_storage import JsonFileStorage, State
+from notifications import ChangeListener, SleepWaiter
+from pipeline import Pipeline
+from state_storage import State, create_storage
+from transcoding import TranscodePool
+from video_converter import MediaConverter
 
 
-def main() -> None:  # noqa: WPS213, WPS210
+Waiter = Union[ChangeListener, SleepWaiter]
+
+# Событие остановки процесса. Его выставляет обработчик SIGTERM, а циклы ETL, конвейер и ожидание
+# изменений проверяют его и завершаются сами, после загруженной пачки.
+STOP = Event()
+
+
+def run_offset(etl: ETL, state: State, waiter: Waiter) -> None:  # noqa: WPS213, WPS210
 
     """
-    Функция реализует работу ETL процесса.
-    Подробнее см.
-    https://ru.wikipedia.org/wiki/ETL
-    """
+    Функция реализует работу ETL процесса в режиме LIMIT/OFFSET.
 
-    host = config.elastic_search_parameters.elastic_host
-    port = config.elastic_search_parameters.elastic_port
-    address = f'http://{host}:{port}'
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        state: хранилище состояния
+        waiter: способ ожидания новых данных
 
-    # Создаём экземпляр класса с интерфейсом ETL.
-    etl = ETL(config.postgres_parameters.dict(), address)
+    Raises:
+        RuntimeError: ES отказался загрузить документы пачки (точка продолжения не сдвигается)
+    """
 
     # Создаём стартовые значения для работы ETL процесса.
     # Переменная pack — размер пачки для вставки.
     # Переменная begin — место, с которого мы начинаем «обыск» данных в PG.
     # Переменная time — самое минимально возможное время последнего обновления.
-    # Переменная index_name — название индекса ES.
-    pack, begin, time, index_name = config.pack_size, 0, config.smallest_time, config.index_name
+    # Переменная router — индексы ES по языкам.
+    pack, begin, time, router = config.pack_size, 0, config.smallest_time, create_router()
 
-    # Создаём хранилище состояния (для времени).
-    state = State(JsonFileStorage('state.json'))
     state.set_state('time', time)
     all_dates = []
 
-    while True:
+    while not STOP.is_set():
 
         # Достаём данные из PG.
-        row_data = etl.extract(time_from_storage=time, pack_size=pack, begin=begin)
+        with stage_timer('extract'):
+            row_data = etl.extract(time_from_storage=time, pack_size=pack, begin=begin)
         logger.info('Data has been received.')
 
         if row_data:
 
             # Трансформируем данные в пригодный для ES формат.
-            transformed_data, new_date = etl.transform(row_data, index_name)
+            with stage_timer('transform'):
+                transformed_data, new_date = etl.transform(row_data, router)
             all_dates.append(new_date)
             logger.info('Data has been transformed.')
 
+            # Изменённые треки перешиваем в фоне.
+            etl.transcode(row_data)
+
             # Записываем данные в ES.
-            etl.load(transformed_data)
+            with stage_timer('load'):
+                failures = etl.load(transformed_data)
+            if failures:
+                raise RuntimeError('Documents have not been loaded: {0}.'.format(len(failures)))
             logger.info('Data has been loaded.')
 
+            # Строки выбираются без сортировки по дате, поэтому загружено наверняка только то, что изменилось
+            # до начала обхода (time): watermark — это время, а не максимальная дата пачки.
+            commit_watermark(time)
+            ROWS.inc(len(row_data))
+            DOCUMENTS.inc(len(transformed_data))
             begin += pack
 
         else:  # Если данных для вставки нет, то:
@@ -63,9 +90,210 @@ def main() -> None:  # noqa: WPS213, WPS210
             # Начинаем обход сначала.
             begin = 0
             time = state.get_state('time')
+            mark_caught_up()
 
             logger.info('No packs to insert. Last update %s', time)
-            sleep(10)  # Даём фору, что бы зря не долбать PG.
+            waiter.wait()
+
+
+def run_keyset(etl: ETL, state: State, waiter: Waiter) -> None:  # noqa: WPS210, WPS213
+
+    """
+    Функция реализует работу ETL процесса в постраничном (keyset) режиме.
+    Точка продолжения — пара (время, id) последней загруженной в ES строки.
+    Она сохраняется после каждой пачки, поэтому после перезапуска мы продолжаем с того же места.
+
+    Время начала обхода (sweep_time) сдвигается, только когда обход дошёл до конца:
+    относительно него считаются признаки изменений meta-data и треков.
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        state: хранилище состояния
+        waiter: способ ожидания новых данных
+
+    Raises:
+        RuntimeError: ES отказался загрузить документы пачки (точка продолжения не сдвигается)
+    """
+
+    pack, router = config.pack_size, create_router()
+    checkpoint = (
+        state.get_state('time') or config.smallest_time,
+        state.get_state('id') or config.smallest_id,
+    )
+    sweep_time = state.get_state('sweep_time') or config.smallest_time
+
+    while not STOP.is_set():
+
+        # Достаём данные из PG.
+        with stage_timer('extract'):
+            row_data = etl.extract_keyset(checkpoint=checkpoint, changed_since=sweep_time, pack_size=pack)
+        logger.info('Data has been received.')
+
+        if row_data:
+
+            # Трансформируем данные в пригодный для ES формат.
+            with stage_timer('transform'):
+                transformed_data, _ = etl.transform(row_data, router)
+            logger.info('Data has been transformed.')
+
+            # Изменённые треки перешиваем в фоне.
+            etl.transcode(row_data)
+
+            # Записываем данные в ES.
+            with stage_timer('load'):
+                failures = etl.load(transformed_data)
+            if failures:
+                raise RuntimeError('Documents have not been loaded: {0}.'.format(len(failures)))
+            logger.info('Data has been loaded.')
+
+            # Сдвигаем точку продолжения только после успешной загрузки.
+            checkpoint = pack_checkpoint(row_data)
+            state.set_states({'time': checkpoint[0], 'id': checkpoint[1]})
+            commit_watermark(checkpoint[0])
+            ROWS.inc(len(row_data))
+            DOCUMENTS.inc(len(transformed_data))
+
+        else:  # Обход закончен — следующий начнётся с последней загруженной даты.
+
+            sweep_time = checkpoint[0]
+            state.set_state('sweep_time', sweep_time)
+            mark_caught_up()
+
+            logger.info('No packs to insert. Last update %s', sweep_time)
+            waiter.wait()
+
+
+def run_pipeline(etl: ETL, state: State, waiter: Waiter) -> None:
+
+    """
+    Функция реализует работу ETL процесса в keyset режиме на конвейере (см. pipeline.py).
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        state: хранилище состояния
+        waiter: способ ожидания новых данных
+    """
+
+    pipeline = Pipeline(
+        etl,
+        state,
+        router=create_router(),
+        pack_size=config.pack_size,
+        waiter=waiter,
+        workers=config.transform_workers,
+        queue_size=config.queue_size,
+        shutdown=STOP,
+    )
+    checkpoint = (
+        state.get_state('time') or config.smallest_time,
+        state.get_state('id') or config.smallest_id,
+    )
+    pipeline.run(checkpoint, state.get_state('sweep_time') or config.smallest_time)
+
+
+def stop(signum: int, frame: Any) -> None:
+
+    """
+    Функция-обработчик SIGTERM: просит ETL остановиться (см. STOP) и возвращается.
+    Процесс не прерывается посреди пачки: циклы ETL доходят до конца текущей пачки и выходят,
+    после чего main записывает отложенное состояние.
+
+    Args:
+        signum: номер сигнала
+        frame: текущий кадр стека
+    """
+
+    logger.info('Signal %s has been received, stopping.', signum)
+    STOP.set()
+
+
+def create_router() -> IndexRouter:
+
+    """
+    Функция создаёт маршрутизатор документов по индексам языков из настроек.
+
+    Returns:
+        Вернёт индексы ES по языкам.
+    """
+
+    return IndexRouter(config.index_name, tuple(config.languages), config.default_language)
+
+
+def create_transcoder() -> Union[TranscodePool, RedisJobQueue]:
+
+    """
+    Функция создаёт получателя задач на перекодирование по настройкам.
+
+    Returns:
+        Вернёт пул процессов или очередь Redis (её разбирает transcode_worker.py).
+    """
+
+    parameters = config.transcode_parameters
+
+    if parameters.transcode_mode == 'queue':
+        return create_job_queue(parameters, config.redis_parameters)
+
+    return TranscodePool(
+        workers=parameters.transcode_workers,
+        niceness=parameters.transcode_niceness,
+        media_dir=parameters.media_dir,
+        streams_dir=parameters.streams_dir,
+        converter=MediaConverter(
+            parameters.segment_duration,
+            parameters.hls_playlist,
+            parameters.rendition_workers,
+            parameters.chunk_duration,
+            parameters.chunk_workers,
+            parameters.remux,
+        ),
+    )
+
+
+def main() -> None:
+
+    """
+    Функция реализует работу ETL процесса.
+    Подробнее см.
+    https://ru.wikipedia.org/wiki/ETL
+    """
+
+    host = config.elastic_search_parameters.elastic_host
+    port = config.elastic_search_parameters.elastic_port
+    address = f'http://{host}:{port}'
+
+    # Создаём экземпляр класса с интерфейсом ETL.
+    etl = ETL(
+        config.postgres_parameters.dict(),
+        address,
+        config.itersize,
+        config.pool_size,
+        config.load_parameters,
+        create_transcoder(),
+    )
+
+    # Создаём хранилище состояния (для времени).
+    state = State(create_storage(config), config.state_compare_and_set)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Метрики стадий, отставания и итогов запусков ffmpeg — на GET /metrics.
+    # Живой прогресс ffmpeg из процессов пула (transcode_mode='pool') виден только в логе.
+    start_metrics_server(config.metrics_port)
+
+    # Когда данных нет — ждём уведомления от PG (или просто спим).
+    waiter: Waiter = SleepWaiter(config.poll_timeout, STOP)
+    if config.wake_mode == 'notify':
+        waiter = ChangeListener(config.postgres_parameters.dict(), config.notify_channel, config.poll_timeout, STOP)
+
+    if config.extract_mode == 'offset':
+        run_offset(etl, state, waiter)
+    elif config.engine == 'pipeline':
+        run_pipeline(etl, state, waiter)
+    else:
+        run_keyset(etl, state, waiter)
+
+    # Сюда попадаем только после SIGTERM: записываем отложенное состояние явно, не полагаясь на atexit.
+    state.flush()
+    logger.info('ETL has been stopped.')
 
 
 logger = create_logger(__file__, stream_out=sys.stdout)
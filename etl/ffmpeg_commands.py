@@ -0,0 +1,319 @@
+"""Модуль содержит сборку команд ffmpeg для упаковки видео."""
+import math
+import shutil
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from ffmpeg_streaming import Formats
+
+DASH_MANIFEST = 'dash.mpd'
+HLS_MASTER = 'master.m3u8'
+DASH_SEGMENTS = MappingProxyType({
+    'use_timeline': 1,
+    'use_template': 1,
+    'init_seg_name': 'init_$RepresentationID$.$ext$',
+    'media_seg_name': 'chunk_$RepresentationID$_$Number%05d$.$ext$',
+})
+
+# Сцены не ставят лишних ключевых кадров: ключевые кадры всех представлений только на границах сегментов.
+ENCODER = Formats.h264(sc_threshold=0)
+
+
+class Rendition(NamedTuple):
+
+    """Представление: разрешение, битрейт видео (кбит/с) и копировать ли исходник без перекодирования."""
+
+    width: int
+    height: int
+    bitrate: int
+    copy: bool = False
+
+    @property
+    def size(self) -> str:
+
+        """
+        Свойство возвращает разрешение в формате ffmpeg.
+
+        Returns:
+            Вернёт разрешение (ШИРИНАxВЫСОТА).
+        """
+
+        return f'{self.width}x{self.height}'
+
+
+@lru_cache(maxsize=None)
+def find_binary(name: str) -> str:
+
+    """
+    Функция ищет исполняемый файл (ffmpeg, ffprobe) в PATH.
+    Результат кешируется: поиск выполняется один раз на процесс, а не на каждое видео.
+
+    Args:
+        name: название исполняемого файла
+
+    Returns:
+        Вернёт полный путь до исполняемого файла.
+
+    Raises:
+        FileNotFoundError: исполняемый файл не найден
+    """
+
+    binary = shutil.which(name)
+    if binary is None:
+        raise FileNotFoundError(f'{name} has not been found in PATH.')
+    return binary
+
+
+def to_arguments(options: Mapping[str, Union[str, int, None]]) -> List[str]:
+
+    """
+    Функция превращает словарь опций в аргументы командной строки ffmpeg.
+
+    Args:
+        options: опции ffmpeg (без ведущего дефиса)
+
+    Returns:
+        Вернёт список аргументов.
+    """
+
+    arguments = []
+    for option, argument in options.items():
+        arguments.append(f'-{option}')
+        if argument is not None:
+            arguments.append(f'{argument}')
+    return arguments
+
+
+def dash_command(  # noqa: WPS211
+    video_track: str,
+    audio_track: str,
+    output: str,
+    representations: List[Rendition],
+    segment_duration: float = 4,
+    hls_master: Optional[str] = None,
+    aligned: Optional[List[float]] = None
+) -> List[str]:
+
+    """
+    Функция собирает команду ffmpeg, упаковывающую треки в MPEG-DASH без промежуточного контейнера.
+
+    Каждое представление (representation) — это отдельный видеопоток из первого входа,
+    аудио кодируется один раз и попадает в свой adaptation set.
+    Сегменты пишутся во фрагментированный mp4 (CMAF), ключевые кадры расставляются
+    на границах сегментов, поэтому сегменты всех представлений выровнены.
+
+    Если задан hls_master, рядом с dash.mpd пишется мастер-плейлист HLS (и плейлисты представлений),
+    которые ссылаются на те же сегменты: одно кодирование, одно хранилище, два протокола.
+
+    Представление с copy не перекодируется, а копируется из исходника.
+
+    Args:
+        video_track: путь до видео трека
+        audio_track: путь до аудио трека
+        output: путь до манифеста
+        representations: представления (разрешение и битрейт)
+        segment_duration: длительность сегмента в секундах
+        hls_master: название мастер-плейлиста HLS
+        aligned: ключевые кадры на заданных отметках времени (см. key_frames)
+
+    Returns:
+        Вернёт команду ffmpeg.
+    """
+
+    command = [find_binary('ffmpeg'), '-y', '-i', video_track, '-i', audio_track]
+    command += to_arguments(ENCODER.all)
+    forced_key_frames = key_frames(segment_duration, aligned=aligned)
+
+    for key, representation in enumerate(representations):
+        command += ['-map', '0:v:0']
+        if representation.copy:
+            command += [f'-c:v:{key}', 'copy']
+            continue
+        # Ключевые кадры задаются каждому потоку: общий список отметок ffmpeg применяет не ко всем потокам.
+        command += to_arguments({
+            f's:v:{key}': representation.size,
+            f'b:v:{key}': f'{representation.bitrate}k',
+            f'force_key_frames:v:{key}': forced_key_frames,
+        })
+    command += ['-map', '1:a:0']
+
+    return command + dash_output(output, segment_duration, hls_master)
+
+
+def dash_output(output: str, segment_duration: float, hls_master: Optional[str] = None) -> List[str]:
+
+    """
+    Функция собирает выходные опции ffmpeg для MPEG-DASH (и HLS на тех же сегментах).
+
+    Args:
+        output: путь до манифеста
+        segment_duration: длительность сегмента в секундах
+        hls_master: название мастер-плейлиста HLS
+
+    Returns:
+        Вернёт список аргументов.
+    """
+
+    arguments = to_arguments(DASH_SEGMENTS)
+    arguments += ['-seg_duration', f'{segment_duration}', '-dash_segment_type', 'mp4']
+    if hls_master is not None:
+        arguments += ['-hls_playlist', '1', '-hls_master_name', hls_master]
+
+    arguments += ['-adaptation_sets', 'id=0,streams=v id=1,streams=a', '-strict', '-2', '-f', 'dash', output]
+    return arguments
+
+
+def rendition_command(
+    video_track: str,
+    renditions: List[Tuple[str, Rendition]],
+    forced_key_frames: str,
+    threads: int = 0,
+    window: Optional[Tuple[float, Optional[float]]] = None
+) -> List[str]:
+
+    """
+    Функция собирает команду ffmpeg, кодирующую группу представлений в отдельные mp4 (без звука).
+    Исходник декодируется один раз на группу, каждое представление пишется в свой файл
+    (представление с copy копируется из исходника без перекодирования).
+    Ключевые кадры ставятся на те же отметки времени, что и в остальных группах,
+    поэтому при упаковке сегменты всех представлений совпадают.
+
+    Args:
+        video_track: путь до видео трека
+        renditions: пары (путь до файла представления, представление)
+        forced_key_frames: значение -force_key_frames (см. key_frames)
+        threads: сколько потоков отдать кодеку на каждое представление (0 — решает кодек)
+        window: кодировать только кусок исходника (начало, конец) в секундах, конец None — до конца файла
+
+    Returns:
+        Вернёт команду ffmpeg.
+    """
+
+    command = [find_binary('ffmpeg'), '-y']
+    if window is not None:
+        start, end = window
+        command += ['-ss', f'{start}']
+        command += [] if end is None else ['-to', f'{end}']
+    command += ['-i', video_track]
+
+    for output, representation in renditions:
+        command += ['-map', '0:v:0', '-an']
+        if representation.copy:
+            command += ['-c:v', 'copy', output]
+            continue
+        command += to_arguments(ENCODER.all)
+        command += ['-force_key_frames', forced_key_frames]
+        command += to_arguments({
+            's': representation.size,
+            'b:v': f'{representation.bitrate}k',
+            'threads': threads,
+        })
+        command.append(output)
+    return command
+
+
+def key_frames(segment_duration: float, offset: float = 0, aligned: Optional[List[float]] = None) -> str:
+
+    """
+    Функция возвращает значение -force_key_frames: ключевой кадр на каждой границе сегмента.
+    Для куска исходника (offset — его начало) границы считаются по времени всего видео,
+    поэтому после склейки кусков сегменты остаются выровненными.
+
+    Если одно из представлений копируется из исходника, его ключевые кадры уже заданы:
+    тогда остальные представления получают ключевые кадры на тех же отметках (aligned).
+
+    Args:
+        segment_duration: длительность сегмента в секундах
+        offset: с какой секунды исходника начинается кодируемый кусок
+        aligned: отметки времени ключевых кадров в секундах от начала видео
+
+    Returns:
+        Вернёт значение для -force_key_frames.
+    """
+
+    if aligned is not None:
+        moments = ['{0:.3f}'.format(moment - offset) for moment in aligned if moment >= offset]
+        return ','.join(moments) if moments else '0'
+
+    first = math.ceil(offset / segment_duration)
+    return f'expr:gte(t+{offset},(n_forced+{first})*{segment_duration})'
+
+
+def audio_command(audio_track: str, output: str) -> List[str]:
+
+    """
+    Функция собирает команду ffmpeg, кодирующую аудио трек в отдельный mp4.
+
+    Args:
+        audio_track: путь до аудио трека
+        output: путь до файла
+
+    Returns:
+        Вернёт команду ffmpeg.
+    """
+
+    return [find_binary('ffmpeg'), '-y', '-i', audio_track, '-map', '0:a:0', '-vn', '-c:a', 'aac', output]
+
+
+def mux_command(  # noqa: WPS211
+    renditions: List[str],
+    audio: str,
+    output: str,
+    segment_duration: float = 4,
+    hls_master: Optional[str] = None,
+    concat: bool = False
+) -> List[str]:
+
+    """
+    Функция собирает команду ffmpeg, упаковывающую уже закодированные представления в один манифест.
+    Перекодирования нет (-c copy): ffmpeg только нарезает сегменты и пишет dash.mpd (и HLS).
+
+    Args:
+        renditions: пути до файлов представлений (или до списков кусков для concat)
+        audio: путь до закодированного аудио
+        output: путь до манифеста
+        segment_duration: длительность сегмента в секундах
+        hls_master: название мастер-плейлиста HLS
+        concat: представления заданы списками кусков (ffconcat), которые склеиваются в один поток
+
+    Returns:
+        Вернёт команду ffmpeg.
+    """
+
+    demuxer = ['-f', 'concat', '-safe', '0'] if concat else []
+    inputs = [argument for source in renditions for argument in (*demuxer, '-i', source)]
+    maps = [argument for key, _ in enumerate(renditions) for argument in ('-map', f'{key}:v:0')]
+    audio_input = len(renditions)
+    audio_map = ['-map', f'{audio_input}:a:0']
+
+    command = [find_binary('ffmpeg'), '-y', *inputs, '-i', audio, *maps, *audio_map, '-c', 'copy']
+
+    return command + dash_output(output, segment_duration, hls_master)
+
+
+def keyframes_command(video_track: str) -> List[str]:
+
+    """
+    Функция собирает команду ffprobe, выводящую пакеты видео трека (время и флаги) в json.
+    Читаются только заголовки пакетов, без декодирования, поэтому это быстро даже для длинных файлов.
+
+    Args:
+        video_track: путь до видео трека
+
+    Returns:
+        Вернёт команду ffprobe.
+    """
+
+    return [
+        find_binary('ffprobe'),
+        '-v',
+        'error',
+        '-select_streams',
+        'v:0',
+        '-show_entries',
+        'packet=pts_time,flags',
+        '-of',
+        'json',
+        video_track,
+    ]
@@ -0,0 +1,136 @@
+"""Модуль содержит отпечатки (fingerprint) исходных треков, чтобы не перекодировать одно и то же."""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+CHUNK_SIZE = 1024 * 1024  # Файл хешируется кусками, а не читается в память целиком.
+FINGERPRINT_FILE = 'source.json'  # Лежит рядом с dash.mpd.
+PACKAGING = 'packaging'  # Ключ отпечатка с параметрами упаковки (сегменты, HLS, лестница).
+
+
+def file_digest(path: Path) -> str:
+
+    """
+    Функция считает sha256 файла, читая его кусками по CHUNK_SIZE.
+
+    Args:
+        path: путь до файла
+
+    Returns:
+        Вернёт sha256 в шестнадцатеричном виде.
+    """
+
+    digest = hashlib.sha256()
+    with path.open('rb') as source:
+        chunk = source.read(CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = source.read(CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+def fingerprint_sources(
+    sources: Dict[str, str],
+    stored: Optional[dict] = None,
+    packaging: Optional[dict] = None
+) -> dict:
+
+    """
+    Функция строит отпечаток исходных треков: размер, время изменения и sha256 каждого файла.
+    Если размер и время изменения совпали с сохранённым отпечатком — sha256 берётся из него,
+    так что многогигабайтный файл хешируется, только когда он действительно мог измениться.
+    В отпечаток входят и параметры упаковки: при их смене поток упаковывается заново.
+
+    Args:
+        sources: пути до треков по их названию (video, audio)
+        stored: сохранённый ранее отпечаток
+        packaging: параметры упаковки (см. MediaConverter.packaging)
+
+    Returns:
+        Вернёт отпечаток треков.
+    """
+
+    stored = stored if stored else {}
+    fingerprint = {}
+
+    for name, source in sources.items():
+        path = Path(source)
+        stat = path.stat()
+        previous = stored.get(name, {})
+
+        if previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime_ns:
+            digest = previous['sha256']
+        else:
+            digest = file_digest(path)
+
+        fingerprint[name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest}
+
+    if packaging is not None:
+        fingerprint[PACKAGING] = packaging
+    return fingerprint
+
+
+def same_content(stored: Optional[dict], fingerprint: dict) -> bool:
+
+    """
+    Функция сравнивает содержимое треков и параметры упаковки по отпечаткам (время изменения не учитывается).
+
+    Args:
+        stored: сохранённый ранее отпечаток
+        fingerprint: текущий отпечаток
+
+    Returns:
+        Вернёт True, если параметры упаковки совпадают, а все треки совпадают по размеру и sha256.
+    """
+
+    if not stored or stored.keys() != fingerprint.keys():
+        return False
+    if stored.get(PACKAGING) != fingerprint.get(PACKAGING):
+        return False
+
+    content_fields = ('size', 'sha256')
+    return all(
+        [stored[name].get(field) for field in content_fields] == [track[field] for field in content_fields]
+        for name, track in fingerprint.items()
+        if name != PACKAGING
+    )
+
+
+def read_fingerprint(stream_dir: Path) -> Optional[dict]:
+
+    """
+    Функция читает отпечаток, сохранённый рядом с манифестом.
+
+    Args:
+        stream_dir: директория потока
+
+    Returns:
+        Вернёт отпечаток или None, если его нет (или он повреждён).
+    """
+
+    fingerprint_file = stream_dir / FINGERPRINT_FILE
+    if not fingerprint_file.exists():
+        return None
+
+    try:
+        return json.loads(fingerprint_file.read_text())
+    except ValueError:
+        return None
+
+
+def write_fingerprint(stream_dir: Path, fingerprint: dict) -> None:
+
+    """
+    Функция атомарно сохраняет отпечаток рядом с манифестом (через временный файл и rename).
+
+    Args:
+        stream_dir: директория потока
+        fingerprint: отпечаток треков
+    """
+
+    stream_dir.mkdir(parents=True, exist_ok=True)
+    temporary = stream_dir / f'{FINGERPRINT_FILE}.tmp'
+    temporary.write_text(json.dumps(fingerprint))
+    os.replace(temporary, stream_dir / FINGERPRINT_FILE)
@@ -0,0 +1,306 @@
+"""Модуль содержит надёжную очередь задач на перекодирование, хранящуюся в Redis."""
+import json
+import sys
+from time import time
+from typing import List, NamedTuple, Optional
+from uuid import uuid4
+
+from redis import ConnectionError as RedisConnectionError
+from redis import Redis
+from redis import TimeoutError as RedisTimeoutError
+
+from backoff_function import backoff
+from log import create_logger
+from models import RedisSettings, TranscodeSettings
+from transcoding import TranscodeJob
+
+# Ошибки Redis, которые повторяет backoff.
+REDIS_ERRORS = (RedisConnectionError, RedisTimeoutError)
+
+# Забрать первую задачу, готовую к выполнению, и выдать на неё аренду (lease) с токеном.
+# Задачи по видео, которое прямо сейчас перекодирует другой воркер, пропускаются. Таких задач не больше,
+# чем воркеров, но очередь всё равно просматривается страницами по ARGV[4], пока задача не найдётся.
+CLAIM_SCRIPT = """
+local offset = 0
+local page = tonumber(ARGV[4])
+repeat
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', offset, page)
+    for _, id in ipairs(ids) do
+        if not redis.call('ZSCORE', KEYS[2], id) then
+            redis.call('ZREM', KEYS[1], id)
+            redis.call('ZADD', KEYS[2], ARGV[2], id)
+            redis.call('HSET', KEYS[4], id, ARGV[3])
+            return {id, redis.call('HGET', KEYS[3], id)}
+        end
+    end
+    offset = offset + #ids
+until #ids < page
+return false
+"""
+CLAIM_PAGE = 100
+
+# Вернуть в очередь задачи, аренда которых истекла (воркер упал или завис).
+REQUEUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[1], id)
+end
+return #ids
+"""
+
+# Продлить аренду, если она ещё наша (токен совпадает).
+EXTEND_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+return 1
+"""
+
+# Завершить задачу. Если за время работы по видео пришла новая задача — она остаётся в очереди.
+# Аренда должна быть нашей (токен совпадает): иначе задачу уже вернули в очередь или забрал другой воркер.
+ACK_SCRIPT = """
+if redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[5], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('HDEL', KEYS[3], ARGV[1])
+end
+return 1
+"""
+
+# Отметить неудачную попытку. Задача возвращается в очередь с задержкой (растёт с каждой попыткой)
+# или, если попытки кончились, откладывается в failed. Версия задачи удаляется вместе с ней,
+# если за время работы по видео не пришла новая задача. Возвращает номер попытки (0 — аренда уже не наша).
+FAIL_SCRIPT = """
+if redis.call('HGET', KEYS[6], ARGV[1]) ~= ARGV[6] then
+    return 0
+end
+redis.call('HDEL', KEYS[6], ARGV[1])
+local attempts = redis.call('HINCRBY', KEYS[4], ARGV[1], 1)
+redis.call('ZREM', KEYS[2], ARGV[1])
+if attempts >= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[5], ARGV[1], ARGV[2])
+    redis.call('HDEL', KEYS[4], ARGV[1])
+    if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+        redis.call('HDEL', KEYS[3], ARGV[1])
+    end
+else
+    redis.call('ZADD', KEYS[1], 'NX', tonumber(ARGV[4]) + tonumber(ARGV[5]) * attempts, ARGV[1])
+end
+return attempts
+"""
+
+
+class Lease(NamedTuple):
+
+    """Задача, взятая в аренду: token отличает эту аренду от следующих аренд той же задачи."""
+
+    job: TranscodeJob
+    token: str
+
+
+class RedisJobQueue:  # noqa: WPS230
+
+    """
+    Класс очереди задач на перекодирование в Redis.
+
+    Очередь переживает перезапуск ETL и воркеров:
+    задача удаляется только после того, как воркер подтвердил её выполнение (ack).
+    Воркер берёт задачу в аренду (lease) и продлевает её, пока работает;
+    если воркер упал — аренда истекает и задачу заберёт другой воркер.
+    У каждой аренды свой токен: extend, ack и fail действуют, только если аренда ещё не истекла,
+    поэтому «опоздавший» воркер не удалит и не отложит задачу, которую уже выполняет другой,
+    а повтор ack или fail после сбоя соединения безопасен.
+    Неудачные задачи повторяются с задержкой, а после max_attempts попыток откладываются в failed.
+
+    Ключи в Redis (namespace — название очереди):
+        {namespace}:pending — задачи, ждущие выполнения (ZSET, score — время, раньше которого не начинать)
+        {namespace}:leases — задачи в работе (ZSET, score — время окончания аренды)
+        {namespace}:tokens — токены текущих аренд (HASH)
+        {namespace}:jobs — последние версии задач по каждому видео (HASH)
+        {namespace}:attempts — количество неудачных попыток (HASH)
+        {namespace}:failed — задачи, исчерпавшие попытки, с текстом ошибки (HASH)
+    """
+
+    def __init__(
+        self,
+        redis_adapter: Redis,
+        namespace: str = 'transcode',
+        lease_seconds: float = 60,
+        max_attempts: int = 5,
+        retry_delay: float = 30
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            redis_adapter: объект соединения с Redis
+            namespace: название очереди (префикс ключей Redis)
+            lease_seconds: на сколько секунд выдаётся аренда задачи
+            max_attempts: сколько раз пробовать выполнить задачу
+            retry_delay: задержка перед повтором задачи (растёт с каждой попыткой)
+        """
+
+        self.redis_adapter = redis_adapter
+        self.lease_seconds, self.max_attempts, self.retry_delay = lease_seconds, max_attempts, retry_delay
+
+        self.pending_key, self.leases_key = f'{namespace}:pending', f'{namespace}:leases'
+        self.jobs_key, self.attempts_key = f'{namespace}:jobs', f'{namespace}:attempts'
+        self.failed_key, self.tokens_key = f'{namespace}:failed', f'{namespace}:tokens'
+
+        self._claim = redis_adapter.register_script(CLAIM_SCRIPT)
+        self._requeue = redis_adapter.register_script(REQUEUE_SCRIPT)
+        self._extend = redis_adapter.register_script(EXTEND_SCRIPT)
+        self._ack = redis_adapter.register_script(ACK_SCRIPT)
+        self._fail = redis_adapter.register_script(FAIL_SCRIPT)
+
+    @backoff(retry_on=REDIS_ERRORS, breaker='redis')
+    def submit(self, jobs: List[TranscodeJob]) -> None:
+
+        """
+        Метод ставит задачи в очередь (одним запросом к Redis, транзакцией: повтор после сбоя безопасен).
+        Повторная задача по тому же видео заменяет ещё не начатую (перекодируем только последнюю версию).
+
+        Args:
+            jobs: задачи на перекодирование
+        """
+
+        pipeline = self.redis_adapter.pipeline()
+        for job in jobs:
+            pipeline.hset(self.jobs_key, job.id_video, json.dumps(list(job)))
+            pipeline.hdel(self.attempts_key, job.id_video)
+            pipeline.hdel(self.failed_key, job.id_video)
+            pipeline.zadd(self.pending_key, {job.id_video: time()}, nx=True)
+        pipeline.execute()
+
+    def claim(self) -> Optional[Lease]:
+
+        """
+        Метод берёт в аренду первую готовую к выполнению задачу.
+
+        Returns:
+            Вернёт аренду задачи или None, если выполнять нечего.
+        """
+
+        now, token = time(), uuid4().hex
+        claimed = self._claim(
+            keys=[self.pending_key, self.leases_key, self.jobs_key, self.tokens_key],
+            args=[now, now + self.lease_seconds, token, CLAIM_PAGE],
+        )
+        if not claimed:
+            return None
+
+        _, job = claimed
+        return Lease(TranscodeJob(*json.loads(job)), token)
+
+    def extend(self, lease: Lease) -> bool:
+
+        """
+        Метод продлевает аренду задачи (воркер ещё работает над ней).
+
+        Args:
+            lease: аренда задачи
+
+        Returns:
+            Вернёт False, если аренда уже истекла (задача вернулась в очередь).
+        """
+
+        extended = self._extend(
+            keys=[self.leases_key, self.tokens_key],
+            args=[lease.job.id_video, lease.token, time() + self.lease_seconds],
+        )
+        return bool(extended)
+
+    @backoff(retry_on=REDIS_ERRORS, breaker='redis')
+    def ack(self, lease: Lease) -> None:
+
+        """
+        Метод подтверждает выполнение задачи и удаляет её из очереди.
+
+        Args:
+            lease: аренда задачи
+        """
+
+        acked = self._ack(
+            keys=[self.pending_key, self.leases_key, self.jobs_key, self.attempts_key, self.tokens_key],
+            args=[lease.job.id_video, lease.token],
+        )
+        if not acked:
+            logger.warning('Lease of %s has been lost before ack: the job stays queued.', lease.job.id_video)
+
+    @backoff(retry_on=REDIS_ERRORS, breaker='redis')
+    def fail(self, lease: Lease, error: str) -> None:
+
+        """
+        Метод отмечает неудачную попытку (одним скриптом Lua, атомарно).
+        Задача возвращается в очередь с задержкой или, если попытки кончились, откладывается в failed.
+
+        Args:
+            lease: аренда задачи
+            error: текст ошибки
+        """
+
+        id_video = lease.job.id_video
+        attempts = self._fail(
+            keys=[
+                self.pending_key, self.leases_key, self.jobs_key, self.attempts_key, self.failed_key, self.tokens_key,
+            ],
+            args=[id_video, error, self.max_attempts, time(), self.retry_delay, lease.token],
+        )
+        if attempts >= self.max_attempts:
+            logger.error('Job %s has failed %s times, giving up: %s', id_video, attempts, error)
+        elif attempts:
+            logger.warning('Job %s has failed (attempt %s), will retry: %s', id_video, attempts, error)
+        else:
+            logger.warning('Lease of %s has been lost before fail: the attempt is not counted.', id_video)
+
+    def requeue_expired(self) -> int:
+
+        """
+        Метод возвращает в очередь задачи, аренда которых истекла.
+
+        Returns:
+            Вернёт количество возвращённых задач.
+        """
+
+        requeued = self._requeue(keys=[self.pending_key, self.leases_key, self.tokens_key], args=[time()])
+        if requeued:
+            logger.warning('Expired jobs have been requeued: %s', requeued)
+        return requeued
+
+
+def create_job_queue(parameters: TranscodeSettings, redis_parameters: RedisSettings) -> RedisJobQueue:
+
+    """
+    Функция создаёт очередь задач на перекодирование по настройкам.
+
+    Args:
+        parameters: настройки перекодирования
+        redis_parameters: настройки Redis
+
+    Returns:
+        Вернёт очередь задач.
+    """
+
+    redis_adapter = Redis(
+        host=redis_parameters.redis_host,
+        port=redis_parameters.redis_port,
+        db=redis_parameters.redis_db,
+    )
+    return RedisJobQueue(
+        redis_adapter,
+        namespace=parameters.queue_name,
+        lease_seconds=parameters.lease_seconds,
+        max_attempts=parameters.max_attempts,
+        retry_delay=parameters.retry_delay,
+    )
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
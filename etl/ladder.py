@@ -0,0 +1,230 @@
+"""Модуль содержит построение лестницы представлений по свойствам исходника."""
+import json
+import subprocess
+from fractions import Fraction
+from typing import List, NamedTuple, Optional
+
+from ffmpeg_commands import Rendition, find_binary, keyframes_command
+
+# Высота кадра и битрейт видео (кбит/с) для H.264 при частоте кадров до 30.
+LADDER = (
+    (2160, 14000),
+    (1440, 8000),
+    (1080, 5000),
+    (720, 2800),
+    (480, 1400),
+    (360, 800),
+    (240, 400),
+    (144, 200),
+)
+HIGH_FRAME_RATE = 30  # Выше — битрейт лестницы увеличивается в HIGH_FRAME_RATE_FACTOR раз.
+HIGH_FRAME_RATE_FACTOR = 1.5
+CLOSE_HEIGHT = 0.9  # Ступени выше 90% высоты исходника почти не отличаются от него и пропускаются.
+REMUX_HEADROOM = 1.5  # Исходник копируется, если его битрейт не больше целевого в полтора раза.
+REMUX_CODECS = frozenset(('h264',))
+REMUX_PIXEL_FORMATS = frozenset(('yuv420p', 'yuvj420p'))
+MIN_SIDE = 2  # Меньше кадр не закодировать в yuv420p: стороны кадра должны быть чётными.
+
+
+class SourceError(ValueError):
+
+    """Ошибка: у загруженного файла нет видео, которое можно перекодировать (нет потока, кадра или ключевых кадров)."""
+
+
+class Ladder(NamedTuple):
+
+    """Лестница представлений и (при копировании исходника) отметки ключевых кадров для остальных."""
+
+    representations: List[Rendition]
+    aligned: Optional[List[float]]
+    duration: Optional[float] = None  # Длительность исходника в секундах (для прогресса кодирования).
+
+    @property
+    def encoded(self) -> List[Rendition]:
+
+        """
+        Свойство возвращает представления, которые нужно перекодировать.
+
+        Returns:
+            Вернёт представления без копируемого из исходника.
+        """
+
+        return [representation for representation in self.representations if not representation.copy]
+
+
+class SourceInfo(NamedTuple):
+
+    """Свойства видео трека: разрешение, частота кадров, битрейт (кбит/с), кодек, формат пикселей и длительность."""
+
+    width: int
+    height: int
+    fps: float
+    bitrate: Optional[int]
+    codec: str
+    pix_fmt: Optional[str]
+    duration: Optional[float] = None
+
+
+def probe_source(video_track: str) -> SourceInfo:
+
+    """
+    Функция узнаёт свойства видео трека через ffprobe.
+
+    Args:
+        video_track: путь до видео трека
+
+    Returns:
+        Вернёт свойства видео трека.
+
+    Raises:
+        SourceError: в файле нет видео потока или у него нет размеров кадра
+    """
+
+    command = [
+        find_binary('ffprobe'),
+        '-v',
+        'error',
+        '-select_streams',
+        'v:0',
+        '-show_streams',
+        '-show_format',
+        '-of',
+        'json',
+        video_track,
+    ]
+    probe = json.loads(subprocess.run(command, capture_output=True, check=True).stdout)
+    if not probe.get('streams'):
+        raise SourceError(f'{video_track} has no video stream.')
+    stream = probe['streams'][0]
+    width = int(stream.get('width') or 0)
+    height = int(stream.get('height') or 0)
+    if min(width, height) < MIN_SIDE:
+        raise SourceError(f'{video_track} has no frame size: {width}x{height}.')
+
+    container_bitrate = probe.get('format', {}).get('bit_rate')
+    bitrate = int(stream.get('bit_rate') or container_bitrate or 0) // 1000
+    frame_rate = stream.get('avg_frame_rate') or stream.get('r_frame_rate') or '0'
+    duration = stream.get('duration') or probe.get('format', {}).get('duration')
+
+    return SourceInfo(
+        width=width,
+        height=height,
+        fps=0 if frame_rate == '0/0' else float(Fraction(frame_rate)),
+        bitrate=bitrate if bitrate else None,
+        codec=stream.get('codec_name', ''),
+        pix_fmt=stream.get('pix_fmt'),
+        duration=float(duration) if duration not in {None, 'N/A'} else None,
+    )
+
+
+def probe_keyframes(video_track: str) -> List[float]:
+
+    """
+    Функция находит ключевые кадры видео трека через ffprobe.
+
+    Args:
+        video_track: путь до видео трека
+
+    Returns:
+        Вернёт время ключевых кадров в секундах от начала трека (по возрастанию).
+
+    Raises:
+        SourceError: в видео треке нет ключевых кадров
+    """
+
+    probe = subprocess.run(keyframes_command(video_track), capture_output=True, check=True)
+    packets = json.loads(probe.stdout).get('packets', [])
+    times = sorted(
+        float(packet['pts_time'])
+        for packet in packets
+        if 'K' in packet.get('flags', '') and packet.get('pts_time') not in {None, 'N/A'}
+    )
+    if not times:
+        raise SourceError(f'{video_track} has no keyframes.')
+    return [moment - times[0] for moment in times]
+
+
+def target_bitrate(height: int, fps: float) -> int:
+
+    """
+    Функция возвращает целевой битрейт лестницы для высоты кадра.
+
+    Args:
+        height: высота кадра
+        fps: частота кадров
+
+    Returns:
+        Вернёт битрейт видео в кбит/с.
+    """
+
+    bitrate = LADDER[0][1]
+    for rung_height, rung_bitrate in LADDER:
+        if rung_height >= height:
+            bitrate = rung_bitrate
+
+    if fps > HIGH_FRAME_RATE:
+        return int(bitrate * HIGH_FRAME_RATE_FACTOR)
+    return bitrate
+
+
+def build_ladder(source: SourceInfo, remux: bool = True) -> List[Rendition]:
+
+    """
+    Функция строит лестницу представлений, которая никогда не превышает исходник.
+
+    Верхняя ступень — разрешение исходника, ниже — стандартные ступени меньше него
+    (увеличенных копий маленьких видео не бывает). Битрейт каждой ступени не выше битрейта исходника.
+    Если исходник уже в нужном кодеке (H.264, yuv420p) и его битрейт разумен,
+    верхняя ступень копируется из него без перекодирования.
+
+    Args:
+        source: свойства видео трека
+        remux: разрешить копирование исходника без перекодирования
+
+    Returns:
+        Вернёт представления от большего к меньшему.
+    """
+
+    def rendition(height: int) -> Rendition:
+        width = round(source.width * height / source.height / 2) * 2
+        bitrate = target_bitrate(height, source.fps)
+        if source.bitrate:
+            bitrate = min(bitrate, source.bitrate)
+        return Rendition(width, height, bitrate)
+
+    top = rendition(source.height - source.height % 2)
+    ladder = [top]
+    ladder += [
+        rendition(height)
+        for height, _ in LADDER
+        if height < source.height * CLOSE_HEIGHT
+    ]
+
+    if remux and source.codec in REMUX_CODECS and source.pix_fmt in REMUX_PIXEL_FORMATS:
+        headroom = target_bitrate(source.height, source.fps) * REMUX_HEADROOM
+        if source.bitrate is not None and source.bitrate <= headroom:
+            ladder[0] = Rendition(source.width, source.height, source.bitrate, copy=True)
+
+    return ladder
+
+
+def segment_keyframes(keyframes: List[float], segment_duration: float) -> List[float]:
+
+    """
+    Функция выбирает ключевые кадры исходника, на которых начнутся сегменты.
+    Сегмент начинается с первого ключевого кадра, отстоящего от начала предыдущего
+    не меньше чем на segment_duration, — так же ffmpeg режет копируемое представление.
+
+    Args:
+        keyframes: время ключевых кадров исходника в секундах (по возрастанию)
+        segment_duration: длительность сегмента в секундах
+
+    Returns:
+        Вернёт отметки времени начала сегментов.
+    """
+
+    starts: List[float] = []
+    for moment in keyframes:
+        if not starts or moment >= starts[-1] + segment_duration:
+            starts.append(moment)
+    return starts
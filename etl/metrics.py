@@ -0,0 +1,304 @@
+"""Модуль содержит метрики процесса в формате Prometheus (счётчики, датчики, гистограммы)."""
+import json
+import math
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple, TypeVar
+
+Labels = Tuple[Tuple[str, str], ...]
+MetricType = TypeVar('MetricType', bound='Metric')
+
+
+def label_key(labels: Dict[str, str]) -> Labels:
+
+    """
+    Функция превращает метки в ключ словаря значений (порядок меток не важен).
+
+    Args:
+        labels: метки значения
+
+    Returns:
+        Вернёт отсортированные пары (метка, значение).
+    """
+
+    return tuple(sorted((name, f'{label}') for name, label in labels.items()))
+
+
+def format_sample(name: str, labels: Labels, sample: float) -> str:
+
+    """
+    Функция форматирует одну строку в текстовом формате Prometheus.
+
+    Args:
+        name: название ряда
+        labels: метки
+        sample: значение
+
+    Returns:
+        Вернёт строку вида name{label="value"} 1.0.
+    """
+
+    # Экранирование json (кавычки, обратная косая черта, перевод строки) совпадает с форматом Prometheus.
+    pairs = ((label_name, json.dumps(label, ensure_ascii=False)) for label_name, label in labels)
+    rendered = ','.join(f'{label_name}={label}' for label_name, label in pairs)
+    series = f'{name}{{{rendered}}}' if rendered else name
+    if math.isinf(sample):
+        sign = '+' if sample > 0 else '-'
+        return f'{series} {sign}Inf'
+    return f'{series} {sample}'
+
+
+class Metric:
+
+    """
+    Базовый класс метрики: название, описание и значения по наборам меток.
+    Значения меняются из разных потоков, поэтому все изменения под блокировкой.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            name: название метрики
+            documentation: описание (строка HELP)
+        """
+
+        self.name = name
+        self.documentation = documentation
+        self._lock = Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def remove(self, **labels: str) -> None:
+
+        """
+        Метод удаляет значение с набором меток (например, когда задача завершилась).
+
+        Args:
+            labels: метки значения
+        """
+
+        with self._lock:
+            self._values.pop(label_key(labels), None)
+
+    def value(self, **labels: str) -> float:
+
+        """
+        Метод возвращает текущее значение.
+
+        Args:
+            labels: метки значения
+
+        Returns:
+            Вернёт значение или 0, если его ещё нет.
+        """
+
+        with self._lock:
+            return self._values.get(label_key(labels), 0)
+
+    def samples(self) -> List[str]:
+
+        """
+        Метод возвращает значения метрики в текстовом формате Prometheus.
+
+        Returns:
+            Вернёт строки значений.
+        """
+
+        with self._lock:
+            values = list(self._values.items())
+        return [format_sample(self.name, labels, sample) for labels, sample in values]
+
+    def render(self) -> str:
+
+        """
+        Метод возвращает метрику целиком: HELP, TYPE и значения.
+
+        Returns:
+            Вернёт текст метрики.
+        """
+
+        lines = [f'# HELP {self.name} {self.documentation}']
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        return '\n'.join(lines + self.samples())
+
+
+class Counter(Metric):
+
+    """Класс счётчика: значение только растёт."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+
+        """
+        Метод увеличивает счётчик.
+
+        Args:
+            amount: на сколько увеличить
+            labels: метки значения
+        """
+
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+
+    """Класс датчика: значение, которое может и расти, и падать."""
+
+    kind = 'gauge'
+
+    def set(self, sample: float, **labels: str) -> None:  # noqa: WPS125
+
+        """
+        Метод задаёт значение датчика.
+
+        Args:
+            sample: новое значение
+            labels: метки значения
+        """
+
+        with self._lock:
+            self._values[label_key(labels)] = sample
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+
+        """
+        Метод увеличивает (или уменьшает, если amount < 0) значение датчика.
+
+        Args:
+            amount: на сколько увеличить
+            labels: метки значения
+        """
+
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+
+    """
+    Класс гистограммы: распределение наблюдений по корзинам (bucket), их сумма и количество.
+    Корзины накопительные, как в Prometheus: наблюдение попадает во все корзины не меньше его.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float]) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            name: название метрики
+            documentation: описание (строка HELP)
+            buckets: верхние границы корзин (+Inf добавляется сама)
+        """
+
+        super().__init__(name, documentation)
+        self.buckets = (*sorted(buckets), math.inf)
+        self._observations: Dict[Labels, List[float]] = {}
+
+    def observe(self, sample: float, **labels: str) -> None:
+
+        """
+        Метод добавляет наблюдение.
+
+        Args:
+            sample: наблюдаемое значение
+            labels: метки значения
+        """
+
+        key = label_key(labels)
+        with self._lock:
+            counts = self._observations.setdefault(key, [0] * (len(self.buckets) + 1))
+            for position, bound in enumerate(self.buckets):
+                if sample <= bound:
+                    counts[position] += 1
+            counts[-1] += sample
+
+    def count(self, **labels: str) -> float:
+
+        """
+        Метод возвращает количество наблюдений.
+
+        Args:
+            labels: метки значения
+
+        Returns:
+            Вернёт количество наблюдений.
+        """
+
+        with self._lock:
+            counts = self._observations.get(label_key(labels))
+        return counts[-2] if counts else 0
+
+    def samples(self) -> List[str]:
+
+        """
+        Метод возвращает корзины, сумму и количество наблюдений в текстовом формате Prometheus.
+
+        Returns:
+            Вернёт строки значений.
+        """
+
+        with self._lock:
+            observations = [(labels, list(counts)) for labels, counts in self._observations.items()]
+
+        lines = []
+        for labels, counts in observations:
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = (*labels, ('le', '+Inf' if math.isinf(bound) else f'{bound}'))
+                lines.append(format_sample(f'{self.name}_bucket', bucket_labels, bucket_count))
+            lines.append(format_sample(f'{self.name}_sum', labels, counts[-1]))
+            lines.append(format_sample(f'{self.name}_count', labels, counts[-2]))
+        return lines
+
+
+class Registry:
+
+    """Класс реестра метрик процесса: из него метрики отдаются целиком (см. render)."""
+
+    def __init__(self) -> None:
+
+        """Конструктор."""
+
+        self._lock = Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: MetricType) -> MetricType:
+
+        """
+        Метод добавляет метрику в реестр.
+        Если метрика с таким названием уже есть, возвращается она (модуль можно импортировать повторно).
+
+        Args:
+            metric: метрика
+
+        Returns:
+            Вернёт зарегистрированную метрику.
+        """
+
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)  # type: ignore
+
+    def render(self) -> str:
+
+        """
+        Метод возвращает все метрики в текстовом формате Prometheus.
+
+        Returns:
+            Вернёт текст для ответа на запрос метрик.
+        """
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(f'{metric.render()}\n' for metric in metrics)
+
+
+REGISTRY = Registry()
@@ -0,0 +1,66 @@
+"""Модуль содержит HTTP сервер, отдающий метрики процесса в текстовом формате Prometheus (GET /metrics)."""
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Optional
+
+from log import create_logger
+from metrics import REGISTRY
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OK = 200
+NOT_FOUND = 404
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    """Класс обработчика запросов: на /metrics — все метрики реестра, на остальное — 404."""
+
+    def do_GET(self) -> None:  # noqa: N802
+
+        """Метод отвечает на GET."""
+
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(NOT_FOUND)
+            return
+
+        body = REGISTRY.render().encode()
+        self.send_response(OK)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:  # noqa: WPS110
+
+        """
+        Метод отключает запись каждого запроса в stderr (Prometheus опрашивает сервер постоянно).
+
+        Args:
+            args: формат и аргументы строки лога
+        """
+
+
+def start_metrics_server(port: int) -> Optional[ThreadingHTTPServer]:
+
+    """
+    Функция запускает сервер метрик в фоновом потоке (на всех интерфейсах: его опрашивают из других контейнеров).
+
+    Args:
+        port: порт (0 — не запускать сервер)
+
+    Returns:
+        Вернёт сервер или None, если он выключен.
+    """
+
+    if not port:
+        return None
+
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info('Metrics server has been started on port %s.', port)
+    return server
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
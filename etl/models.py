@@ -130,6 +130,79 @@ class ElasticSettings(EnvMixin):
     elastic_port: int = 9200
 
 
+class LoadSettings(EnvMixin):
+
+    """
+    Класс pydantic.
+    Тут настройки клиента ElasticSearch и загрузки пачек (load).
+    """
+
+    # Режим загрузки: 'bulk' (один блокирующий запрос), 'streaming' или 'parallel' (несколько потоков).
+    load_mode: str = 'streaming'
+    # Ограничение одного bulk запроса: в байтах (главное) и в документах (подстраховка).
+    max_chunk_bytes: int = 10 * 1024 * 1024
+    chunk_size: int = 10000
+    # Количество потоков для режима 'parallel'.
+    thread_count: int = 4
+    # Сколько раз повторять документы, отклонённые ES (429 Too Many Requests).
+    max_retries: int = 3
+    # Настройки соединений клиента: сжатие HTTP и размер пула соединений на один узел.
+    http_compress: bool = True
+    connections_per_node: int = 10
+    # База SQLite с хэшами содержимого загруженных документов (':memory:' — хранить только в памяти процесса):
+    # по ним не изменившиеся документы не отправляются, а у изменившихся отправляются только новые поля.
+    hashes_database: str = 'hashes.sqlite3'
+
+
+class TranscodeSettings(EnvMixin):
+
+    """
+    Класс pydantic.
+    Тут настройки пула перекодирования видео.
+    """
+
+    # Где выполнять перекодирование: 'pool' (пул процессов ETL) или 'queue' (очередь Redis и transcode_worker.py).
+    transcode_mode: str = 'pool'
+    # Максимальное количество одновременных перекодирований (0 — по числу ядер).
+    transcode_workers: int = 0
+    # На сколько понизить приоритет процессов перекодирования (nice).
+    transcode_niceness: int = 10
+    media_dir: str = 'media_source/'
+    streams_dir: str = '../streams/'
+    # Длительность сегмента в секундах: короче — быстрее старт, длиннее — меньше запросов и файлов.
+    segment_duration: float = 4
+    # Писать ли рядом с dash.mpd мастер-плейлист HLS (master.m3u8) на тех же CMAF сегментах.
+    hls_playlist: bool = True
+    # Сколько представлений одного видео кодировать одновременно (1 — вся лестница одним ffmpeg).
+    rendition_workers: int = 1
+    # Длинные исходники режутся по ключевым кадрам на куски такой длительности (сек.)
+    # и кодируются параллельно (0 — не резать).
+    chunk_duration: float = 0
+    # Сколько кусков кодировать одновременно (0 — по числу ядер).
+    chunk_workers: int = 0
+    # Копировать исходник в верхнее представление без перекодирования, если он уже H.264 с разумным битрейтом.
+    remux: bool = True
+
+    # Настройки очереди задач (режим 'queue').
+    queue_name: str = 'transcode'
+    lease_seconds: float = 60
+    max_attempts: int = 5
+    retry_delay: float = 30
+    poll_interval: float = 5
+
+
+class RedisSettings(EnvMixin):
+
+    """
+    Класс pydantic.
+    Тут настройки для Redis.
+    """
+
+    redis_host: str = 'localhost'
+    redis_port: int = 6379
+    redis_db: int = 0
+
+
 class ETLSettings(EnvMixin):
 
     """
@@ -141,13 +214,67 @@ class ETLSettings(EnvMixin):
 
     postgres_parameters: PostgresSettings = PostgresSettings()
     elastic_search_parameters: ElasticSettings = ElasticSettings()
+    load_parameters: LoadSettings = LoadSettings()
+    transcode_parameters: TranscodeSettings = TranscodeSettings()
+    redis_parameters: RedisSettings = RedisSettings()
 
     pack_size: int = 5
     smallest_time: str = '0001-01-01 00:00:00.448000 +00:00'
+    smallest_id: str = '00000000-0000-0000-0000-000000000000'
+    # Общий псевдоним индексов ES: документы лежат в индексах по языкам ({index_name}_{язык}, у каждого свой
+    # анализатор), видео на языке не из languages — в индексе default_language.
     index_name: str = 'videos'
+    languages: Tuple[str, ...] = ('ru', 'en')
+    default_language: str = 'ru'
+    # Пересборка индексов (reindex.py): где лежат схемы {язык}_schemas.json и размер пачки при загрузке.
+    schemas_dir: str = '../src/schemas_elastic_search'
+    reindex_pack_size: int = 1000
+
+    # Режим извлечения данных: 'keyset' (постранично по паре (дата, id)) или 'offset' (LIMIT/OFFSET).
+    extract_mode: str = 'keyset'
+    # Сколько строк за раз забирать с серверного курсора Postgres.
+    itersize: int = 1000
+    # Максимальное количество соединений с Postgres в пуле.
+    pool_size: int = 4
+
+    # Движок ETL для keyset режима: 'sequential' (стадии по очереди) или 'pipeline' (стадии одновременно).
+    engine: str = 'sequential'
+    # Количество процессов для стадии transform и размер очередей между стадиями (режим 'pipeline').
+    transform_workers: int = 2
+    queue_size: int = 4
+
+    # Как ждать новых данных: 'notify' (LISTEN/NOTIFY Postgres) или 'sleep' (просто спать).
+    wake_mode: str = 'notify'
+    # Канал LISTEN/NOTIFY: тот же, что ETL_NOTIFY_CHANNEL админки (с ним миграции создают триггеры).
+    notify_channel: str = 'etl_changes'
+    # Максимальное время ожидания (в режиме 'notify' — запасной опрос PG).
+    poll_timeout: float = 10
+
+    # Где хранить состояние (точку продолжения): 'json' (файл), 'sqlite' (база state_database,
+    # своя точка на каждую пару индекс и исходная таблица) или 'redis' (хэш {state_namespace}:state).
+    state_storage: str = 'json'
+    state_database: str = 'state.sqlite3'
+    state_source: str = 'content.video'
+    # Файл состояния. Точки продолжения пишутся на диск не на каждую пачку, а раз в state_flush_interval секунд
+    # или после state_flush_updates изменений (и при остановке): после падения ETL повторит не больше этих пачек.
+    state_file: str = 'state.json'
+    state_flush_interval: float = 5
+    state_flush_updates: int = 100
+    # Свой у каждого экземпляра ETL префикс ключа состояния в Redis.
+    state_namespace: str = 'etl'
+    # Двигать точку продолжения, только если её не сдвинул другой экземпляр ETL (compare-and-set).
+    state_compare_and_set: bool = False
+
+    # Порт HTTP сервера метрик Prometheus (GET /metrics) у etl_process.py и transcode_worker.py (0 — не запускать).
+    metrics_port: int = 9108
+
+    # Загрузка по разделам (backfill.py): на сколько диапазонов id делить content.video, сколько процессов
+    # их загружают (у каждого одно соединение с Postgres) и размер пачки. Точки продолжения разделов — в state_database.
+    backfill_partitions: int = 16
+    backfill_workers: int = 4
+    backfill_pack_size: int = 1000
 
 
 # Конфиги, построенные на основе классов pydantic.
 
 config = ETLSettings()
-document_config = Document()
@@ -0,0 +1,181 @@
+"""Модуль содержит способы ожидания новых изменений в PG, когда данных для ETL нет."""
+import select
+import sys
+from threading import Event
+from time import monotonic
+from typing import Dict, Optional, Union
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, connection
+
+from log import create_logger
+
+STOP_CHECK = 1  # Как часто (сек.) ожидание уведомления проверяет, не пора ли остановиться.
+
+
+class SleepWaiter:
+
+    """Класс ожидания «по таймеру»: просто засыпает на заданное время."""
+
+    def __init__(self, timeout: float = 10, stop: Optional[Event] = None) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            timeout: время ожидания в секундах
+            stop: событие остановки процесса (прерывает ожидание)
+        """
+
+        self.timeout = timeout
+        self.stop = stop if stop else Event()
+
+    def wait(self) -> bool:
+
+        """
+        Метод засыпает на timeout секунд (или до остановки процесса).
+
+        Returns:
+            Вернёт False (нас разбудил таймер, а не изменение данных).
+        """
+
+        self.stop.wait(self.timeout)  # Даём фору, что бы зря не долбать PG.
+        return False
+
+
+class ChangeListener:
+
+    """
+    Класс ожидания изменений через LISTEN/NOTIFY Postgres.
+    Триггеры на content.video, content.audio_track и content.video_track
+    шлют уведомление в канал (см. миграцию 0002_etl_notify_triggers),
+    а ETL блокируется на этом канале, вместо того чтобы опрашивать PG.
+
+    Если уведомлений нет дольше timeout — ETL всё равно просыпается (запасной опрос).
+    """
+
+    def __init__(
+        self,
+        postgres_parameters: Dict[str, Union[str, int]],
+        channel: str = 'etl_changes',
+        timeout: float = 10,
+        stop: Optional[Event] = None
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            postgres_parameters: параметры подключения к Postgres (host, port)
+            channel: канал, в который триггеры шлют уведомления
+            timeout: максимальное время ожидания уведомления в секундах
+            stop: событие остановки процесса (прерывает ожидание)
+        """
+
+        self.postgres_parameters = postgres_parameters
+        self.channel, self.timeout = channel, timeout
+        self.stop = stop if stop else Event()
+        self._connection: Optional[connection] = None
+
+    def listen(self) -> None:
+
+        """
+        Метод подписывается на канал.
+        Уведомления, пришедшие во время обхода данных, накопятся и разбудят ETL сразу после него.
+        Вызывать его заранее не обязательно: wait подпишется сам и сразу разбудит ETL.
+        """
+
+        con = psycopg2.connect(**self.postgres_parameters)
+        con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with con.cursor() as cur_postgres:
+            cur_postgres.execute(sql.SQL('LISTEN {0}').format(sql.Identifier(self.channel)))
+
+        self._connection = con
+        logger.info('Listening to channel %s.', self.channel)
+
+    def wait(self) -> bool:
+
+        """
+        Метод ждёт уведомление не дольше timeout секунд.
+        Все накопившиеся уведомления вычитываются разом, поэтому серия правок будит ETL один раз.
+
+        Если соединение сломалось — переподключаемся и сразу будим ETL:
+        пока нас не было, уведомления могли потеряться.
+
+        Returns:
+            Вернёт True, если данные (возможно) изменились, и False, если сработал запасной таймер.
+        """
+
+        try:
+            return self._wait_notifications()
+        except psycopg2.Error as error:
+            logger.error('Listening has failed: %s', error)
+
+        self.close()
+        self.stop.wait(self.timeout)
+        try:
+            self.listen()
+        except psycopg2.Error as reconnect_error:
+            logger.error('Reconnection has failed: %s', reconnect_error)
+        return True
+
+    def close(self) -> None:
+
+        """Метод закрывает соединение, на котором мы слушаем канал."""
+
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def _wait_notifications(self) -> bool:
+
+        """
+        Метод блокируется на сокете соединения, пока не придёт уведомление или не истечёт timeout.
+
+        Returns:
+            Вернёт True, если пришло хотя бы одно уведомление.
+        """
+
+        if self._connection is None:
+            self.listen()
+            return True
+
+        con = self._connection
+        con.poll()
+        if not con.notifies:
+            if not self._select(con):
+                return False
+            con.poll()
+
+        tables = {notify.payload for notify in con.notifies}
+        con.notifies.clear()
+
+        logger.info('Changes have been notified: %s', ', '.join(sorted(tables)))
+        return bool(tables)
+
+    def _select(self, con: connection) -> bool:
+
+        """
+        Метод ждёт данных на сокете соединения не дольше timeout секунд.
+        Ожидание идёт отрезками по STOP_CHECK секунд: после SIGTERM оно прерывается, не дожидаясь timeout.
+
+        Args:
+            con: соединение, на котором мы слушаем канал
+
+        Returns:
+            Вернёт True, если на сокете есть данные.
+        """
+
+        deadline = monotonic() + self.timeout
+        while not self.stop.is_set():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([con], [], [], min(remaining, STOP_CHECK))
+            if readable:
+                return True
+        return False
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
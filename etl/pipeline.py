@@ -0,0 +1,284 @@
+"""Модуль содержит конвейерный (pipeline) режим ETL процесса."""
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from multiprocessing import get_context
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Callable, List, Optional, Union
+
+from documents import IndexRouter
+from etl_class import ETL, pack_checkpoint, transform_pack
+from etl_metrics import DOCUMENTS, ROWS, STAGE_SECONDS, commit_watermark, mark_caught_up, stage_timer, timed
+from log import create_logger
+from notifications import ChangeListener, SleepWaiter
+from state_storage import State
+
+END_OF_SWEEP = None  # Метка конца обхода, её стадии передают друг другу через очереди.
+QUEUE_TIMEOUT = 0.5  # Как часто стадии, ждущие очередь, проверяют, не пора ли остановиться.
+
+
+class PipelineError(Exception):
+
+    """Ошибка, из-за которой остановилась одна из стадий конвейера."""
+
+
+class Pipeline:  # noqa: WPS214, WPS230
+
+    """
+    Класс конвейера ETL.
+
+    Стадии extract, transform и load работают одновременно и связаны ограниченными очередями:
+    если следующая стадия не успевает, предыдущая ждёт (backpressure), а не копит пачки в памяти.
+    Стадия transform выполняется в пуле процессов.
+
+    Пачки загружаются в ES строго в порядке извлечения,
+    а точка продолжения сдвигается только после того, как ES подтвердил загрузку пачки.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        etl: ETL,
+        state: State,
+        router: IndexRouter,
+        pack_size: int,
+        waiter: Union[ChangeListener, SleepWaiter],
+        workers: int = 2,
+        queue_size: int = 4,
+        shutdown: Optional[Event] = None
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            etl: экземпляр класса с интерфейсом ETL
+            state: хранилище состояния
+            router: индексы ES по языкам
+            pack_size: размер пачки
+            waiter: способ ожидания новых данных после обхода
+            workers: количество процессов для стадии transform
+            queue_size: максимальное количество пачек в каждой очереди между стадиями
+            shutdown: событие остановки процесса (после него конвейер дозагружает извлечённое и выходит)
+        """
+
+        self.etl, self.state = etl, state
+        self.router, self.pack_size = router, pack_size
+        self.waiter = waiter
+        self.workers, self.queue_size = workers, queue_size
+
+        self.checkpoint = ('', '')  # Пара (время, id) последней подтверждённой ES пачки.
+        self.sweep_time = ''  # Время начала текущего обхода.
+
+        self.shutdown = shutdown if shutdown else Event()
+        self._stop = Event()
+        self._errors: List[Exception] = []
+
+    def run(self, checkpoint: tuple, sweep_time: str) -> None:
+
+        """
+        Метод запускает работу конвейера до остановки процесса (shutdown).
+
+        Args:
+            checkpoint: пара (время, id), с которой начинается работа
+            sweep_time: время начала текущего обхода
+        """
+
+        self.checkpoint, self.sweep_time = checkpoint, sweep_time
+
+        # Процессы запускаем через spawn: к моменту их старта в процессе уже работают потоки стадий,
+        # а fork процесса с потоками может унаследовать захваченные блокировки.
+        with ProcessPoolExecutor(self.workers, mp_context=get_context('spawn')) as executor:
+            while True:
+                self.run_sweep(executor)
+                if self.shutdown.is_set():  # Обход прерван: время начала обхода не сдвигается.
+                    logger.info('Pipeline has been stopped. Last loaded %s', self.checkpoint)
+                    return
+
+                # Обход закончен — следующий начнётся с последней загруженной даты.
+                self.sweep_time = self.checkpoint[0]
+                self.state.set_state('sweep_time', self.sweep_time)
+                mark_caught_up()
+
+                logger.info('No packs to insert. Last update %s', self.sweep_time)
+                self.waiter.wait()
+
+    def run_sweep(self, executor: ProcessPoolExecutor) -> None:
+
+        """
+        Метод выполняет один обход: от точки продолжения до последней изменённой строки.
+        Если одна из стадий упала — останавливает остальные и пробрасывает её ошибку.
+
+        Args:
+            executor: пул процессов для стадии transform
+
+        Raises:
+            PipelineError: одна из стадий остановилась с ошибкой
+            BaseException: главный поток прерван (например, SystemExit) — стадии остановлены
+        """
+
+        self._stop.clear()
+        self._errors.clear()
+
+        extracted: Queue = Queue(self.queue_size)
+        transformed: Queue = Queue(self.queue_size)
+
+        stages = [
+            Thread(target=self._guard, args=(self._extract, extracted), name='etl-extract'),
+            Thread(target=self._guard, args=(self._load, transformed), name='etl-load'),
+        ]
+        for thread in stages:
+            thread.start()
+
+        # Стадии останавливаются и тогда, когда главный поток прерван не Exception (SystemExit по SIGTERM,
+        # KeyboardInterrupt): иначе потоки стадий ждали бы очереди вечно и процесс не завершился бы.
+        try:
+            self._guard(self._dispatch, executor, extracted, transformed)
+        except BaseException:  # noqa: WPS424
+            self._stop.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+
+        if self._errors:
+            raise PipelineError('Pipeline sweep has failed.') from self._errors[0]
+
+    def _extract(self, extracted: Queue) -> None:
+
+        """
+        Стадия extract: постранично достаёт пачки из PG и кладёт их в очередь.
+        При остановке процесса перестаёт извлекать: уже извлечённые пачки дозагружаются.
+
+        Args:
+            extracted: очередь извлечённых пачек
+        """
+
+        checkpoint = self.checkpoint
+        while not self._stop.is_set() and not self.shutdown.is_set():
+            with stage_timer('extract'):
+                row_data = self.etl.extract_keyset(
+                    checkpoint=checkpoint, changed_since=self.sweep_time, pack_size=self.pack_size,
+                )
+            if not row_data:
+                break
+
+            ROWS.inc(len(row_data))
+            checkpoint = pack_checkpoint(row_data)
+            self._put(extracted, (row_data, checkpoint))
+            logger.info('Data has been received.')
+
+        self._put(extracted, END_OF_SWEEP)
+
+    def _dispatch(self, executor: ProcessPoolExecutor, extracted: Queue, transformed: Queue) -> None:
+
+        """
+        Стадия transform: отдаёт пачки в пул процессов.
+        В очередь на загрузку кладутся future в порядке извлечения,
+        поэтому пачки загружаются в том же порядке, даже если процессы закончат их в другом.
+        Время трансформации процесс пула возвращает вместе с пачкой (см. etl_metrics.timed).
+
+        Args:
+            executor: пул процессов для стадии transform
+            extracted: очередь извлечённых пачек
+            transformed: очередь пачек на загрузку
+        """
+
+        while True:
+            item = self._get(extracted)
+            if item is END_OF_SWEEP:
+                break
+
+            row_data, checkpoint = item
+            self._put(transformed, (executor.submit(timed, transform_pack, row_data, self.router), checkpoint))
+            self.etl.transcode(row_data)  # Изменённые треки перешиваем в фоне.
+
+        self._put(transformed, END_OF_SWEEP)
+
+    def _load(self, transformed: Queue) -> None:
+
+        """
+        Стадия load: дожидается трансформации пачки, загружает её в ES и сдвигает точку продолжения.
+
+        Args:
+            transformed: очередь пачек на загрузку
+
+        Raises:
+            RuntimeError: ES отказался загрузить документы пачки (точка продолжения не сдвигается)
+        """
+
+        while True:
+            item = self._get(transformed)
+            if item is END_OF_SWEEP:
+                break
+
+            future, checkpoint = item
+            (transformed_data, _), seconds = future.result()
+            STAGE_SECONDS.observe(seconds, stage='transform')
+            DOCUMENTS.inc(len(transformed_data))
+            logger.info('Data has been transformed.')
+
+            with stage_timer('load'):
+                failures = self.etl.load(transformed_data)
+            if failures:
+                raise RuntimeError('Documents have not been loaded: {0}.'.format(len(failures)))
+            logger.info('Data has been loaded.')
+
+            # Сдвигаем точку продолжения только после подтверждения загрузки.
+            self.checkpoint = checkpoint
+            self.state.set_states({'time': checkpoint[0], 'id': checkpoint[1]})
+            commit_watermark(checkpoint[0])
+
+    def _guard(self, stage: Callable, *args: Any) -> None:
+
+        """
+        Метод выполняет стадию и запоминает её ошибку, останавливая остальные стадии.
+
+        Args:
+            stage: функция стадии
+            *args: аргументы функции стадии
+        """
+
+        try:
+            stage(*args)
+        except Exception as error:
+            logger.error('Pipeline stage %s has failed: %s', stage.__name__, error)
+            self._errors.append(error)
+            self._stop.set()
+
+    def _put(self, queue: Queue, item: Any) -> None:
+
+        """
+        Метод кладёт элемент в очередь, ожидая свободное место (backpressure).
+        Ожидание прерывается, если конвейер остановлен.
+
+        Args:
+            queue: очередь
+            item: элемент
+        """
+
+        while not self._stop.is_set():
+            with suppress(Full):
+                queue.put(item, timeout=QUEUE_TIMEOUT)
+                return
+
+    def _get(self, queue: Queue) -> Any:
+
+        """
+        Метод достаёт элемент из очереди.
+        Если конвейер остановлен — вернёт метку конца обхода.
+
+        Args:
+            queue: очередь
+
+        Returns:
+            Вернёт элемент очереди.
+        """
+
+        while not self._stop.is_set():
+            with suppress(Empty):
+                return queue.get(timeout=QUEUE_TIMEOUT)
+        return END_OF_SWEEP
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
@@ -0,0 +1,192 @@
+"""Модуль содержит пул долгоживущих соединений с Postgres."""
+import sys
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterator, Set, Union
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, connection
+from psycopg2.pool import ThreadedConnectionPool
+
+from log import create_logger
+
+
+class PostgresPool:  # noqa: WPS214
+
+    """
+    Класс, хранящий пул соединений с Postgres.
+    Соединения открываются один раз и переиспользуются между пачками,
+    поэтому мы не платим за TCP, аутентификацию и планирование запроса на каждую пачку.
+    Перед выдачей давно простаивавшее соединение проверяется (SELECT 1),
+    а сломанное соединение выбрасывается из пула и заменяется новым.
+    """
+
+    def __init__(
+        self,
+        postgres_parameters: Dict[str, Union[str, int]],
+        min_size: int = 1,
+        max_size: int = 4,
+        health_check_interval: float = 30
+    ) -> None:
+
+        """
+        Конструктор.
+        Сам пул создаётся лениво, при первом запросе соединения,
+        так ошибки подключения попадают под действие backoff.
+
+        Args:
+            postgres_parameters: параметры подключения к Postgres (host, port)
+            min_size: минимальное количество соединений в пуле
+            max_size: максимальное количество соединений в пуле
+            health_check_interval: через сколько секунд простоя соединение нужно проверить перед выдачей
+        """
+
+        self.postgres_parameters = postgres_parameters
+        self.min_size, self.max_size = min_size, max_size
+        self.health_check_interval = health_check_interval
+
+        self._pool: Union[ThreadedConnectionPool, None] = None
+        self._lock = Lock()
+        self._last_used: Dict[int, float] = {}  # Когда соединение последний раз вернулось в пул.
+        self._prepared: Dict[int, Set[str]] = {}  # Какие запросы уже подготовлены на соединении.
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+
+        """
+        Контекстный менеджер, выдающий соединение из пула.
+        Если во время работы соединение сломалось — оно закрывается и не возвращается в пул.
+
+        Yields:
+            Исправное соединение с Postgres.
+        """
+
+        con = self._get_healthy()
+        try:
+            yield con
+        finally:
+            if con.closed or con.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+                self._discard(con)
+            else:
+                self._release(con)
+
+    def prepare(self, con: connection, name: str, statement: str) -> None:
+
+        """
+        Метод подготавливает (PREPARE) запрос на соединении, если этого ещё не делали.
+        Подготовленный запрос живёт, пока живёт соединение,
+        поэтому Postgres планирует его один раз, а не на каждую пачку.
+
+        Args:
+            con: соединение из пула
+            name: имя подготовленного запроса
+            statement: текст запроса PREPARE
+        """
+
+        prepared = self._prepared.setdefault(id(con), set())
+        if name in prepared:
+            return
+
+        with con.cursor() as cur_postgres:
+            cur_postgres.execute(statement)
+        prepared.add(name)
+
+    def close(self) -> None:
+
+        """Метод закрывает все соединения пула."""
+
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+            self._pool = None
+            self._last_used.clear()
+            self._prepared.clear()
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+
+        """
+        Метод возвращает пул соединений, создавая его при первом обращении.
+
+        Returns:
+            Вернёт пул соединений.
+        """
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.postgres_parameters)
+                logger.info('Postgres pool has been created.')
+            return self._pool
+
+    def _get_healthy(self) -> connection:
+
+        """
+        Метод берёт соединение из пула и проверяет, что оно живое.
+        Сломанные соединения выбрасываются, вместо них открываются новые.
+
+        Returns:
+            Вернёт исправное соединение.
+        """
+
+        while True:
+            con = self._get_pool().getconn()
+            if self._is_healthy(con):
+                return con
+            logger.warning('Postgres connection is broken, reconnecting.')
+            self._discard(con)
+
+    def _is_healthy(self, con: connection) -> bool:
+
+        """
+        Метод проверяет соединение.
+        Закрытое соединение сразу считается сломанным,
+        а простоявшее дольше health_check_interval — проверяется запросом SELECT 1.
+
+        Args:
+            con: соединение из пула
+
+        Returns:
+            Вернёт True, если соединением можно пользоваться.
+        """
+
+        if con.closed:
+            return False
+
+        last_used = self._last_used.get(id(con))
+        if last_used is not None and monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with con, con.cursor() as cur_postgres:
+                cur_postgres.execute('SELECT 1')
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+        return True
+
+    def _release(self, con: connection) -> None:
+
+        """
+        Метод возвращает соединение в пул.
+
+        Args:
+            con: соединение из пула
+        """
+
+        self._last_used[id(con)] = monotonic()
+        self._get_pool().putconn(con)
+
+    def _discard(self, con: connection) -> None:
+
+        """
+        Метод закрывает сломанное соединение и убирает его из пула.
+
+        Args:
+            con: соединение из пула
+        """
+
+        self._last_used.pop(id(con), None)
+        self._prepared.pop(id(con), None)
+        self._get_pool().putconn(con, close=True)
+
+
+logger = create_logger(__file__, stream_out=sys.stderr)
@@ -0,0 +1,232 @@
+"""
+Модуль содержит пересборку индексов ES без простоя.
+
+Документы загружаются в новую версию индексов ({index_name}_{язык}_{версия}), а псевдонимы,
+которые читают Flask и основной ETL ({index_name}_{язык} и общий {index_name}),
+переключаются на неё одним запросом, когда версия полностью готова.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from types import MappingProxyType
+from typing import List, Tuple
+
+from elasticsearch import Elasticsearch
+
+from documents import IndexRouter
+from etl_class import ETL, pack_checkpoint
+from log import create_logger
+from models import config
+
+# На время загрузки: поиск не обновляется (refresh) и реплики не пишутся — ES только складывает сегменты.
+INGEST_SETTINGS = MappingProxyType({'refresh_interval': '-1', 'number_of_replicas': 0})
+FORCE_MERGE_TIMEOUT = 3600  # Сколько секунд ждать слияния сегментов большого индекса.
+
+Checkpoint = Tuple[str, str]
+
+
+def load_schema(language: str) -> dict:
+
+    """
+    Функция читает схему индекса языка ({язык}_schemas.json из config.schemas_dir).
+
+    Args:
+        language: код языка ISO 639-1
+
+    Returns:
+        Вернёт тело запроса на создание индекса (settings и mappings).
+    """
+
+    schema_file = Path(config.schemas_dir) / f'{language}_schemas.json'
+    return json.loads(schema_file.read_text())
+
+
+def create_index(elastic: Elasticsearch, index_name: str, schema: dict) -> None:
+
+    """
+    Функция создаёт версию индекса по схеме, но с настройками для загрузки (INGEST_SETTINGS).
+
+    Args:
+        elastic: клиент ElasticSearch
+        index_name: название версии индекса
+        schema: схема индекса
+    """
+
+    body = {**schema, 'settings': {**schema.get('settings', {}), **INGEST_SETTINGS}}
+    elastic.indices.create(index=index_name, body=body)
+    logger.info('Index %s has been created.', index_name)
+
+
+def sweep(etl: ETL, router: IndexRouter, checkpoint: Checkpoint) -> Checkpoint:
+
+    """
+    Функция загружает в версию индексов все строки после checkpoint, постранично (keyset), как основной ETL.
+    Строка, изменённая во время обхода, получает новую дату и встречается дальше по обходу ещё раз.
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        router: версия индексов по языкам
+        checkpoint: пара (время, id), после которой начинается обход
+
+    Returns:
+        Вернёт пару (время, id) последней загруженной строки.
+
+    Raises:
+        RuntimeError: ES отказался загрузить документы (псевдонимы в этом случае не переключаются)
+    """
+
+    loaded = 0
+    while True:
+        row_data = etl.extract_keyset(checkpoint, config.smallest_time, config.reindex_pack_size)
+        if not row_data:
+            logger.info('Indexes %s have been loaded: %s documents.', router.version, loaded)
+            return checkpoint
+
+        documents, _ = etl.transform(row_data, router)
+        failures = etl.load(documents)
+        if failures:
+            message = 'Documents have not been loaded into indexes {0}: {1}.'
+            raise RuntimeError(message.format(router.version, len(failures)))
+        loaded += len(documents)
+        checkpoint = pack_checkpoint(row_data)
+
+
+def finish_index(elastic: Elasticsearch, index_name: str, schema: dict) -> None:
+
+    """
+    Функция возвращает версии индекса настройки из схемы (или ES по умолчанию, если в схеме их нет).
+    Затем делает документы видимыми поиску и сливает сегменты в один: индекс больше не меняется массово.
+
+    Args:
+        elastic: клиент ElasticSearch
+        index_name: название версии индекса
+        schema: схема индекса
+    """
+
+    settings = schema.get('settings', {})
+    elastic.indices.put_settings(index=index_name, body={key: settings.get(key) for key in INGEST_SETTINGS})
+    elastic.indices.refresh(index=index_name)
+    elastic.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FORCE_MERGE_TIMEOUT)
+    logger.info('Index %s has been merged.', index_name)
+
+
+def alias_actions(elastic: Elasticsearch, router: IndexRouter, version: str) -> Tuple[List[dict], List[str]]:
+
+    """
+    Функция собирает действия _aliases, которые переключают псевдонимы языков и общий псевдоним на версию.
+    Псевдоним снимается со всех индексов, где он есть. Если на месте псевдонима ещё обычный индекс
+    (индексы создавались вручную — например, общий индекс {index_name} до пересборок), он удаляется
+    в том же запросе (remove_index): иначе ES не даст создать псевдоним с таким же названием.
+
+    Args:
+        elastic: клиент ElasticSearch
+        router: индексы ES по языкам (их названия — псевдонимы)
+        version: версия индексов
+
+    Returns:
+        Вернёт действия и индексы, с которых сняты псевдонимы.
+    """
+
+    actions: List[dict] = []
+    previous: List[str] = []
+    for name in (*map(router.index, router.languages), router.alias):
+        if elastic.indices.exists_alias(name=name):
+            for index_name in elastic.indices.get_alias(name=name):
+                actions.append({'remove': {'index': index_name, 'alias': name}})
+                previous.append(index_name)
+        elif elastic.indices.exists(index=name):
+            logger.warning('Index %s will be replaced by an alias of indexes %s.', name, version)
+            actions.append({'remove_index': {'index': name}})
+
+    versioned = router.versioned(version)
+    for language in router.languages:
+        target = versioned.index(language)
+        actions.append({'add': {'index': target, 'aliases': [router.index(language), router.alias]}})
+    return actions, list(dict.fromkeys(previous))
+
+
+def swap_aliases(elastic: Elasticsearch, router: IndexRouter, version: str) -> List[str]:
+
+    """
+    Функция атомарно (одним запросом _aliases) переключает псевдонимы языков и общий псевдоним на версию.
+
+    Args:
+        elastic: клиент ElasticSearch
+        router: индексы ES по языкам (их названия — псевдонимы)
+        version: версия индексов
+
+    Returns:
+        Вернёт индексы, с которых сняты псевдонимы.
+    """
+
+    actions, previous = alias_actions(elastic, router, version)
+    elastic.indices.update_aliases(body={'actions': actions})
+    logger.info('Aliases have been swapped to indexes %s (previous: %s).', version, previous)
+    return previous
+
+
+def rebuild(etl: ETL, router: IndexRouter, version: str) -> List[str]:
+
+    """
+    Функция пересобирает индексы.
+
+    0. Проверяет, что псевдонимы можно будет переключить (до загрузки, чтобы не ждать её впустую).
+    1. Создаёт версию индексов по схемам (без refresh и реплик) и загружает в неё весь каталог.
+    2. Возвращает настройки, сливает сегменты и догружает то, что изменилось за это время.
+    3. Переключает псевдонимы и догружает то, что основной ETL успел записать в прежние индексы.
+
+    Args:
+        etl: экземпляр класса с интерфейсом ETL
+        router: индексы ES по языкам
+        version: версия индексов
+
+    Returns:
+        Вернёт индексы, с которых сняты псевдонимы.
+    """
+
+    versioned = router.versioned(version)
+    schemas = {versioned.index(language): load_schema(language) for language in router.languages}
+    alias_actions(etl.elastic, router, version)
+
+    for index_name, schema in schemas.items():
+        create_index(etl.elastic, index_name, schema)
+    checkpoint = sweep(etl, versioned, (config.smallest_time, config.smallest_id))
+
+    for merged_name, merged_schema in schemas.items():
+        finish_index(etl.elastic, merged_name, merged_schema)
+    checkpoint = sweep(etl, versioned, checkpoint)
+
+    previous = swap_aliases(etl.elastic, router, version)
+    sweep(etl, versioned, checkpoint)
+    return previous
+
+
+def main() -> None:
+
+    """Функция пересобирает индексы без простоя (см. rebuild)."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--version', default=datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S'), help='версия')
+    parser.add_argument('--delete-old', action='store_true', help='удалить прежние индексы после переключения')
+    arguments = parser.parse_args()
+
+    # Хэши содержимого — только в памяти: новая версия пустая, в неё отправляются документы целиком.
+    host = config.elastic_search_parameters.elastic_host
+    port = config.elastic_search_parameters.elastic_port
+    load_parameters = config.load_parameters.copy(update={'hashes_database': ':memory:'})
+    etl = ETL(config.postgres_parameters.dict(), f'http://{host}:{port}', load_parameters=load_parameters)
+
+    router = IndexRouter(config.index_name, tuple(config.languages), config.default_language)
+    previous = rebuild(etl, router, arguments.version)
+
+    if arguments.delete_old and previous:
+        etl.elastic.indices.delete(index=','.join(previous))
+        logger.info('Previous indexes have been deleted: %s', previous)
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
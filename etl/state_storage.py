@@ -1,11 +1,22 @@
 """Модуль для хранения состояния."""
 import abc
+import atexit
 import json
+import os
+import sqlite3
+import sys
 from pathlib import Path
-from typing import Any, Optional
+from threading import Event, RLock, Thread, local
+from time import sleep
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from redis import Redis
 
+from log import create_logger
+
+if TYPE_CHECKING:  # models создаёт настройки ETL при импорте, а хранилищам они не нужны (только create_storage).
+    from models import ETLSettings
+
 
 class BaseStorage:
 
@@ -33,102 +44,492 @@ class BaseStorage:
 
         pass
 
+    def retrieve(self, key: str) -> Any:
+
+        """
+        Загрузить значение одного ключа (хранилища могут сделать это дешевле, чем читать всё состояние).
+
+        Args:
+            key: ключ
+
+        Returns:
+            Вернёт значение ключа или None.
+        """
+
+        return self.retrieve_state().get(key)
+
+    def compare_and_set(self, expected: dict, state: dict) -> bool:
+
+        """
+        Сохранить состояние, только если ключи из expected всё ещё имеют ожидаемые значения.
+
+        Args:
+            expected: ожидаемые значения ключей (None — ключа нет)
+            state: состояние, которое нужно записать
+
+        Returns:
+            Вернёт True, если состояние записано.
+        """
+
+        current = self.retrieve_state()
+        if any(current.get(key) != value for key, value in expected.items()):
+            return False
+        self.save_state(state)
+        return True
+
+    def flush(self) -> None:
+
+        """Записать в постоянное хранилище то, что ещё не записано (для хранилищ с отложенной записью)."""
+
+
+# Записать поля в хэш, только если ожидаемые поля не изменились.
+# ARGV: количество ожидаемых полей, пары (поле, ожидаемое значение), затем пары (поле, новое значение).
+# Новых полей может не быть (только проверка): HSET без полей — ошибка, поэтому он не вызывается.
+COMPARE_AND_SET_SCRIPT = """
+local expected = tonumber(ARGV[1])
+for position = 2, expected * 2, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[position]) or 'null'
+    if current ~= ARGV[position + 1] then
+        return 0
+    end
+end
+if #ARGV > expected * 2 + 1 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, expected * 2 + 2))
+end
+return 1
+"""
+
 
 class RedisStorage(BaseStorage):
 
     """
     Класс для работы с Redis.
     Реализованы запись и чтение.
+
+    Всё состояние одного экземпляра ETL — один хэш {namespace}:state, значения хранятся в json.
+    Чтение ключа — один HGET, всего состояния — один HGETALL, запись нескольких ключей — один HSET
+    (KEYS, сканирующий всю базу, не используется: Redis общий и под нагрузкой).
+    Точку продолжения можно двигать через compare_and_set (Lua скрипт, атомарно):
+    так два экземпляра ETL с одним namespace не перезапишут прогресс друг друга.
     """
 
-    def __init__(self, redis_adapter: Redis):
+    def __init__(self, redis_adapter: Redis, namespace: str = 'etl'):
 
         """
         Конструктор.
 
         Args:
             redis_adapter: объект соединения с Redis
+            namespace: префикс ключа (свой у каждого экземпляра ETL)
         """
 
         self.redis_adapter = redis_adapter
+        self.state_key = f'{namespace}:state'
+        self._compare_and_set = redis_adapter.register_script(COMPARE_AND_SET_SCRIPT)
 
     def save_state(self, state: dict) -> None:
 
         """
         Метод сохраняет состояние (dict) в Redis.
-        По сути он выполняет аналог метода dict.update() в python.
+        По сути он выполняет аналог метода dict.update() в python: все ключи пишутся одним HSET.
 
         Args:
             state: состояние, словарь, который нужно записать в Redis
         """
 
-        for key, value in state.items():
-            self.redis_adapter.set(name=key, value=value)
+        if state:
+            mapping = {key: json.dumps(value) for key, value in state.items()}
+            self.redis_adapter.hset(self.state_key, mapping=mapping)
 
     def retrieve_state(self) -> dict:
 
         """
-        Метод достаёт из Redis json данные и преобразует их в объект словарь.
+        Метод достаёт из Redis хэш состояния и преобразует его в объект словарь.
 
         Returns:
-            Вернёт словарь, в котором будет содержимое json.
+            Вернёт словарь, в котором будет содержимое хэша.
+        """
+
+        state = self.redis_adapter.hgetall(self.state_key)
+        return {self._decode(key): json.loads(value) for key, value in state.items()}
+
+    def retrieve(self, key: str) -> Any:
+
+        """
+        Метод достаёт из Redis значение одного ключа (один HGET).
+
+        Args:
+            key: ключ
+
+        Returns:
+            Вернёт значение ключа или None.
+        """
+
+        value = self.redis_adapter.hget(self.state_key, key)
+        return None if value is None else json.loads(value)
+
+    def compare_and_set(self, expected: dict, state: dict) -> bool:
+
+        """
+        Метод атомарно сохраняет состояние, если ключи из expected не изменились.
+
+        Args:
+            expected: ожидаемые значения ключей (None — ключа нет)
+            state: состояние, которое нужно записать
+
+        Returns:
+            Вернёт True, если состояние записано.
         """
 
-        output = {}
-        for key in self.redis_adapter.keys():
-            output[key] = self.redis_adapter.get(key)
+        fields = [*expected.items(), *state.items()]
+        pairs = [argument for key, value in fields for argument in (key, json.dumps(value))]
+        return bool(self._compare_and_set(keys=[self.state_key], args=[len(expected), *pairs]))
 
-        return output
+    def _decode(self, key: Any) -> str:
 
+        """
+        Метод приводит поле хэша к строке (если соединение не декодирует ответы, поля приходят в bytes).
 
-class JsonFileStorage(BaseStorage):
+        Args:
+            key: поле хэша
+
+        Returns:
+            Вернёт строку.
+        """
+
+        return key.decode() if isinstance(key, bytes) else key
+
+
+class JsonFileStorage(BaseStorage):  # noqa: WPS214
 
     """
     Класс для работы с файлом формата JSON.
     Реализованы запись и чтение.
+
+    Состояние читается с диска один раз и дальше живёт в памяти: чтение не трогает файл.
+    Запись отложенная (write-behind): файл переписывается, когда накопилось flush_updates изменений
+    или прошло flush_interval секунд с первого несохранённого (это делает фоновый поток),
+    и обязательно при flush() — его нужно вызвать при остановке процесса.
+    Файл пишется атомарно: во временный файл рядом, fsync и переименование поверх старого,
+    поэтому падение во время записи не оставляет обрезанный json.
+
+    По умолчанию (flush_updates=1) каждое изменение сразу пишется на диск.
     """
 
-    def __init__(self, file_path: Optional[str] = None):
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        flush_interval: float = 0,
+        flush_updates: int = 1
+    ):
 
         """
         Конструктор.
 
         Args:
             file_path: путь до хранилища
+            flush_interval: через сколько секунд после изменения записать его на диск (0 — не ждать по времени)
+            flush_updates: после скольких изменений записать их на диск
         """
 
         self.file_path = file_path if file_path else ''
         self.json_file = Path(self.file_path)
+        self.flush_interval = flush_interval
+        self.flush_updates = max(flush_updates, 1)
+
+        self._lock = RLock()
+        self._state: Optional[dict] = None
+        self._pending = 0
+        self._wakeup = Event()
+        self._flusher: Optional[Thread] = None
+        if self.flush_updates > 1 or self.flush_interval > 0:
+            atexit.register(self.flush)  # Отложенные изменения записываются и при остановке процесса.
 
     def save_state(self, state: dict) -> None:
 
         """
-        Метод сохраняет состояние (dict) в json файл.
+        Метод сохраняет состояние (dict): сразу в памяти, на диск — по правилам отложенной записи.
 
         Args:
             state: состояние, словарь, который нужно записать в файл
         """
 
-        old_json_data = self.retrieve_state()
-
-        old_json_data.update(state)
-        new_json_data = json.dumps(old_json_data)
-        self.json_file.write_text(new_json_data)
+        with self._lock:
+            self._cached().update(state)
+            self._pending += 1
+            if self._pending >= self.flush_updates:
+                self.flush()
+            elif self.flush_interval > 0:
+                self._schedule()
 
     def retrieve_state(self) -> dict:
 
         """
-        Метод достаёт из файла json данные и преобразует их в объект словарь.
+        Метод возвращает состояние из памяти (с диска оно читается только в первый раз).
 
         Returns:
             Вернёт словарь, в котором будет содержимое json.
             Если такого файла еще не существует — пустой словарь.
         """
 
-        if not self.json_file.exists():
-            return {}
+        with self._lock:
+            return dict(self._cached())
+
+    def compare_and_set(self, expected: dict, state: dict) -> bool:
+
+        """
+        Метод сохраняет состояние, если ключи из expected не изменились (проверка и запись под блокировкой).
+
+        Args:
+            expected: ожидаемые значения ключей (None — ключа нет)
+            state: состояние, которое нужно записать
+
+        Returns:
+            Вернёт True, если состояние записано.
+        """
+
+        with self._lock:
+            return super().compare_and_set(expected, state)
+
+    def flush(self) -> None:
+
+        """Метод записывает несохранённые изменения на диск (атомарно)."""
+
+        with self._lock:
+            if not self._pending:
+                return
+
+            temporary = Path(f'{self.file_path}.tmp')
+            with open(temporary, 'w') as json_file:
+                json.dump(self._cached(), json_file)
+                json_file.flush()
+                os.fsync(json_file.fileno())
+            os.replace(temporary, self.json_file)
+            self._pending = 0
+
+    def _cached(self) -> dict:
+
+        """
+        Метод возвращает состояние в памяти, при первом обращении читая его из файла.
+
+        Returns:
+            Вернёт словарь состояния.
+        """
+
+        if self._state is None:
+            self._state = json.loads(self.json_file.read_text()) if self.json_file.exists() else {}
+        return self._state
+
+    def _schedule(self) -> None:
+
+        """Метод будит (при первом вызове — запускает) фоновый поток, который сбросит изменения по таймеру."""
+
+        if self._flusher is None:
+            self._flusher = Thread(target=self._flush_periodically, name='state-flush', daemon=True)
+            self._flusher.start()
+        self._wakeup.set()
+
+    def _flush_periodically(self) -> None:
+
+        """Метод фонового потока: ждёт изменений и через flush_interval записывает их на диск."""
+
+        while True:
+            self._wakeup.wait()
+            sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError as error:
+                logger.error('State has not been flushed to %s: %s', self.json_file, error)
+
+
+# Точки продолжения по (индекс, исходная таблица, раздел): у каждой тройки свои ключи.
+CHECKPOINTS_TABLE = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    index_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (index_name, source, partition, key)
+) WITHOUT ROWID
+"""
+# updated_at — время Unix в секундах (юлианский день 2440587.5 — это 1970-01-01).
+UPSERT_CHECKPOINT = """
+INSERT INTO checkpoints (index_name, source, partition, key, value, updated_at)
+VALUES (?, ?, ?, ?, ?, (julianday('now') - 2440587.5) * 86400)
+ON CONFLICT (index_name, source, partition, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+"""
+SELECT_CHECKPOINTS = 'SELECT key, value FROM checkpoints WHERE index_name = ? AND source = ? AND partition = ?'
+
+
+class SqliteStorage(BaseStorage):  # noqa: WPS214
+
+    """
+    Класс для работы с SQLite.
+    Реализованы запись и чтение.
+
+    Состояние хранится раздельно для каждой тройки (индекс, исходная таблица, раздел):
+    пересборка одного индекса, точечная досинхронизация или параллельная загрузка по разделам
+    не сдвигают чужие точки продолжения. Экземпляр хранилища привязан к одной тройке,
+    для другой есть scoped (база та же).
+
+    База в режиме WAL с synchronous=NORMAL: коммит — это запись в журнал без fsync,
+    читатели не блокируют писателя, а после падения процесса база остаётся целой.
+    У каждого потока своё соединение, писатели ждут друг друга не дольше busy_timeout.
+    """
+
+    def __init__(
+        self,
+        file_path: str = 'state.sqlite3',
+        index_name: str = '',
+        source: str = '',
+        partition: str = '',
+        busy_timeout: float = 30
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            file_path: путь до базы SQLite
+            index_name: индекс ElasticSearch
+            source: исходная таблица Postgres
+            partition: раздел (для параллельной загрузки)
+            busy_timeout: сколько секунд писатель ждёт, пока база занята другим
+        """
+
+        self.file_path = file_path
+        self.scope = (index_name, source, partition)
+        self.busy_timeout = busy_timeout
+        self._connections = local()
+
+        with self._transaction() as connection:
+            connection.execute(CHECKPOINTS_TABLE)
+
+    def scoped(self, index_name: str, source: str, partition: str = '') -> 'SqliteStorage':
+
+        """
+        Метод возвращает хранилище той же базы для другой тройки (индекс, таблица, раздел).
+
+        Args:
+            index_name: индекс ElasticSearch
+            source: исходная таблица Postgres
+            partition: раздел
+
+        Returns:
+            Вернёт хранилище состояния.
+        """
+
+        return SqliteStorage(self.file_path, index_name, source, partition, self.busy_timeout)
+
+    def save_state(self, state: dict) -> None:
+
+        """
+        Метод сохраняет состояние (dict) в SQLite одной транзакцией.
+
+        Args:
+            state: состояние, словарь, который нужно записать
+        """
+
+        with self._transaction() as connection:
+            self._upsert(connection, state)
+
+    def retrieve_state(self) -> dict:
+
+        """
+        Метод достаёт из SQLite состояние своей тройки (индекс, таблица, раздел).
+
+        Returns:
+            Вернёт словарь состояния.
+        """
+
+        rows = self._connection().execute(SELECT_CHECKPOINTS, self.scope).fetchall()
+        return {key: json.loads(row_value) for key, row_value in rows}
+
+    def retrieve(self, key: str) -> Any:
+
+        """
+        Метод достаёт из SQLite значение одного ключа.
+
+        Args:
+            key: ключ
+
+        Returns:
+            Вернёт значение ключа или None.
+        """
+
+        query = f'{SELECT_CHECKPOINTS} AND key = ?'
+        row = self._connection().execute(query, (*self.scope, key)).fetchone()
+        return None if row is None else json.loads(row[1])
+
+    def compare_and_set(self, expected: dict, state: dict) -> bool:
 
-        return json.loads(self.json_file.read_text())
+        """
+        Метод сохраняет состояние, если ключи из expected не изменились (проверка и запись в одной транзакции).
+
+        Args:
+            expected: ожидаемые значения ключей (None — ключа нет)
+            state: состояние, которое нужно записать
+
+        Returns:
+            Вернёт True, если состояние записано.
+        """
+
+        with self._transaction() as connection:
+            rows = connection.execute(SELECT_CHECKPOINTS, self.scope).fetchall()
+            current = {key: json.loads(row_value) for key, row_value in rows}
+            if any(current.get(key) != row_value for key, row_value in expected.items()):
+                return False
+            self._upsert(connection, state)
+        return True
+
+    def _upsert(self, connection: sqlite3.Connection, state: dict) -> None:
+
+        """
+        Метод записывает ключи состояния (внутри уже открытой транзакции).
+
+        Args:
+            connection: соединение с открытой транзакцией
+            state: состояние, которое нужно записать
+        """
+
+        rows = [(*self.scope, key, json.dumps(row_value)) for key, row_value in state.items()]
+        connection.executemany(UPSERT_CHECKPOINT, rows)
+
+    def _connection(self) -> sqlite3.Connection:
+
+        """
+        Метод возвращает соединение текущего потока (при первом обращении — открывает его).
+
+        Returns:
+            Вернёт соединение с базой.
+        """
+
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            # isolation_level=None: транзакции открываются явно (BEGIN IMMEDIATE в _transaction).
+            connection = sqlite3.connect(self.file_path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._connections.connection = connection
+        return connection
+
+    def _transaction(self) -> sqlite3.Connection:
+
+        """
+        Метод открывает транзакцию записи.
+        BEGIN IMMEDIATE сразу берёт блокировку писателя,
+        поэтому чтение и запись внутри неё не упадут на середине из-за другого писателя.
+
+        Returns:
+            Вернёт соединение (контекстный менеджер: COMMIT при выходе, ROLLBACK при ошибке).
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
 
 
 class State:
@@ -139,16 +540,19 @@ class State:
     В целом ничего не мешает поменять это поведение на работу с БД или распределённым хранилищем.
     """
 
-    def __init__(self, storage: BaseStorage):
+    def __init__(self, storage: BaseStorage, compare_and_set: bool = False):
 
         """
         Конструктор.
 
         Args:
             storage: объект типа хранилища, в нём должны быть реализованы методы чтения и записи
+            compare_and_set: записывать состояние, только если его не изменил никто другой
         """
 
         self.storage = storage
+        self.compare_and_set = compare_and_set
+        self._known: Dict[str, Any] = {}  # Последние прочитанные или записанные этим процессом значения.
 
     def set_state(self, key: str, value: Any) -> None:  # noqa: WPS615
 
@@ -160,7 +564,37 @@ class State:
             value: значение этого ключа
         """
 
-        self.storage.save_state({key: value})
+        self.set_states({key: value})
+
+    def set_states(self, states: dict) -> None:
+
+        """
+        Метод устанавливает состояние сразу для нескольких ключей.
+        Все ключи записываются в хранилище одной операцией
+        (так пара (время, id) для keyset режима никогда не окажется записана наполовину).
+
+        Если включён compare_and_set, запись пройдёт, только если в хранилище те же значения,
+        что этот процесс видел последними (так второй экземпляр ETL с тем же состоянием
+        не перезапишет точку продолжения незаметно).
+
+        Args:
+            states: словарь, ключи и значения которого нужно записать
+
+        Raises:
+            RuntimeError: состояние изменил кто-то другой
+        """
+
+        if not self.compare_and_set:
+            self.storage.save_state(states)
+            return
+
+        for unknown in states.keys() - self._known.keys():
+            self.get_state(unknown)
+        expected = {key: self._known[key] for key in states}
+        if not self.storage.compare_and_set(expected, states):
+            keys = ', '.join(states)
+            raise RuntimeError(f'State ({keys}) has been changed by another process.')
+        self._known.update(states)
 
     def get_state(self, key: str) -> Any:  # noqa: WPS615
 
@@ -175,8 +609,14 @@ class State:
             если такого ключа не нашлось — None.
         """
 
-        current_storage = self.storage.retrieve_state()
-        return current_storage.get(key, None)
+        self._known[key] = self.storage.retrieve(key)
+        return self._known[key]
+
+    def flush(self) -> None:
+
+        """Метод записывает отложенные изменения состояния (вызывать при остановке процесса)."""
+
+        self.storage.flush()
 
 
 def main() -> None:
@@ -198,5 +638,33 @@ def main() -> None:
     print(state.get_state('lastname'))  # noqa: WPS421
 
 
+def create_storage(settings: 'ETLSettings') -> BaseStorage:
+
+    """
+    Функция создаёт хранилище состояния по настройкам: файл json, база SQLite или хэш в Redis.
+
+    Args:
+        settings: настройки ETL
+
+    Returns:
+        Вернёт хранилище состояния.
+    """
+
+    if settings.state_storage == 'sqlite':
+        return SqliteStorage(settings.state_database, settings.index_name, settings.state_source)
+    if settings.state_storage != 'redis':
+        return JsonFileStorage(settings.state_file, settings.state_flush_interval, settings.state_flush_updates)
+
+    redis_parameters = settings.redis_parameters
+    redis_adapter = Redis(
+        host=redis_parameters.redis_host,
+        port=redis_parameters.redis_port,
+        db=redis_parameters.redis_db,
+    )
+    return RedisStorage(redis_adapter, namespace=settings.state_namespace)
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
 if __name__ == '__main__':
     main()
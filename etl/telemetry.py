@@ -0,0 +1,414 @@
+"""Модуль содержит запуск ffmpeg с разбором его прогресса (-progress) в метрики и лог."""
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import lru_cache
+from time import monotonic
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from log import create_logger
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+PROGRESS_PERIOD = 5  # Как часто (сек.) ffmpeg сообщает о прогрессе и как часто он пишется в лог.
+PROBE_TIMEOUT = 10  # Сколько секунд ждать ffmpeg, когда проверяем, знает ли он опцию.
+KIBIBYTE = 1024
+MEBIBYTE = KIBIBYTE * KIBIBYTE
+MICROSECONDS = 1e6
+RUN_SECONDS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+RUN_SPEED_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+PEAK_RSS_BUCKETS = tuple(size * MEBIBYTE for size in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+ENCODE_FPS = REGISTRY.register(Gauge('transcode_encode_fps', 'Frames encoded per second by running ffmpeg.'))
+SPEED = REGISTRY.register(Gauge('transcode_speed', 'Encoding speed of running ffmpeg as a multiple of realtime.'))
+DONE = REGISTRY.register(Gauge('transcode_progress_ratio', 'Share of the source encoded by running ffmpeg.'))
+ETA = REGISTRY.register(Gauge('transcode_eta_seconds', 'Estimated time left for running ffmpeg.'))
+RUNS = REGISTRY.register(Counter('transcode_runs_total', 'Finished ffmpeg runs by stage and status.'))
+RUN_SECONDS = REGISTRY.register(
+    Histogram('transcode_run_seconds', 'Wall time of ffmpeg runs by stage.', RUN_SECONDS_BUCKETS),
+)
+RUN_SPEED = REGISTRY.register(
+    Histogram('transcode_run_speed', 'Average speed of finished ffmpeg runs by stage.', RUN_SPEED_BUCKETS),
+)
+PEAK_RSS = REGISTRY.register(
+    Histogram('transcode_peak_rss_bytes', 'Peak resident memory of finished ffmpeg runs by stage.', PEAK_RSS_BUCKETS),
+)
+
+
+class FfmpegRun(NamedTuple):
+
+    """
+    Запуск ffmpeg: команда, видео, этап и длительность отрезка.
+
+    Этап — dash, rendition, chunk, audio или mux. По длительности кодируемого отрезка (в секундах)
+    считаются процент и ETA.
+    """
+
+    command: List[str]
+    video: str = ''
+    stage: str = 'ffmpeg'
+    duration: Optional[float] = None
+
+
+class RunStats(NamedTuple):
+
+    """Итог запуска ffmpeg: этап, статус, время (сек.), средняя скорость и пиковая память (байт)."""
+
+    video: str
+    stage: str
+    status: str
+    seconds: float
+    speed: float
+    peak_rss: int
+
+
+class RunCollector:
+
+    """
+    Класс сборщика итогов запусков ffmpeg.
+
+    В режиме transcode_mode='pool' ffmpeg запускают процессы пула, а их метрики никто не отдаёт:
+    сервер метрик работает в родительском процессе. Поэтому процесс пула собирает итоги запусков задачи
+    и возвращает их вместе с результатом, а родитель записывает их в свои метрики (см. record_run).
+
+    Список сбора хранится в контексте (contextvars), а не в классе: одновременные блоки collecting
+    в разных потоках одного процесса собирают каждый свои запуски. Потоки run_commands получают
+    копию контекста того потока, который их запустил.
+    """
+
+    _runs: ContextVar[Optional[List[RunStats]]] = ContextVar('ffmpeg_runs', default=None)
+
+    @classmethod
+    @contextmanager
+    def collecting(cls) -> Iterator[List[RunStats]]:
+
+        """
+        Контекстный менеджер, собирающий итоги запусков ffmpeg в блоке with.
+
+        Yields:
+            Список, в который попадут итоги запусков.
+        """
+
+        runs: List[RunStats] = []
+        token = cls._runs.set(runs)
+        try:
+            yield runs
+        finally:
+            cls._runs.reset(token)
+
+    @classmethod
+    def add(cls, stats: RunStats) -> None:
+
+        """
+        Метод запоминает итог запуска, если сейчас идёт сбор.
+
+        Args:
+            stats: итог запуска
+        """
+
+        runs = cls._runs.get()
+        if runs is not None:
+            runs.append(stats)
+
+
+class TranscodeProgress:  # noqa: WPS214
+
+    """
+    Класс прогресса одного запуска ffmpeg.
+
+    ffmpeg с -progress пишет блоки строк key=value (frame, fps, out_time_us, speed, ...),
+    каждый блок заканчивается строкой progress=continue или progress=end.
+    """
+
+    def __init__(self, duration: Optional[float] = None) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            duration: длительность кодируемого отрезка в секундах
+        """
+
+        self.duration = duration
+        self.fields: Dict[str, str] = {}
+        self.started = monotonic()
+        self.reported = self.started
+
+    def update(self, line: str) -> bool:
+
+        """
+        Метод разбирает строку вывода -progress.
+
+        Args:
+            line: строка key=value
+
+        Returns:
+            Вернёт True, если строка закрыла блок (можно отчитаться о прогрессе).
+        """
+
+        key, separator, field = line.strip().partition('=')
+        if not separator:
+            return False
+        self.fields[key] = field.strip()
+        return key == 'progress'
+
+    def due(self) -> bool:
+
+        """
+        Метод решает, пора ли отчитаться о прогрессе: не чаще, чем раз в PROGRESS_PERIOD секунд, и в конце.
+        Без -stats_period ffmpeg пишет блоки каждые полсекунды.
+
+        Returns:
+            Вернёт True, если пора (и запомнит время отчёта).
+        """
+
+        now = monotonic()
+        if now - self.reported < PROGRESS_PERIOD and self.fields.get('progress') != 'end':
+            return False
+        self.reported = now
+        return True
+
+    def number(self, key: str) -> Optional[float]:
+
+        """
+        Метод возвращает числовое поле блока (ffmpeg пишет N/A, пока значения нет).
+
+        Args:
+            key: название поля
+
+        Returns:
+            Вернёт значение или None.
+        """
+
+        try:
+            return float(self.fields.get(key, '').rstrip('x'))
+        except ValueError:
+            return None
+
+    @property
+    def position(self) -> float:
+
+        """
+        Свойство возвращает, до какой секунды отрезка ffmpeg дошёл.
+
+        Returns:
+            Вернёт позицию в секундах.
+        """
+
+        out_time_us = self.number('out_time_us')
+        return max(out_time_us / MICROSECONDS, 0) if out_time_us is not None else 0
+
+    @property
+    def speed(self) -> float:
+
+        """
+        Свойство возвращает скорость кодирования относительно реального времени (2.0 — вдвое быстрее).
+        Если ffmpeg её ещё не знает, скорость считается по позиции и прошедшему времени.
+
+        Returns:
+            Вернёт скорость.
+        """
+
+        speed = self.number('speed')
+        if speed:
+            return speed
+        elapsed = monotonic() - self.started
+        return self.position / elapsed if elapsed > 0 else 0
+
+    @property
+    def done(self) -> Optional[float]:
+
+        """
+        Свойство возвращает долю закодированного отрезка.
+
+        Returns:
+            Вернёт долю от 0 до 1 или None, если длительность отрезка неизвестна.
+        """
+
+        if not self.duration:
+            return None
+        if self.fields.get('progress') == 'end':
+            return 1
+        return min(self.position / self.duration, 1)
+
+    @property
+    def eta(self) -> Optional[float]:
+
+        """
+        Свойство возвращает оценку оставшегося времени.
+
+        Returns:
+            Вернёт секунды или None, если оценить нельзя.
+        """
+
+        if not self.duration or not self.speed:
+            return None
+        return max(self.duration - self.position, 0) / self.speed
+
+
+def report_progress(run: FfmpegRun, progress: TranscodeProgress) -> None:
+
+    """
+    Функция публикует прогресс запуска в метрики и пишет строку лога key=value.
+
+    Args:
+        run: запуск ffmpeg
+        progress: прогресс запуска
+    """
+
+    labels = {'video': run.video, 'stage': run.stage}
+    fps = progress.number('fps') or 0
+    ENCODE_FPS.set(fps, **labels)
+    SPEED.set(progress.speed, **labels)
+    done, eta = progress.done, progress.eta
+    if done is not None:
+        DONE.set(done, **labels)
+    if eta is not None:
+        ETA.set(eta, **labels)
+
+    percent = 'n/a' if done is None else '{0:.1f}'.format(done * 100)
+    seconds = 'n/a' if eta is None else f'{eta:.0f}'
+    logger.info(
+        'Transcode progress: video=%s stage=%s fps=%.1f speed=%.2fx done=%s%% eta=%ss',
+        run.video,
+        run.stage,
+        fps,
+        progress.speed,
+        percent,
+        seconds,
+    )
+
+
+def finish_run(run: FfmpegRun, progress: TranscodeProgress, success: bool, peak_rss: int) -> None:
+
+    """
+    Функция публикует итог запуска: время, среднюю скорость и пиковую память ffmpeg.
+    Датчики выполняющегося запуска убираются, чтобы метрики не копились по завершённым видео.
+
+    Args:
+        run: запуск ffmpeg
+        progress: прогресс запуска
+        success: завершился ли ffmpeg успешно
+        peak_rss: пиковая резидентная память ffmpeg в байтах
+    """
+
+    elapsed = monotonic() - progress.started
+    speed = progress.position / elapsed if elapsed > 0 else 0
+    stats = RunStats(run.video, run.stage, 'done' if success else 'failed', elapsed, speed, peak_rss)
+
+    for gauge in (ENCODE_FPS, SPEED, DONE, ETA):
+        gauge.remove(video=run.video, stage=run.stage)
+    record_run(stats)
+    RunCollector.add(stats)
+
+    logger.info(
+        'Transcode finished: video=%s stage=%s status=%s seconds=%.1f speed=%.2fx peak_rss_mib=%.1f',
+        run.video,
+        run.stage,
+        stats.status,
+        elapsed,
+        speed,
+        peak_rss / MEBIBYTE,
+    )
+
+
+def record_run(stats: RunStats) -> None:
+
+    """
+    Функция записывает итог запуска ffmpeg в метрики процесса.
+
+    Args:
+        stats: итог запуска
+    """
+
+    RUNS.inc(stage=stats.stage, status=stats.status)
+    RUN_SECONDS.observe(stats.seconds, stage=stats.stage)
+    PEAK_RSS.observe(stats.peak_rss, stage=stats.stage)
+    if stats.speed:
+        RUN_SPEED.observe(stats.speed, stage=stats.stage)
+
+
+@lru_cache(maxsize=None)
+def supports_option(binary: str, option: str, option_value: str) -> bool:
+
+    """
+    Функция проверяет, знает ли ffmpeg опцию (например, -stats_period есть только с ffmpeg 4.4).
+    Результат кешируется: ffmpeg запускается один раз на процесс, а не на каждое видео.
+
+    Args:
+        binary: путь до ffmpeg
+        option: опция
+        option_value: значение опции
+
+    Returns:
+        Вернёт True, если ffmpeg принял опцию.
+    """
+
+    command = [binary, '-hide_banner', option, option_value, '-version']
+    try:
+        completed = subprocess.run(command, capture_output=True, timeout=PROBE_TIMEOUT, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return completed.returncode == 0
+
+
+def run_command(run: FfmpegRun) -> bool:
+
+    """
+    Функция запускает ffmpeg и следит за его прогрессом.
+
+    ffmpeg пишет прогресс (-progress) в stdout каждые PROGRESS_PERIOD секунд (ffmpeg старше 4.4
+    не знает -stats_period и пишет чаще, но отчёты всё равно не чаще PROGRESS_PERIOD), из него считаются
+    fps, скорость, процент и ETA (см. report_progress). Процесс собирается через os.wait4:
+    так известна пиковая память (ru_maxrss) именно этого ffmpeg, а не всех дочерних процессов.
+
+    Args:
+        run: запуск ffmpeg
+
+    Returns:
+        Вернёт True, если ffmpeg завершился успешно.
+    """
+
+    binary, *arguments = run.command
+    period = ['-stats_period', f'{PROGRESS_PERIOD}']
+    if not supports_option(binary, *period):
+        period = []
+    command = [binary, '-progress', 'pipe:1', *period, '-nostats', *arguments]
+    progress = TranscodeProgress(run.duration)
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, text=True) as process:
+        for line in process.stdout:  # type: ignore
+            if progress.update(line) and progress.due():
+                report_progress(run, progress)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        success = process.returncode == 0
+
+    finish_run(run, progress, success, usage.ru_maxrss * KIBIBYTE)  # ru_maxrss в Linux — в килобайтах.
+    return success
+
+
+def run_commands(runs: List[FfmpegRun], workers: int) -> bool:
+
+    """
+    Функция запускает команды ffmpeg, не больше workers одновременно.
+    Каждый ffmpeg и так отдельный процесс, поэтому ждём их из потоков, а не из пула процессов.
+    Каждая команда выполняется в копии текущего контекста: её итог попадает в тот же RunCollector.collecting.
+
+    Args:
+        runs: запуски ffmpeg
+        workers: сколько команд выполнять одновременно
+
+    Returns:
+        Вернёт True, если все команды выполнились успешно.
+    """
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(copy_context().run, run_command, run) for run in runs]
+        results = [future.result() for future in futures]  # Ждём все команды, даже если одна уже упала.
+    return all(results)
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
@@ -0,0 +1,12 @@
+"""Общие настройки тестов ETL: модули etl импортируются по имени, как в контейнере (PYTHONPATH=etl)."""
+import os
+import sys
+from pathlib import Path
+
+ETL_DIR = Path(__file__).resolve().parents[1]
+
+sys.path.insert(0, str(ETL_DIR))
+
+# Настройки ETL (models.config) создаются при импорте и требуют параметров Postgres.
+for variable in ('DBNAME', 'USER', 'PASSWORD'):
+    os.environ.setdefault(variable, 'test')
@@ -0,0 +1,58 @@
+"""Тесты передачи точки продолжения основному ETL после загрузки каталога."""
+from pathlib import Path
+
+import pytest
+
+import backfill
+from state_storage import JsonFileStorage
+
+STARTED = '2022-01-02 00:00:00+00:00'
+
+
+@pytest.fixture(name='storage')
+def storage_fixture(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> JsonFileStorage:
+
+    """
+    Фикстура подменяет хранилище состояния основного ETL.
+
+    Args:
+        monkeypatch: подмена хранилища
+        tmp_path: временная директория
+
+    Returns:
+        Вернёт хранилище.
+    """
+
+    storage = JsonFileStorage(str(tmp_path / 'state.json'))
+    monkeypatch.setattr(backfill, 'create_storage', lambda _: storage)
+    return storage
+
+
+def test_older_checkpoint_is_moved(storage: JsonFileStorage) -> None:
+
+    """
+    Точка старее начала загрузки сдвигается на начало загрузки.
+
+    Args:
+        storage: хранилище
+    """
+
+    storage.save_state({'time': '2022-01-01 00:00:00+00:00', 'id': 'first'})
+    backfill.hand_over(STARTED)
+    assert storage.retrieve('time') == STARTED
+    assert storage.retrieve('sweep_time') == STARTED
+
+
+def test_newer_checkpoint_is_kept(storage: JsonFileStorage) -> None:
+
+    """
+    Точку, которую основной ETL сдвинул дальше начала загрузки, загрузка не откатывает.
+
+    Args:
+        storage: хранилище
+    """
+
+    checkpoint = {'time': '2022-01-03 00:00:00+00:00', 'id': 'second'}
+    storage.save_state(dict(checkpoint))
+    backfill.hand_over(STARTED)
+    assert storage.retrieve_state() == checkpoint
@@ -0,0 +1,259 @@
+"""Тесты функции backoff и автомата отключения."""
+import asyncio
+from types import MappingProxyType
+from typing import Callable, List
+
+import pytest
+
+import backoff_function
+from backoff_function import CircuitBreaker, CircuitOpenError, backoff
+
+FAST = MappingProxyType({'start_sleep_time': 0.001, 'border_sleep_time': 0.001})
+
+
+class DependencyError(Exception):
+
+    """Ошибка зависимости (её backoff повторяет)."""
+
+
+def flaky(failures: int, error: Exception, calls: List[int]) -> Callable[[], str]:
+
+    """
+    Функция создаёт функцию, которая падает failures раз подряд, а затем возвращает 'ok'.
+
+    Args:
+        failures: сколько раз упасть
+        error: с какой ошибкой
+        calls: сюда записывается каждый вызов
+
+    Returns:
+        Вернёт функцию.
+    """
+
+    def call() -> str:
+
+        """
+        Вызов зависимости.
+
+        Returns:
+            Вернёт 'ok'.
+
+        Raises:
+            error: первые failures вызовов
+        """
+
+        calls.append(len(calls))
+        if len(calls) <= failures:
+            raise error
+        return 'ok'
+
+    return call
+
+
+def fail_attempt(breaker: CircuitBreaker, error: Exception) -> None:
+
+    """
+    Функция выполняет через автомат попытку, которая падает.
+
+    Args:
+        breaker: автомат
+        error: ошибка попытки
+
+    Raises:
+        error: всегда
+    """
+
+    with breaker.attempt((DependencyError,)):
+        raise error
+
+
+def test_dependency_errors_are_retried() -> None:
+
+    """Ошибки из retry_on повторяются, пока вызов не удастся."""
+
+    calls: List[int] = []
+    call = backoff(retry_on=(DependencyError,), **FAST)(flaky(2, DependencyError(), calls))
+    assert call() == 'ok'
+    assert len(calls) == 3
+
+
+def test_other_errors_are_raised_at_once() -> None:
+
+    """Ошибки не из retry_on (например, ошибка в данных) пробрасываются без повторов."""
+
+    calls: List[int] = []
+    call = backoff(retry_on=(DependencyError,), **FAST)(flaky(2, ValueError(), calls))
+    with pytest.raises(ValueError):
+        call()
+    assert len(calls) == 1
+
+
+def test_attempts_budget() -> None:
+
+    """Когда попытки кончились, пробрасывается последняя ошибка."""
+
+    calls: List[int] = []
+    call = backoff(retry_on=(DependencyError,), max_attempts=3, **FAST)(flaky(5, DependencyError(), calls))
+    with pytest.raises(DependencyError):
+        call()
+    assert len(calls) == 3
+
+
+def test_time_budget() -> None:
+
+    """Повтор, пауза перед которым выходит за max_time, не выполняется."""
+
+    calls: List[int] = []
+    decorator = backoff(start_sleep_time=1, border_sleep_time=1, retry_on=(DependencyError,), max_time=0)
+    call = decorator(flaky(5, DependencyError(), calls))
+    with pytest.raises(DependencyError):
+        call()
+    assert len(calls) == 1
+
+
+def test_async_functions_are_retried() -> None:
+
+    """Функции async def повторяются по той же политике."""
+
+    calls: List[int] = []
+    sync_call = flaky(2, DependencyError(), calls)
+
+    @backoff(retry_on=(DependencyError,), **FAST)
+    async def call() -> str:
+
+        """
+        Асинхронный вызов зависимости.
+
+        Returns:
+            Вернёт 'ok'.
+        """
+
+        await asyncio.sleep(0)
+        return sync_call()
+
+    assert asyncio.run(call()) == 'ok'
+    assert len(calls) == 3
+
+
+def test_async_budget() -> None:
+
+    """У async def функций бюджет попыток тот же: последняя ошибка пробрасывается."""
+
+    calls: List[int] = []
+    sync_call = flaky(5, DependencyError(), calls)
+
+    @backoff(retry_on=(DependencyError,), max_attempts=2, **FAST)
+    async def call() -> str:
+
+        """
+        Асинхронный вызов зависимости.
+
+        Returns:
+            Вернёт 'ok'.
+        """
+
+        return sync_call()
+
+    with pytest.raises(DependencyError):
+        asyncio.run(call())
+    assert len(calls) == 2
+
+
+def test_breaker_opens_after_threshold() -> None:
+
+    """После failure_threshold ошибок подряд автомат размыкается: вызовы не выполняются."""
+
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(DependencyError):
+            fail_attempt(breaker, DependencyError())
+    with pytest.raises(CircuitOpenError):
+        breaker.admit()
+
+
+def test_breaker_probe_closes(monkeypatch: pytest.MonkeyPatch) -> None:
+
+    """
+    Через reset_timeout автомат пропускает одну пробу (полуоткрыт), удачная проба его замыкает.
+
+    Args:
+        monkeypatch: подмена времени
+    """
+
+    now: List[float] = [0]
+    monkeypatch.setattr(backoff_function, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.failed()
+
+    now[0] = 10
+    assert breaker.admit()
+    with pytest.raises(CircuitOpenError):  # Проба уже выполняется — остальные вызовы ждут её.
+        breaker.admit()
+    breaker.succeeded()
+    assert not breaker.admit()
+
+
+def test_breaker_failed_probe_reopens(monkeypatch: pytest.MonkeyPatch) -> None:
+
+    """
+    Неудачная проба снова размыкает автомат на reset_timeout.
+
+    Args:
+        monkeypatch: подмена времени
+    """
+
+    now: List[float] = [0]
+    monkeypatch.setattr(backoff_function, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.failed()
+
+    now[0] = 10
+    with pytest.raises(DependencyError):
+        fail_attempt(breaker, DependencyError())
+    now[0] = 15
+    with pytest.raises(CircuitOpenError):
+        breaker.admit()
+    now[0] = 20
+    assert breaker.admit()
+
+
+def test_breaker_probe_released_by_other_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+
+    """
+    Проба, упавшая не из-за зависимости, освобождается: автомат не остаётся полуоткрытым навсегда.
+
+    Args:
+        monkeypatch: подмена времени
+    """
+
+    now: List[float] = [0]
+    monkeypatch.setattr(backoff_function, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.failed()
+
+    now[0] = 10
+    with pytest.raises(ValueError):
+        fail_attempt(breaker, ValueError())
+    assert breaker.admit()
+
+
+def test_backoff_waits_for_open_breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+
+    """
+    Отклонённая разомкнутым автоматом попытка тоже расходует бюджет: зависимость не вызывается.
+
+    Args:
+        monkeypatch: общий автомат для теста
+    """
+
+    breaker = CircuitBreaker('test-open', failure_threshold=1, reset_timeout=60)
+    breaker.failed()
+    monkeypatch.setitem(CircuitBreaker._shared, 'test-open', breaker)  # noqa: WPS437
+
+    calls: List[int] = []
+    call = backoff(retry_on=(DependencyError,), max_attempts=1, breaker='test-open', **FAST)(
+        flaky(0, DependencyError(), calls),
+    )
+    with pytest.raises(CircuitOpenError):
+        call()
+    assert not calls
@@ -0,0 +1,162 @@
+"""Тесты хэшей содержимого: какие документы и поля стадия load отправляет в ES."""
+import json
+from typing import Any, List, Optional
+
+from content_hashes import ContentHashes
+from documents import IndexDocument, build_document
+from etl_class import ETL
+
+INDEX = 'videos_ru'
+UUID = 'first-uuid'
+FAILED = 'failed-id'
+WHOLE = ['description', 'h1', 'id', 'title']  # noqa: WPS407  # Все поля документа.
+
+
+def document(document_id: str, description: str = 'description', index_name: str = INDEX) -> IndexDocument:
+
+    """
+    Функция собирает документ из строки PG.
+
+    Args:
+        document_id: id видео
+        description: описание видео
+        index_name: индекс ES
+
+    Returns:
+        Вернёт документ.
+    """
+
+    return build_document(index_name, (document_id, 'title', description, 'h1'))
+
+
+LOADED = document('1')
+
+
+def sent_fields(hashes: ContentHashes, documents: List[IndexDocument]) -> List[Optional[List[str]]]:
+
+    """
+    Функция возвращает поля, которые load отправил бы по каждому bulk действию (None — удаление).
+
+    Args:
+        hashes: хэши содержимого
+        documents: документы пачки
+
+    Returns:
+        Вернёт названия полей по действиям.
+    """
+
+    bodies = [body for _, body in hashes.changes(documents)]
+    return [sorted(json.loads(body)['doc']) if body else None for body in bodies]
+
+
+def loaded(uuid: str = UUID) -> ContentHashes:
+
+    """
+    Функция возвращает хэши, в которых документ LOADED уже загружен в индекс с UUID uuid.
+
+    Args:
+        uuid: UUID индекса
+
+    Returns:
+        Вернёт хэши содержимого.
+    """
+
+    hashes = ContentHashes()
+    hashes.track({INDEX: uuid})
+    hashes.remember([LOADED], [])
+    return hashes
+
+
+def test_new_documents_are_sent_whole() -> None:
+
+    """Документ без хэша отправляется целиком (doc_as_upsert создаст его)."""
+
+    assert sent_fields(ContentHashes(), [LOADED]) == [WHOLE]
+
+
+def test_unchanged_documents_are_skipped() -> None:
+
+    """Документ, который не изменился с прошлой загрузки, не отправляется."""
+
+    hashes = loaded()
+    assert not hashes.changes([LOADED])
+
+
+def test_only_changed_fields_are_sent() -> None:
+
+    """У изменившегося документа отправляются только изменившиеся поля."""
+
+    hashes = loaded()
+    assert sent_fields(hashes, [document(LOADED.document_id, 'new description')]) == [['description']]
+
+
+def test_failed_documents_are_not_remembered() -> None:
+
+    """Документ, который ES отказался загрузить, в следующий раз отправляется снова и целиком."""
+
+    hashes = ContentHashes()
+    pack = [LOADED, document(FAILED)]
+    hashes.remember(pack, [{'update': {'_id': FAILED, 'status': 400}}])
+    assert sent_fields(hashes, pack) == [WHOLE]
+
+
+def test_moved_documents_are_deleted() -> None:
+
+    """Видео сменило язык: документ уходит целиком в новый индекс и удаляется из прежнего."""
+
+    moved = document(LOADED.document_id, index_name='videos_en')
+    assert sent_fields(loaded(), [moved]) == [WHOLE, None]
+
+
+def test_same_index_keeps_hashes() -> None:
+
+    """Тот же UUID индекса: хэши остаются, документ без изменений не отправляется."""
+
+    hashes = loaded()
+    hashes.track({INDEX: UUID})
+    assert not hashes.changes([LOADED])
+
+
+def test_recreated_index_drops_hashes() -> None:
+
+    """Индекс пересоздан (другой UUID) или потерян: документы снова отправляются целиком."""
+
+    for uuid in ('second-uuid', ''):
+        hashes = loaded()
+        hashes.track({INDEX: uuid})
+        assert sent_fields(hashes, [document(LOADED.document_id, 'new description')]) == [WHOLE]
+
+
+class FakeIndices:
+
+    """Подставной клиент indices: отвечает как GET /{index} с filter_path."""
+
+    def get(self, **parameters: Any) -> dict:
+
+        """
+        Метод возвращает индекс videos_ru_1 под псевдонимом videos_ru (других индексов нет).
+
+        Args:
+            parameters: параметры запроса
+
+        Returns:
+            Вернёт ответ ES.
+        """
+
+        return {'videos_ru_1': {'aliases': {INDEX: {}}, 'settings': {'index': {'uuid': UUID}}}}
+
+
+class FakeElastic:
+
+    """Подставной клиент ES."""
+
+    indices = FakeIndices()
+
+
+def test_index_uuids_resolve_aliases() -> None:
+
+    """UUID псевдонима — UUID индекса под ним, у отсутствующего индекса UUID пустой."""
+
+    etl = ETL({}, '')
+    etl._elastic = FakeElastic()  # type: ignore  # noqa: WPS437
+    assert etl._index_uuids({INDEX, 'videos_en'}) == {INDEX: UUID, 'videos_en': ''}  # noqa: WPS437
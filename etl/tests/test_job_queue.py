@@ -0,0 +1,167 @@
+"""Тесты очереди задач на перекодирование (Redis — fakeredis со скриптами Lua)."""
+from typing import Any
+
+import fakeredis
+from redis import ConnectionError as RedisConnectionError
+
+from job_queue import CLAIM_PAGE, Lease, RedisJobQueue
+from transcoding import TranscodeJob
+
+JOB = TranscodeJob('video', 'video/1.mp4', 'audio/1.aac')
+
+
+def job_queue(**parameters: Any) -> RedisJobQueue:
+
+    """
+    Функция создаёт очередь на пустом Redis.
+
+    Args:
+        parameters: параметры очереди
+
+    Returns:
+        Вернёт очередь.
+    """
+
+    return RedisJobQueue(fakeredis.FakeStrictRedis(), **parameters)
+
+
+def claimed(queue: RedisJobQueue) -> Lease:
+
+    """
+    Функция берёт задачу в аренду (задача должна быть).
+
+    Args:
+        queue: очередь
+
+    Returns:
+        Вернёт аренду.
+    """
+
+    lease = queue.claim()
+    assert lease is not None
+    return lease
+
+
+def expire(queue: RedisJobQueue) -> None:
+
+    """
+    Функция «просрочивает» все аренды и возвращает задачи в очередь (как после падения воркера).
+
+    Args:
+        queue: очередь
+    """
+
+    for id_video in queue.redis_adapter.zrange(queue.leases_key, 0, -1):
+        queue.redis_adapter.zadd(queue.leases_key, {id_video: 0})
+    queue.requeue_expired()
+
+
+def test_ack_removes_job() -> None:
+
+    """Подтверждённая задача удаляется из очереди."""
+
+    queue = job_queue()
+    queue.submit([JOB])
+    lease = claimed(queue)
+    assert lease.job == JOB
+
+    queue.ack(lease)
+    assert queue.claim() is None
+    assert not queue.redis_adapter.exists(queue.jobs_key, queue.leases_key, queue.tokens_key)
+
+
+def test_stale_lease_does_not_ack() -> None:
+
+    """Аренда истекла, задачу забрал другой воркер: ack опоздавшего воркера её не удаляет."""
+
+    queue = job_queue()
+    queue.submit([JOB])
+    stale = claimed(queue)
+    expire(queue)
+    current = claimed(queue)
+
+    queue.ack(stale)
+    assert queue.extend(current)
+    assert not queue.extend(stale)
+    queue.ack(current)
+    assert not queue.redis_adapter.exists(queue.jobs_key)
+
+
+def test_stale_lease_does_not_fail() -> None:
+
+    """Вызов fail по истёкшей аренде не считает попытку и не откладывает задачу в failed."""
+
+    queue = job_queue(max_attempts=1)
+    queue.submit([JOB])
+    stale = claimed(queue)
+    expire(queue)
+
+    queue.fail(stale, 'error')
+    assert not queue.redis_adapter.exists(queue.failed_key, queue.attempts_key)
+    assert claimed(queue).job == JOB
+
+
+def test_repeated_fail_counts_once() -> None:
+
+    """Повтор fail (ответ Redis потерялся, backoff повторил вызов) не считает попытку дважды."""
+
+    queue = job_queue(retry_delay=0)
+    queue.submit([JOB])
+    lease = claimed(queue)
+
+    queue.fail(lease, 'error')
+    queue.fail(lease, 'error')
+    assert queue.redis_adapter.hget(queue.attempts_key, JOB.id_video) == b'1'
+
+
+def test_ack_retries_redis_errors() -> None:
+
+    """Сбой соединения с Redis при ack повторяется, а не роняет поток воркера."""
+
+    queue = job_queue()
+    queue.submit([JOB])
+    lease = claimed(queue)
+
+    script = queue._ack  # noqa: WPS437
+    calls = []
+
+    def flaky_ack(**parameters: Any) -> Any:
+
+        """
+        Скрипт ack, у которого первый вызов падает.
+
+        Args:
+            parameters: ключи и аргументы скрипта
+
+        Returns:
+            Вернёт результат скрипта.
+
+        Raises:
+            RedisConnectionError: первый вызов
+        """
+
+        calls.append(parameters)
+        if len(calls) == 1:
+            raise RedisConnectionError('connection reset')
+        return script(**parameters)
+
+    queue._ack = flaky_ack  # noqa: WPS437
+    queue.ack(lease)
+    assert len(calls) == 2
+    assert queue.claim() is None
+
+
+def test_claim_looks_beyond_first_page() -> None:
+
+    """Задачи по видео, которые уже в работе, не мешают найти свободную задачу и дальше первой страницы."""
+
+    queue = job_queue()
+    busy = [TranscodeJob(f'busy-{number}', 'video.mp4', 'audio.aac') for number in range(CLAIM_PAGE + 1)]
+    queue.submit(busy)
+    leases = [claimed(queue) for _ in busy]
+    queue.submit(busy)  # Новые версии видео, которые ещё перекодируются: их брать нельзя.
+    queue.submit([JOB])
+
+    assert claimed(queue).job == JOB
+    assert queue.claim() is None
+    assert len(leases) == len(busy)
@@ -0,0 +1,106 @@
+"""Тесты конвейерного (pipeline) режима ETL."""
+import os
+import json
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+from conftest import ETL_DIR
+
+EXIT_TIMEOUT = 30
+
+# Процесс с конвейером на подставном ETL: обход никогда не кончается (extract всегда отдаёт пачку),
+# а после первой загруженной пачки процесс пишет в stdout «loaded».
+CHILD = """
+import signal
+import sys
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import etl_process
+from notifications import SleepWaiter
+from state_storage import JsonFileStorage, State
+
+STARTED = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+class EndlessETL:
+
+    def __init__(self):
+        self.rows = 0
+        self.loaded = False
+
+    def extract_keyset(self, checkpoint, changed_since, pack_size):
+        rows = []
+        for _ in range(pack_size):
+            self.rows += 1
+            changed = STARTED + timedelta(seconds=self.rows)
+            rows.append((uuid4(), 'title', 'description', 'h1', None, None, True, False, 'ru', changed))
+        return rows
+
+    def transcode(self, row_data):
+        return None
+
+    def load(self, documents):
+        if not self.loaded:
+            self.loaded = True
+            print('loaded', flush=True)
+        return []
+
+
+signal.signal(signal.SIGTERM, etl_process.stop)
+state = State(JsonFileStorage(sys.argv[1]))
+etl_process.run_pipeline(EndlessETL(), state, SleepWaiter(1, etl_process.STOP))
+state.flush()
+"""
+
+
+def run_child(state_file: Path) -> subprocess.Popen:
+
+    """
+    Функция запускает процесс с конвейером и ждёт, пока он загрузит первую пачку.
+
+    Args:
+        state_file: файл состояния процесса
+
+    Returns:
+        Вернёт процесс.
+    """
+
+    environment = {**os.environ, 'PYTHONPATH': str(ETL_DIR)}
+    child = subprocess.Popen(
+        [sys.executable, '-c', CHILD, str(state_file)],
+        stdout=subprocess.PIPE,
+        text=True,
+        env=environment,
+        cwd=state_file.parent,
+    )
+    for line in child.stdout:  # type: ignore
+        if line.strip() == 'loaded':
+            break
+    return child
+
+
+def test_sigterm_stops_pipeline(tmp_path: Path) -> None:
+
+    """
+    SIGTERM посреди обхода останавливает конвейер: run_pipeline возвращается, состояние записано.
+
+    Args:
+        tmp_path: временная директория
+
+    Raises:
+        subprocess.TimeoutExpired: процесс завис (он убивается, чтобы не пережить тесты)
+    """
+
+    state_file = tmp_path / 'state.json'
+    child = run_child(state_file)
+    child.send_signal(signal.SIGTERM)
+    try:
+        returncode = child.wait(EXIT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        raise
+    assert returncode == 0
+    assert json.loads(state_file.read_text())['id']
@@ -0,0 +1,121 @@
+"""Тесты переключения псевдонимов после пересборки индексов."""
+from typing import Dict, List
+
+from documents import IndexRouter
+from reindex import swap_aliases
+
+ROUTER = IndexRouter('videos', ('ru', 'en'))
+
+
+class FakeIndices:
+
+    """Подставной клиент indices: индексы с их псевдонимами и последний запрос _aliases."""
+
+    def __init__(self, indexes: Dict[str, List[str]]) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            indexes: псевдонимы по названию индекса
+        """
+
+        self.indexes = indexes
+        self.actions: List[dict] = []
+
+    def exists_alias(self, name: str) -> bool:
+
+        """
+        Метод проверяет, есть ли псевдоним.
+
+        Args:
+            name: псевдоним
+
+        Returns:
+            Вернёт True, если псевдоним есть хотя бы у одного индекса.
+        """
+
+        return bool(self.get_alias(name))
+
+    def get_alias(self, name: str) -> Dict[str, dict]:
+
+        """
+        Метод возвращает индексы с псевдонимом.
+
+        Args:
+            name: псевдоним
+
+        Returns:
+            Вернёт индексы (как ответ ES).
+        """
+
+        return {index_name: {} for index_name, aliases in self.indexes.items() if name in aliases}
+
+    def exists(self, index: str) -> bool:
+
+        """
+        Метод проверяет, есть ли индекс (или псевдоним) с таким названием.
+
+        Args:
+            index: название
+
+        Returns:
+            Вернёт True, если он есть.
+        """
+
+        return index in self.indexes or self.exists_alias(index)
+
+    def update_aliases(self, body: dict) -> None:
+
+        """
+        Метод запоминает действия запроса _aliases.
+
+        Args:
+            body: тело запроса
+        """
+
+        self.actions = body['actions']
+
+
+class FakeElastic:
+
+    """Подставной клиент ES."""
+
+    def __init__(self, indexes: Dict[str, List[str]]) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            indexes: псевдонимы по названию индекса
+        """
+
+        self.indices = FakeIndices(indexes)
+
+
+def test_concrete_indexes_are_replaced() -> None:
+
+    """Индексы с названиями псевдонимов (в том числе общий индекс videos) удаляются в том же запросе."""
+
+    elastic = FakeElastic({'videos': [], 'videos_ru': []})
+    assert not swap_aliases(elastic, ROUTER, '2')  # type: ignore
+    assert elastic.indices.actions == [
+        {'remove_index': {'index': 'videos_ru'}},
+        {'remove_index': {'index': 'videos'}},
+        {'add': {'index': 'videos_ru_2', 'aliases': ['videos_ru', 'videos']}},
+        {'add': {'index': 'videos_en_2', 'aliases': ['videos_en', 'videos']}},
+    ]
+
+
+def test_aliases_are_moved() -> None:
+
+    """Псевдонимы снимаются с прежней версии (со всех индексов, где они есть) и ставятся на новую."""
+
+    elastic = FakeElastic({'videos_ru_1': ['videos_ru', 'videos'], 'videos_en_1': ['videos_en', 'videos']})
+    assert swap_aliases(elastic, ROUTER, '2') == ['videos_ru_1', 'videos_en_1']  # type: ignore
+    assert elastic.indices.actions[:4] == [
+        {'remove': {'index': 'videos_ru_1', 'alias': 'videos_ru'}},
+        {'remove': {'index': 'videos_en_1', 'alias': 'videos_en'}},
+        {'remove': {'index': 'videos_ru_1', 'alias': 'videos'}},
+        {'remove': {'index': 'videos_en_1', 'alias': 'videos'}},
+    ]
@@ -0,0 +1,84 @@
+"""Тесты хранилищ состояния: запись с проверкой (compare-and-set)."""
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable
+
+import fakeredis
+import pytest
+
+from state_storage import BaseStorage, JsonFileStorage, RedisStorage, SqliteStorage, State
+
+CHECKPOINT = MappingProxyType({'time': '2022-01-01T00:00:00+00:00', 'id': 'first'})
+NEWER = MappingProxyType({'time': '2022-01-02T00:00:00+00:00', 'id': 'second'})
+
+STORAGES: MappingProxyType[str, Callable[[Path], BaseStorage]] = MappingProxyType({
+    'redis': lambda _: RedisStorage(fakeredis.FakeStrictRedis()),
+    'sqlite': lambda directory: SqliteStorage(str(directory / 'state.sqlite3'), 'videos', 'video'),
+    'json': lambda directory: JsonFileStorage(str(directory / 'state.json')),
+})
+
+
+@pytest.fixture(name='storage', params=list(STORAGES))
+def storage_fixture(request: pytest.FixtureRequest, tmp_path: Path) -> BaseStorage:
+
+    """
+    Фикстура возвращает пустое хранилище каждого типа.
+
+    Args:
+        request: параметр фикстуры (тип хранилища)
+        tmp_path: временная директория
+
+    Returns:
+        Вернёт хранилище.
+    """
+
+    return STORAGES[request.param](tmp_path)  # type: ignore
+
+
+def test_first_write(storage: BaseStorage) -> None:
+
+    """
+    Первая запись (ключей ещё нет) проходит проверку.
+
+    Args:
+        storage: хранилище
+    """
+
+    State(storage, compare_and_set=True).set_states(dict(CHECKPOINT))
+    assert storage.retrieve_state() == CHECKPOINT
+
+
+def test_conflict(storage: BaseStorage) -> None:
+
+    """
+    Запись по устаревшим значениям отклоняется, а значения другого процесса остаются.
+
+    Args:
+        storage: хранилище
+    """
+
+    storage.save_state(dict(CHECKPOINT))
+    first, second = State(storage, compare_and_set=True), State(storage, compare_and_set=True)
+    first.get_state('time')
+    first.get_state('id')
+    second.set_states(dict(NEWER))
+
+    with pytest.raises(RuntimeError):
+        first.set_states({'time': '2022-01-03T00:00:00+00:00', 'id': 'third'})
+    assert storage.retrieve_state() == NEWER
+
+
+def test_check_without_write(storage: BaseStorage) -> None:
+
+    """
+    Проверка без новых значений (пустое состояние) ничего не пишет и не падает.
+
+    Args:
+        storage: хранилище
+    """
+
+    storage.save_state(dict(CHECKPOINT))
+    assert storage.compare_and_set({'id': 'first'}, {})
+    assert not storage.compare_and_set({'id': 'second'}, {})
+    assert storage.compare_and_set({}, {})
+    assert storage.retrieve_state() == CHECKPOINT
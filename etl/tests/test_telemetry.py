@@ -0,0 +1,85 @@
+"""Тесты сбора итогов запусков ffmpeg."""
+import shutil
+from threading import Barrier, Thread
+from typing import Dict, List
+
+import pytest
+
+from telemetry import FfmpegRun, RunCollector, RunStats, run_commands, supports_option
+
+FFMPEG = shutil.which('ffmpeg')
+needs_ffmpeg = pytest.mark.skipif(FFMPEG is None, reason='ffmpeg has not been found in PATH')
+
+
+def stats(video: str) -> RunStats:
+
+    """
+    Функция создаёт итог запуска.
+
+    Args:
+        video: видео
+
+    Returns:
+        Вернёт итог запуска.
+    """
+
+    return RunStats(video, 'dash', 'done', 1, 1, 0)
+
+
+def test_concurrent_collecting_is_separate() -> None:
+
+    """Одновременные блоки collecting в разных потоках собирают каждый только свои запуски."""
+
+    barrier = Barrier(2)
+    collected: Dict[str, List[RunStats]] = {}
+
+    def collect(video: str) -> None:
+
+        """
+        Функция собирает итог запуска, пока другой поток тоже собирает.
+
+        Args:
+            video: видео
+        """
+
+        with RunCollector.collecting() as runs:
+            barrier.wait()
+            RunCollector.add(stats(video))
+            barrier.wait()
+            collected[video] = runs
+
+    threads = [Thread(target=collect, args=(video,)) for video in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for started in threads:
+        started.join()
+    assert collected == {'first': [stats('first')], 'second': [stats('second')]}
+
+
+def test_nothing_is_collected_outside() -> None:
+
+    """Вне блока collecting итоги никуда не собираются."""
+
+    RunCollector.add(stats('video'))
+    with RunCollector.collecting() as runs:
+        assert not runs
+
+
+@needs_ffmpeg
+def test_run_commands_are_collected() -> None:
+
+    """Итоги запусков из потоков run_commands попадают в блок collecting вызвавшего потока."""
+
+    command = [FFMPEG, '-f', 'lavfi', '-i', 'nullsrc=d=0.1', '-f', 'null', '-']
+    with RunCollector.collecting() as runs:
+        assert run_commands([FfmpegRun(command, 'video', 'chunk')] * 2, 2)  # type: ignore
+        assert [run.status for run in runs] == ['done', 'done']
+
+
+@needs_ffmpeg
+def test_supports_option() -> None:
+
+    """Проверка опции ffmpeg: известная принимается, неизвестная — нет."""
+
+    assert supports_option(FFMPEG, '-stats_period', '5')
+    assert not supports_option(FFMPEG, '-no_such_option', '5')
@@ -0,0 +1,51 @@
+"""Тесты пула перекодирования."""
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import monotonic, sleep
+
+import pytest
+
+from transcoding import TranscodeJob, TranscodePool
+
+REAP_TIMEOUT = 60
+
+
+def broken_executor() -> ProcessPoolExecutor:
+
+    """
+    Функция создаёт пул процессов, процесс которого погиб (как после OOM killer).
+
+    Returns:
+        Вернёт сломанный пул.
+    """
+
+    executor = ProcessPoolExecutor(1, mp_context=get_context('spawn'))
+    with pytest.raises(BrokenExecutor):
+        executor.submit(os._exit, 1).result()  # noqa: WPS437
+    return executor
+
+
+def test_broken_pool_is_recreated(tmp_path: Path) -> None:
+
+    """
+    Сломанный пул не роняет submit (и вместе с ним ETL): пул создаётся заново, задача выполняется в нём.
+
+    Args:
+        tmp_path: временная директория
+    """
+
+    pool = TranscodePool(1, media_dir=str(tmp_path), streams_dir=str(tmp_path))
+    broken = broken_executor()
+    pool._executor = broken  # noqa: WPS437
+
+    pool.submit([TranscodeJob('video', 'missing.mp4', 'missing.aac')])
+    started = monotonic()
+    while pool.pending() and monotonic() - started < REAP_TIMEOUT:
+        sleep(0.1)
+    pool.shutdown()
+
+    assert pool._executor is None  # noqa: WPS437
+    assert pool.statuses == {'video': 'failed'}  # Исходников нет: задача выполнилась в новом пуле и упала.
+    assert pool.failed == 1
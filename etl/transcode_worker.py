@@ -0,0 +1,166 @@
+"""Модуль содержит воркер перекодирования, который разбирает очередь задач из Redis."""
+import os
+import sys
+from threading import Event, Thread
+from time import sleep
+from typing import Optional
+
+from backoff_function import backoff
+from job_queue import REDIS_ERRORS, Lease, RedisJobQueue, create_job_queue
+from log import create_logger
+from metrics_server import start_metrics_server
+from models import config
+from transcoding import transcode
+from video_converter import MediaConverter
+
+
+class TranscodeWorker:
+
+    """
+    Класс воркера перекодирования.
+    Берёт задачи из очереди в аренду, продлевает аренду, пока работает ffmpeg,
+    и подтверждает задачу (ack) только после того, как поток собран.
+
+    Воркеров можно запускать сколько угодно (в том числе в разных контейнерах):
+    одну задачу получит только один из них.
+    """
+
+    def __init__(
+        self,
+        job_queue: RedisJobQueue,
+        media_dir: str,
+        streams_dir: str,
+        poll_interval: float = 5,
+        converter: Optional[MediaConverter] = None
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            job_queue: очередь задач на перекодирование
+            media_dir: директория с исходными треками
+            streams_dir: директория, куда складываются потоки
+            poll_interval: как часто проверять очередь, если она пуста
+            converter: настроенный конвертер (длительность сегментов, HLS)
+        """
+
+        self.job_queue = job_queue
+        self.media_dir, self.streams_dir = media_dir, streams_dir
+        self.poll_interval = poll_interval
+        self.converter = converter if converter else MediaConverter()
+
+    def run(self) -> None:
+
+        """Метод запускает бесконечную обработку очереди."""
+
+        while True:
+            lease = self.next_job()
+            if lease is None:
+                sleep(self.poll_interval)
+                continue
+            self.process(lease)
+
+    @backoff(retry_on=REDIS_ERRORS, breaker='redis')
+    def next_job(self) -> Optional[Lease]:
+
+        """
+        Метод возвращает в очередь «брошенные» задачи и берёт в аренду следующую.
+
+        Returns:
+            Вернёт аренду задачи или None, если выполнять нечего.
+        """
+
+        self.job_queue.requeue_expired()
+        return self.job_queue.claim()
+
+    def process(self, lease: Lease) -> None:
+
+        """
+        Метод выполняет задачу, продлевая её аренду в отдельном потоке.
+        ack и fail повторяются при сбоях Redis (backoff в RedisJobQueue), а не роняют поток воркера.
+
+        Args:
+            lease: аренда задачи на перекодирование
+        """
+
+        job = lease.job
+        logger.info('Packaging of %s has been started.', job.id_video)
+        finished = Event()
+        heartbeat = Thread(target=self._extend_lease, args=(lease, finished), daemon=True)
+        heartbeat.start()
+
+        try:
+            manifest = transcode(job, self.media_dir, self.streams_dir, self.converter)
+        except Exception as error:
+            self.job_queue.fail(lease, f'{error}')
+            return
+        finally:
+            finished.set()
+            heartbeat.join()
+
+        self.job_queue.ack(lease)
+        logger.info('Packaging of %s has been finished: %s', job.id_video, manifest)
+
+    def _extend_lease(self, lease: Lease, finished: Event) -> None:
+
+        """
+        Метод продлевает аренду задачи, пока она не завершится.
+
+        Args:
+            lease: аренда задачи на перекодирование
+            finished: событие завершения задачи
+        """
+
+        id_video = lease.job.id_video
+        while not finished.wait(self.job_queue.lease_seconds / 3):
+            try:
+                extended = self.job_queue.extend(lease)
+            except Exception as error:
+                logger.error('Lease of %s has not been extended: %s', id_video, error)
+                continue
+            if not extended:
+                logger.warning('Lease of %s has expired: the job has been requeued.', id_video)
+
+
+def main() -> None:
+
+    """Функция запускает воркеры перекодирования (по одному потоку на одновременную задачу)."""
+
+    parameters = config.transcode_parameters
+    os.nice(parameters.transcode_niceness)
+
+    job_queue = create_job_queue(parameters, config.redis_parameters)
+    converter = MediaConverter(
+        parameters.segment_duration,
+        parameters.hls_playlist,
+        parameters.rendition_workers,
+        parameters.chunk_duration,
+        parameters.chunk_workers,
+        parameters.remux,
+    )
+    worker = TranscodeWorker(
+        job_queue,
+        parameters.media_dir,
+        parameters.streams_dir,
+        parameters.poll_interval,
+        converter,
+    )
+
+    # Метрики ffmpeg (прогресс, скорость, пиковая память) — на GET /metrics.
+    start_metrics_server(config.metrics_port)
+
+    concurrency = parameters.transcode_workers if parameters.transcode_workers else os.cpu_count() or 1
+    threads = [Thread(target=worker.run, name=f'transcode-{number}') for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    logger.info('Transcode workers have been started: %s', len(threads))
+
+    for started in threads:
+        started.join()
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""Модуль содержит пул процессов для перекодирования видео."""
+import os
+import sys
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from threading import RLock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from ffmpeg_commands import DASH_MANIFEST, HLS_MASTER
+from fingerprint import fingerprint_sources, read_fingerprint, same_content, write_fingerprint
+from log import create_logger
+from telemetry import RunCollector, RunStats, record_run
+from video_converter import MediaConverter
+
+
+class TranscodeJob(NamedTuple):
+
+    """Задача на перекодирование: какое видео и из каких треков собрать."""
+
+    id_video: str
+    video_file: str
+    audio_file: str
+
+
+class TranscodeResult(NamedTuple):
+
+    """Результат задачи из процесса пула: манифест (или ошибка) и итоги запусков ffmpeg для метрик родителя."""
+
+    manifest: Optional[str]
+    runs: List[RunStats]
+    error: Optional[str] = None
+
+
+def transcode_jobs(data: List[Tuple[str, ...]]) -> List[TranscodeJob]:
+
+    """
+    Функция выбирает из пачки строки, у которых изменился трек (нужна перешивка).
+
+    Args:
+        data: «сырые» данные из PG
+
+    Returns:
+        Вернёт список задач на перекодирование.
+    """
+
+    return [
+        TranscodeJob(f'{row[0]}', row[5], row[4])  # id, video_file, audio_file
+        for row in data
+        if row[7]  # track_changed
+    ]
+
+
+def transcode(
+    job: TranscodeJob,
+    media_dir: str,
+    streams_dir: str,
+    converter: Optional[MediaConverter] = None
+) -> str:
+
+    """
+    Функция перекодирует видео: упаковывает видео и аудио треки в MPEG-DASH.
+    Выполняется в процессе пула.
+
+    Рядом с манифестом хранится отпечаток исходных треков и параметров упаковки (см. fingerprint).
+    Если ни треки, ни параметры не изменились (повторная задача, перезапуск ETL после падения, новая попытка
+    из очереди) — упаковка пропускается и возвращается уже готовый манифест.
+
+    Args:
+        job: задача на перекодирование
+        media_dir: директория с исходными треками
+        streams_dir: директория, куда складываются потоки
+        converter: настроенный конвертер (длительность сегментов, HLS)
+
+    Returns:
+        Вернёт путь до манифеста.
+
+    Raises:
+        RuntimeError: поток не удалось упаковать
+    """
+
+    mc = converter if converter else MediaConverter()
+    mpeg_dash_manifest = f'{streams_dir}{job.id_video}/{DASH_MANIFEST}'
+    stream_dir = Path(mpeg_dash_manifest).parent
+    manifests = [stream_dir / DASH_MANIFEST]
+    if mc.hls_playlist:
+        manifests.append(stream_dir / HLS_MASTER)
+
+    stored = read_fingerprint(stream_dir)
+    sources = {'video': f'{media_dir}{job.video_file}', 'audio': f'{media_dir}{job.audio_file}'}
+    fingerprint = fingerprint_sources(sources, stored, mc.packaging)
+
+    packaged = all(manifest.exists() for manifest in manifests)
+    if packaged and same_content(stored, fingerprint):
+        if stored != fingerprint:
+            write_fingerprint(stream_dir, fingerprint)  # Поменялось только время изменения файлов.
+        logger.info('Packaging of %s has been skipped: sources are unchanged.', job.id_video)
+        return mpeg_dash_manifest
+
+    if mc.package_dash(sources['video'], sources['audio'], mpeg_dash_manifest) is None:
+        raise RuntimeError(f'Stream for {job.id_video} has not been packaged.')
+
+    write_fingerprint(stream_dir, fingerprint)
+    return mpeg_dash_manifest
+
+
+def pool_transcode(
+    job: TranscodeJob,
+    media_dir: str,
+    streams_dir: str,
+    converter: Optional[MediaConverter] = None
+) -> TranscodeResult:
+
+    """
+    Функция выполняет transcode в процессе пула и собирает итоги запусков ffmpeg.
+    Ошибка возвращается в результате, а не пробрасывается: итоги упавших запусков тоже нужны родителю.
+
+    Args:
+        job: задача на перекодирование
+        media_dir: директория с исходными треками
+        streams_dir: директория, куда складываются потоки
+        converter: настроенный конвертер (длительность сегментов, HLS)
+
+    Returns:
+        Вернёт манифест (или текст ошибки) и итоги запусков ffmpeg.
+    """
+
+    with RunCollector.collecting() as runs:
+        try:
+            manifest, error = transcode(job, media_dir, streams_dir, converter), None
+        except Exception as failure:
+            manifest, error = None, str(failure)
+        return TranscodeResult(manifest, runs, error)
+
+
+def lower_priority(niceness: int) -> None:
+
+    """
+    Функция понижает приоритет процесса пула (и запущенных им ffmpeg).
+    Так перекодирование не отнимает процессор у остальной работы ETL.
+
+    Args:
+        niceness: на сколько понизить приоритет
+    """
+
+    os.nice(niceness)
+
+
+class TranscodePool:  # noqa: WPS230
+
+    """
+    Класс пула перекодирования.
+
+    Перекодирование выполняется вне transform, в пуле процессов ограниченного размера
+    (по умолчанию — по числу ядер), поэтому пачка с изменёнными треками не запускает
+    десятки ffmpeg одновременно.
+    Завершённые задачи собираются (см. _reap), их результат логируется и считается.
+
+    Если задача для видео уже выполняется, новая ставится в очередь за ней:
+    два ffmpeg не пишут в одну и ту же директорию одновременно.
+
+    Если процесс пула погиб (например, его убил OOM killer), пул сломан (BrokenProcessPool):
+    задачи, которые в нём выполнялись, считаются неудачными, а для следующих пул создаётся заново.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        niceness: int = 10,
+        media_dir: str = 'media_source/',
+        streams_dir: str = '../streams/',
+        converter: Optional[MediaConverter] = None
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            workers: максимальное количество одновременных перекодирований (по умолчанию — число ядер)
+            niceness: на сколько понизить приоритет процессов перекодирования
+            media_dir: директория с исходными треками
+            streams_dir: директория, куда складываются потоки
+            converter: настроенный конвертер (длительность сегментов, HLS)
+        """
+
+        self.workers = workers if workers else os.cpu_count()
+        self.niceness = niceness
+        self.media_dir, self.streams_dir = media_dir, streams_dir
+        self.converter = converter if converter else MediaConverter()
+
+        self.completed, self.failed = 0, 0
+        self.statuses: Dict[str, str] = {}  # Результат последней задачи по каждому видео.
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = RLock()
+        self._in_flight: Dict[str, Future] = {}
+        self._deferred: Dict[str, TranscodeJob] = {}
+
+    def submit(self, jobs: List[TranscodeJob]) -> None:
+
+        """
+        Метод ставит задачи на перекодирование в пул.
+
+        Args:
+            jobs: задачи на перекодирование
+        """
+
+        with self._lock:
+            for job in jobs:
+                if job.id_video in self._in_flight:
+                    self._deferred[job.id_video] = job
+                    continue
+                self._start(job)
+
+    def pending(self) -> int:
+
+        """
+        Метод считает незавершённые задачи.
+
+        Returns:
+            Вернёт количество выполняющихся и отложенных задач.
+        """
+
+        with self._lock:
+            return len(self._in_flight) + len(self._deferred)
+
+    def shutdown(self) -> None:
+
+        """Метод дожидается завершения всех задач и останавливает пул."""
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _start(self, job: TranscodeJob) -> None:
+
+        """
+        Метод отдаёт задачу пулу процессов (вызывать под self._lock).
+
+        Args:
+            job: задача на перекодирование
+        """
+
+        arguments = (job, self.media_dir, self.streams_dir, self.converter)
+        try:
+            future = self._pool().submit(pool_transcode, *arguments)
+        except BrokenExecutor as error:  # BrokenProcessPool
+            logger.error('Transcode pool is broken, it will be recreated: %s', error)
+            self._pool().shutdown(wait=False)
+            self._executor = None
+            future = self._pool().submit(pool_transcode, *arguments)
+        self._in_flight[job.id_video] = future
+        self.statuses[job.id_video] = 'running'
+        future.add_done_callback(lambda done: self._reap(job, done))
+        logger.info('Packaging of %s has been queued.', job.id_video)
+
+    def _pool(self) -> ProcessPoolExecutor:
+
+        """
+        Метод возвращает пул процессов (при первом обращении — создаёт его).
+
+        Returns:
+            Вернёт пул процессов.
+        """
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=get_context('spawn'),
+                initializer=lower_priority,
+                initargs=(self.niceness,),
+            )
+        return self._executor
+
+    def _reap(self, job: TranscodeJob, future: Future) -> None:
+
+        """
+        Метод собирает результат завершённой задачи и записывает итоги её запусков ffmpeg в метрики.
+        Если пока задача выполнялась, пришла новая для того же видео — запускает её.
+
+        Args:
+            job: задача на перекодирование
+            future: результат задачи
+        """
+
+        error = future.exception()  # Процесс пула упал или задача не запустилась.
+        job_result = TranscodeResult(None, [], str(error)) if error else future.result()
+        for run in job_result.runs:
+            record_run(run)
+
+        with self._lock:
+            self._in_flight.pop(job.id_video, None)
+
+            if job_result.error is None:
+                self.completed += 1
+                self.statuses[job.id_video] = 'done'
+                logger.info('Packaging of %s has been finished: %s', job.id_video, job_result.manifest)
+            else:
+                self.failed += 1
+                self.statuses[job.id_video] = 'failed'
+                logger.error('Packaging of %s has failed: %s', job.id_video, job_result.error)
+
+            deferred = self._deferred.pop(job.id_video, None)
+            if deferred is not None and self._executor is not None:
+                self._start(deferred)
+
+
+logger = create_logger(__file__, stream_out=sys.stdout)
@@ -1,17 +1,260 @@
 """Модуль содержит интерфейс для работы с видео."""
-import subprocess
+import os
+import sys
 from multiprocessing import Process
 from pathlib import Path
-from typing import Optional
+from tempfile import TemporaryDirectory
+from typing import List, Optional, Tuple
 
 import ffmpeg_streaming
 from ffmpeg_streaming import Formats
 
+from ffmpeg_commands import (  # noqa: WPS235
+    DASH_MANIFEST,
+    HLS_MASTER,
+    Rendition,
+    audio_command,
+    dash_command,
+    find_binary,
+    key_frames,
+    mux_command,
+    rendition_command,
+)
+from ladder import (
+    HIGH_FRAME_RATE_FACTOR,
+    LADDER,
+    REMUX_HEADROOM,
+    Ladder,
+    build_ladder,
+    probe_keyframes,
+    probe_source,
+    segment_keyframes,
+)
+from log import create_logger
+from telemetry import FfmpegRun, run_command, run_commands
 
-class MediaConverter:
+Chunk = Tuple[float, Optional[float]]  # Кусок исходника: начало и конец в секундах (None — до конца).
+
+
+def split_chunks(keyframes: List[float], chunk_duration: float) -> List[Chunk]:
+
+    """
+    Функция делит видео на куски не короче chunk_duration, начинающиеся с ключевых кадров.
+
+    Args:
+        keyframes: время ключевых кадров в секундах (по возрастанию)
+        chunk_duration: минимальная длительность куска в секундах
+
+    Returns:
+        Вернёт куски (начало, конец); у последнего конец None — до конца файла.
+    """
+
+    starts: List[float] = [0]
+    for moment in keyframes:
+        if moment >= starts[-1] + chunk_duration:
+            starts.append(moment)
+
+    ends: List[Optional[float]] = [*starts[1:], None]
+    return list(zip(starts, ends))
+
+
+def write_concat_lists(workdir: str, sources: List[List[str]]) -> List[str]:
+
+    """
+    Функция пишет для каждого представления список его кусков для склейки (ffconcat).
+    Пути в списке абсолютные: ffmpeg ищет файлы из списка относительно директории самого списка.
+
+    Args:
+        workdir: директория, куда писать списки
+        sources: пути до кусков каждого представления (по порядку)
+
+    Returns:
+        Вернёт пути до списков по представлениям.
+    """
+
+    lists = []
+    for key, rendition_pieces in enumerate(sources):
+        lines = ['ffconcat version 1.0', *(concat_entry(piece) for piece in rendition_pieces)]
+        lists.append(f'{workdir}/rendition_{key}.ffconcat')
+        Path(lists[-1]).write_text('\n'.join(lines))
+    return lists
+
+
+def concat_entry(piece: str) -> str:
+
+    """
+    Функция возвращает строку списка ffconcat для файла (абсолютный путь, кавычки экранированы).
+
+    Args:
+        piece: путь до файла
+
+    Returns:
+        Вернёт строку file '...'.
+    """
+
+    escaped = str(Path(piece).resolve()).replace("'", r"'\''")
+    return f"file '{escaped}'"
+
+
+def chunk_paths(workdir: str, chunks: int, renditions: int) -> List[List[str]]:
+
+    """
+    Функция называет файлы кусков перекодируемых представлений.
+
+    Args:
+        workdir: директория для кусков
+        chunks: количество кусков
+        renditions: количество перекодируемых представлений
+
+    Returns:
+        Вернёт пути до кусков: по кускам, внутри — по представлениям.
+    """
+
+    return [
+        [f'{workdir}/chunk_{number:05d}_{key}.mp4' for key in range(renditions)]
+        for number in range(chunks)
+    ]
+
+
+def rendition_sources(video_track: str, ladder: Ladder, pieces: List[List[str]]) -> List[List[str]]:
+
+    """
+    Функция собирает для каждого представления лестницы его куски по порядку.
+    Копируемое представление не режется на куски: его источник — исходник целиком
+    (путь абсолютный: списки склейки лежат в другой директории).
+
+    Args:
+        video_track: путь до видео трека
+        ladder: лестница представлений
+        pieces: пути до кусков перекодируемых представлений: по кускам, внутри — по представлениям
+
+    Returns:
+        Вернёт пути до кусков по представлениям.
+    """
+
+    encoded = iter(zip(*pieces))
+    return [
+        [str(Path(video_track).resolve())] if representation.copy else list(next(encoded))
+        for representation in ladder.representations
+    ]
+
+
+def video_name(output: str) -> str:
+
+    """
+    Функция возвращает название видео для логов и метрик: это директория его потока.
+
+    Args:
+        output: путь до манифеста
+
+    Returns:
+        Вернёт название видео.
+    """
+
+    return Path(output).parent.name
+
+
+def window_duration(window: Chunk, duration: Optional[float]) -> Optional[float]:
+
+    """
+    Функция считает длительность куска исходника.
+
+    Args:
+        window: кусок (начало, конец) в секундах
+        duration: длительность исходника (для последнего куска, у которого нет конца)
+
+    Returns:
+        Вернёт длительность в секундах или None, если она неизвестна.
+    """
+
+    start, end = window
+    if end is not None:
+        return end - start
+    return None if duration is None else duration - start
+
+
+def balance_renditions(representations: List[Rendition], groups: int) -> List[List[int]]:
+
+    """
+    Функция делит представления на группы примерно равной сложности кодирования.
+    Сложность оценивается числом пикселей кадра (копирование исходника почти ничего не стоит);
+    самые тяжёлые раскладываются первыми, каждое — в наименее загруженную группу.
+
+    Args:
+        representations: представления (разрешение и битрейт)
+        groups: на сколько групп делить
+
+    Returns:
+        Вернёт номера представлений по группам (пустых групп нет).
+    """
+
+    def pixels(key: int) -> int:
+        representation = representations[key]
+        return 0 if representation.copy else representation.width * representation.height
+
+    loads = [0] * groups
+    members: List[List[int]] = [[] for _ in range(groups)]
+
+    for key in sorted(range(len(representations)), key=pixels, reverse=True):
+        lightest = loads.index(min(loads))
+        members[lightest].append(key)
+        loads[lightest] += pixels(key)
+
+    return [group for group in members if group]
+
+
+class MediaConverter:  # noqa: WPS214
 
     """Класс, реализующий работу с видео."""
 
+    def __init__(
+        self,
+        segment_duration: float = 4,
+        hls_playlist: bool = True,
+        rendition_workers: int = 1,
+        chunk_duration: float = 0,
+        chunk_workers: int = 0,
+        remux: bool = True
+    ) -> None:
+
+        """
+        Конструктор.
+
+        Args:
+            segment_duration: длительность сегмента в секундах (короче — быстрее старт воспроизведения)
+            hls_playlist: писать ли вместе с dash.mpd мастер-плейлист HLS на тех же сегментах
+            rendition_workers: сколько представлений кодировать одновременно (1 — всё одним ffmpeg)
+            chunk_duration: длительность кусков, на которые режется исходник (0 — не резать)
+            chunk_workers: сколько кусков кодировать одновременно (0 — по числу ядер)
+            remux: копировать исходник в верхнее представление, если он уже в нужном кодеке
+        """
+
+        self.segment_duration = segment_duration
+        self.hls_playlist = hls_playlist
+        self.rendition_workers = rendition_workers
+        self.chunk_duration, self.chunk_workers = chunk_duration, chunk_workers
+        self.remux = remux
+
+    @property
+    def packaging(self) -> dict:
+
+        """
+        Свойство возвращает параметры, от которых зависит упакованный поток (для отпечатка, см. fingerprint).
+        Число процессов и нарезка на куски сюда не входят: результат от них не зависит.
+
+        Returns:
+            Вернёт параметры упаковки (только json типы: отпечаток хранится в json).
+        """
+
+        return {
+            'segment_duration': self.segment_duration,
+            'hls_playlist': self.hls_playlist,
+            'remux': self.remux,
+            'ladder': [list(rung) for rung in LADDER],
+            'high_frame_rate_factor': HIGH_FRAME_RATE_FACTOR,
+            'remux_headroom': REMUX_HEADROOM,
+        }
+
     def make_container(self, video_track: str, audio_track: str, container: str) -> Optional[str]:
 
         """
@@ -27,9 +270,8 @@ class MediaConverter:
             Вернёт контейнер.
         """
 
-        ffmpeg = subprocess.run(['which', 'ffmpeg'], capture_output=True).stdout.decode('utf-8').strip()
         command = [
-            ffmpeg,
+            find_binary('ffmpeg'),
             '-i',
             video_track,
             '-i',
@@ -44,10 +286,234 @@ class MediaConverter:
             '1:a:0',
             container,
         ]
-        if subprocess.run(command).returncode == 0:
+        if run_command(FfmpegRun(command, video_name(container), 'container', probe_source(video_track).duration)):
             return container
         return None
 
+    def ladder(self, video_track: str, keyframes: Optional[List[float]] = None) -> Ladder:
+
+        """
+        Функция строит лестницу представлений по свойствам видео трека (см. build_ladder).
+        Если верхнее представление копируется из исходника, остальные получат ключевые кадры
+        на тех же отметках, что и исходник, — иначе сегменты представлений не совпадут.
+
+        Args:
+            video_track: путь до видео трека
+            keyframes: ключевые кадры исходника, если уже известны (нужны только при копировании)
+
+        Returns:
+            Вернёт лестницу представлений.
+        """
+
+        source = probe_source(video_track)
+        representations = build_ladder(source, self.remux)
+        logger.info('Source %s: %s; ladder: %s', video_track, source, representations)
+
+        if not representations[0].copy:
+            return Ladder(representations, None, source.duration)
+
+        if keyframes is None:
+            keyframes = self.keyframes(video_track)
+        return Ladder(representations, segment_keyframes(keyframes, self.segment_duration), source.duration)
+
+    def package_dash(
+        self,
+        video_track: str,
+        audio_track: str,
+        output: str,
+        hls_master: Optional[str] = None
+    ) -> Optional[str]:
+
+        """
+        Функция упаковывает видео и аудио треки в MPEG-DASH одним запуском ffmpeg.
+        В отличие от make_container + to_mpeg_dash, не пишет на диск промежуточный mp4:
+        исходники читаются один раз, временного места не нужно.
+
+        Если включён hls_playlist (или передан hls_master), рядом пишется и мастер-плейлист HLS.
+        Если задан chunk_duration, длинный исходник кодируется кусками параллельно (см. package_chunks),
+        иначе, если rendition_workers больше 1, параллельно кодируются представления (см. package_renditions).
+
+        Args:
+            video_track: путь до видео трека
+            audio_track: путь до аудио трека
+            output: путь до манифеста
+            hls_master: название мастер-плейлиста HLS (по умолчанию — HLS_MASTER)
+
+        Returns:
+            Вернёт путь до манифеста или None, если упаковать не удалось.
+        """
+
+        if hls_master is None and self.hls_playlist:
+            hls_master = HLS_MASTER
+
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        keyframes = self.keyframes(video_track) if self.chunk_duration > 0 else None
+        ladder = self.ladder(video_track, keyframes)
+
+        if keyframes is not None:
+            chunks = split_chunks(keyframes, self.chunk_duration)
+            if len(chunks) > 1:
+                return self.package_chunks(video_track, audio_track, output, ladder, chunks, hls_master)
+
+        if self.rendition_workers > 1 and len(ladder.representations) > 1:
+            return self.package_renditions(video_track, audio_track, output, ladder, hls_master)
+
+        command = dash_command(
+            video_track,
+            audio_track,
+            output,
+            ladder.representations,
+            self.segment_duration,
+            hls_master,
+            ladder.aligned,
+        )
+        if run_command(FfmpegRun(command, video_name(output), 'dash', ladder.duration)):
+            return output
+        return None
+
+    def package_renditions(  # noqa: WPS211
+        self,
+        video_track: str,
+        audio_track: str,
+        output: str,
+        ladder: Ladder,
+        hls_master: Optional[str] = None
+    ) -> Optional[str]:
+
+        """
+        Функция кодирует представления параллельно и собирает их в один манифест.
+
+        Представления делятся на rendition_workers групп примерно равной сложности (по числу пикселей),
+        каждую группу (и аудио) кодирует отдельный ffmpeg, затем результат без перекодирования
+        упаковывается в dash.mpd (и HLS).
+
+        Один ffmpeg на всю лестницу упирается в одно узкое место и оставляет ядра простаивать,
+        здесь же ядра делятся между представлениями поровну.
+
+        Args:
+            video_track: путь до видео трека
+            audio_track: путь до аудио трека
+            output: путь до манифеста
+            ladder: лестница представлений
+            hls_master: название мастер-плейлиста HLS
+
+        Returns:
+            Вернёт путь до манифеста или None, если упаковать не удалось.
+        """
+
+        representations, video = ladder.representations, video_name(output)
+        groups = balance_renditions(representations, self.rendition_workers)
+        threads = max(1, (os.cpu_count() or 1) // len(groups))
+
+        with TemporaryDirectory(prefix='.renditions_', dir=Path(output).parent) as workdir:
+            renditions = [f'{workdir}/rendition_{key}.mp4' for key in range(len(representations))]
+            audio = f'{workdir}/audio.mp4'
+
+            runs = [
+                FfmpegRun(
+                    rendition_command(
+                        video_track,
+                        [(renditions[key], representations[key]) for key in group],
+                        key_frames(self.segment_duration, aligned=ladder.aligned),
+                        threads,
+                    ),
+                    video,
+                    'rendition',
+                    ladder.duration,
+                )
+                for group in groups
+            ]
+            runs.append(FfmpegRun(audio_command(audio_track, audio), video, 'audio', ladder.duration))
+
+            if not run_commands(runs, len(runs)):
+                return None
+            command = mux_command(renditions, audio, output, self.segment_duration, hls_master)
+            if not run_command(FfmpegRun(command, video, 'mux', ladder.duration)):
+                return None
+
+        return output
+
+    def package_chunks(  # noqa: WPS211
+        self,
+        video_track: str,
+        audio_track: str,
+        output: str,
+        ladder: Ladder,
+        chunks: List[Chunk],
+        hls_master: Optional[str] = None
+    ) -> Optional[str]:
+
+        """
+        Функция кодирует исходник кусками параллельно и склеивает их в один непрерывный поток.
+
+        Куски режутся по ключевым кадрам исходника (см. split_chunks), поэтому каждый
+        декодируется независимо и без потерь на стыках. Каждый кусок кодируется во всю лестницу
+        представлений отдельным ffmpeg, до chunk_workers одновременно (представление, копируемое
+        из исходника, не кодируется и не режется). Ключевые кадры ставятся
+        на границы сегментов по времени всего видео (см. key_frames), затем куски каждого
+        представления склеиваются (concat, без перекодирования) и упаковываются в dash.mpd (и HLS)
+        с непрерывными отметками времени.
+
+        Args:
+            video_track: путь до видео трека
+            audio_track: путь до аудио трека
+            output: путь до манифеста
+            ladder: лестница представлений
+            chunks: куски исходника (начало, конец) в секундах
+            hls_master: название мастер-плейлиста HLS
+
+        Returns:
+            Вернёт путь до манифеста или None, если упаковать не удалось.
+        """
+
+        workers = self.chunk_workers if self.chunk_workers else os.cpu_count() or 1
+        threads = max(1, (os.cpu_count() or 1) // min(workers, len(chunks)))
+
+        with TemporaryDirectory(prefix='.chunks_', dir=Path(output).parent) as workdir:
+            pieces = chunk_paths(workdir, len(chunks), len(ladder.encoded))
+            audio = f'{workdir}/audio.mp4'
+
+            runs = [FfmpegRun(audio_command(audio_track, audio), video_name(output), 'audio', ladder.duration)]
+            runs += [
+                FfmpegRun(
+                    rendition_command(
+                        video_track,
+                        list(zip(chunk_pieces, ladder.encoded)),
+                        key_frames(self.segment_duration, window[0], ladder.aligned),
+                        threads,
+                        window,
+                    ),
+                    video_name(output),
+                    'chunk',
+                    window_duration(window, ladder.duration),
+                )
+                for chunk_pieces, window in zip(pieces, chunks)
+            ]
+
+            if not run_commands(runs, workers):
+                return None
+
+            renditions = write_concat_lists(workdir, rendition_sources(video_track, ladder, pieces))
+            command = mux_command(renditions, audio, output, self.segment_duration, hls_master, concat=True)
+            if not run_command(FfmpegRun(command, video_name(output), 'mux', ladder.duration)):
+                return None
+
+        return output
+
+    def keyframes(self, video_track: str) -> List[float]:
+
+        """
+        Функция находит ключевые кадры видео трека.
+
+        Args:
+            video_track: путь до видео трека
+
+        Returns:
+            Вернёт время ключевых кадров в секундах от начала трека (по возрастанию).
+        """
+
+        return probe_keyframes(video_track)
+
     def to_mpeg_dash(self, container: Path, output: str) -> None:
 
         """
@@ -63,25 +529,34 @@ class MediaConverter:
 
         video = ffmpeg_streaming.input(str(container))
         dash = video.dash(Formats.h264())
-        dash.auto_generate_representations()
-        dash.output(output)
+        dash.auto_generate_representations(ffprobe_bin=find_binary('ffprobe'))
+        dash.output(output, ffmpeg_bin=find_binary('ffmpeg'))
 
         container.unlink()
 
-    def to_hls(self, container: str, output: str) -> None:
+    def to_hls(self, video_track: str, audio_track: str, output: str) -> Optional[str]:
 
         """
         Функция, преобразующая в протокол hls.
-        На данном этапе нам можно без неё обойтись.
+        Сегменты — CMAF (фрагментированный mp4), общие с MPEG-DASH:
+        рядом с мастер-плейлистом пишется dash.mpd, ссылающийся на те же файлы.
 
         Подробнее см.
         https://ru.wikipedia.org/wiki/HLS
 
         Args:
-            container: путь до контейнера
-            output: путь до манифеста
+            video_track: путь до видео трека
+            audio_track: путь до аудио трека
+            output: путь до мастер-плейлиста
+
+        Returns:
+            Вернёт путь до мастер-плейлиста или None, если упаковать не удалось.
         """
-        pass
+
+        master = Path(output)
+        if self.package_dash(video_track, audio_track, str(master.with_name(DASH_MANIFEST)), master.name) is None:
+            return None
+        return output
 
 
 def main() -> None:
@@ -90,14 +565,14 @@ def main() -> None:
 
     video = 'media/video/1.mp4'  # noqa: WPS114
     audio = 'media/audio/1.aac'
-    mp_4 = 'media/av3.mp4'  # noqa: WPS114
     mpeg_dash_manifest = 'streams/dir_1/dash.mpd'
 
     mc = MediaConverter()
-    container = mc.make_container(video, audio, mp_4)
-    packaging = Process(target=mc.to_mpeg_dash, args=(container, mpeg_dash_manifest))
+    packaging = Process(target=mc.package_dash, args=(video, audio, mpeg_dash_manifest))
     packaging.start()
 
 
+logger = create_logger(__file__, stream_out=sys.stdout)
+
 if __name__ == '__main__':
     main()
@@ -1,4 +1,6 @@
 """Модуль содержит конфиги для flask."""
+from typing import Tuple
+
 from pydantic import BaseSettings
 
 
@@ -28,7 +30,10 @@ class ElasticSettings(EnvMixin):
     """
 
     elastic_address: str
+    # Общий псевдоним индексов: у каждого языка свой индекс {elastic_index}_{язык} (их заполняет ETL).
     elastic_index: str
+    elastic_languages: Tuple[str, ...] = ('ru', 'en')
+    default_language: str = 'ru'
 
 
 class FlaskSettings(EnvMixin):
@@ -1,47 +1,88 @@
 """Модуль с интерфейсом, для работы с ES."""
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, NotFoundError
 
 
 class ElasticSearchMethods:
 
     """Класс, с интерфейсом для работы с API ES."""
 
-    def __init__(self, address: str, index_name: str) -> None:
+    def __init__(
+        self,
+        address: str,
+        index_name: str,
+        languages: Tuple[str, ...] = ('ru', 'en'),
+        default_language: str = 'ru'
+    ) -> None:
 
         """
         Конструктор.
 
         Args:
             address: адрес до ES.
-            index_name: название индекса ES.
+            index_name: общий псевдоним индексов ES (у каждого языка свой индекс {index_name}_{язык}).
+            languages: языки, для которых есть индексы.
+            default_language: язык по умолчанию.
         """
 
         self.address, self.index_name = address, index_name
+        self.languages, self.default_language = languages, default_language
         self.es = Elasticsearch(self.address)
 
-    def get_all(self) -> Dict[str, Any]:
+    def language_index(self, lang: str) -> str:
 
         """
-        Метод достаёт из ES все данные.
+        Метод возвращает индекс языка: запрос идёт только в него, т.е. в меньшие шарды и с одним анализатором.
+
+        Args:
+            lang: код языка ISO 639-1
+
+        Returns:
+            Вернёт название индекса.
+        """
+
+        if lang not in self.languages:
+            lang = self.default_language
+        return f'{self.index_name}_{lang}'
+
+    def get_all(self, lang: str) -> Dict[str, Any]:
+
+        """
+        Метод достаёт из ES все данные на языке lang.
+
+        Args:
+            lang: код языка ISO 639-1
 
         Returns:
             Вернёт словарь, содержащий все документы.
         """
 
-        return self.es.search(index=self.index_name, query={'match_all': {}})
+        return self.es.search(index=self.language_index(lang), query={'match_all': {}})
 
-    def get_by_id(self, id: str) -> Dict[str, Any]:  # noqa: WPS125
+    def get_by_id(self, id: str, lang: str) -> Dict[str, Any]:  # noqa: WPS125
 
         """
         Метод достаёт из ES документ по его id.
+        Сначала документ ищется в индексе языка lang, а если его там нет (видео на другом языке) —
+        во всех индексах через общий псевдоним.
 
         Args:
             id: id желаемого документа
+            lang: код языка ISO 639-1
 
         Returns:
             Вернёт словарь-документ.
+
+        Raises:
+            NotFoundError: документа нет ни в одном индексе
         """
 
-        return self.es.get(index=self.index_name, id=id)['_source']
+        try:
+            return self.es.get(index=self.language_index(lang), id=id)['_source']
+        except NotFoundError:
+            found = self.es.search(index=self.index_name, query={'ids': {'values': [id]}})
+            hits = found['hits']['hits']
+            if not hits:
+                raise
+            return hits[0]['_source']
@@ -1,5 +1,5 @@
 """Модуль содержит ручки для flask."""
-from flask import Flask, render_template
+from flask import Flask, render_template, request
 
 from for_elastic_search import ElasticSearchMethods
 from flask_models import flask_config
@@ -8,6 +8,20 @@ from waitress import serve
 app = Flask(__name__)
 
 
+def requested_language() -> str:
+
+    """
+    Функция определяет язык запроса: параметр ?lang=, иначе заголовок Accept-Language, иначе язык по умолчанию.
+
+    Returns:
+        Вернёт код языка ISO 639-1.
+    """
+
+    languages = flask_config.es_settings.elastic_languages
+    lang = request.args.get('lang') or request.accept_languages.best_match(languages)
+    return lang if lang in languages else flask_config.es_settings.default_language
+
+
 @app.route('/')
 def index() -> str:
 
@@ -15,12 +29,13 @@ def index() -> str:
     Функция по ручке «root».
 
     Returns:
-        Вернёт html содержащий все данные из ES.
+        Вернёт html содержащий все данные из ES на языке запроса.
     """
 
-    data_from_es = es_methods.get_all()['hits']['hits']
+    lang = requested_language()
+    data_from_es = es_methods.get_all(lang)['hits']['hits']
 
-    return render_template('all_videos.html', data_from_es=data_from_es, title='Главная')
+    return render_template('all_videos.html', data_from_es=data_from_es, title='Главная', lang=lang)
 
 
 @app.route('/<id>')
@@ -36,7 +51,7 @@ def get_by_id(id: str) -> str:  # noqa: WPS125
         Вернёт html содержащий видео, пригодное для просмотра.
     """
 
-    data = es_methods.get_by_id(id)
+    data = es_methods.get_by_id(id, requested_language())
     h1, title, description = data['h1'], data['title'], data['description']
 
     return render_template('video_display.html', id=id, title=title, h1=h1, description=description)
@@ -53,7 +68,9 @@ def main() -> None:
 if __name__ == '__main__':
     address_es = flask_config.es_settings.elastic_address
     index_es = flask_config.es_settings.elastic_index
+    languages_es = flask_config.es_settings.elastic_languages
+    default_language = flask_config.es_settings.default_language
 
-    es_methods = ElasticSearchMethods(address_es, index_es)
+    es_methods = ElasticSearchMethods(address_es, index_es, languages_es, default_language)
 
     main()